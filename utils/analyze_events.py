@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+
+"""
+This script reads the event logs written by the annotator when the -e/--events
+flag is used, and summarises the time spent on annotation and the commands
+entered for each annotation task. Optionally, the logs are replayed and the
+graphs rebuilt from the logs are compared to the annotation stored on disk.
+
+Usage:
+    python analyze_events.py -e output.pkl.events
+
+Arguments:
+    -e/--events: Path to the directory containing the event logs.
+    -i/--idle: Optional argument for the number of seconds after which the
+               time between two events is not counted as time spent on
+               annotation (default 300).
+    -o/--output: Optional argument for a path to a CSV file, into which the
+                 statistics for each diagram are written.
+    -v/--verify: Optional argument for a path to the pandas DataFrame or the
+                 sharded directory containing the annotation, against which
+                 the graphs rebuilt from the logs are compared.
+
+Returns:
+    Prints the statistics on the standard output.
+"""
+
+# Import packages
+from core.events import *
+from core.storage import *
+from pathlib import Path
+from types import SimpleNamespace
+import argparse
+import networkx as nx
+import os
+import pandas as pd
+
+# Set up the argument parser
+ap = argparse.ArgumentParser()
+
+# Define arguments
+ap.add_argument("-e", "--events", required=True,
+                help="Path to the directory containing the event logs.")
+ap.add_argument("-i", "--idle", required=False, type=float, default=300,
+                help="The number of seconds after which the time between two "
+                     "events is not counted as annotation time.")
+ap.add_argument("-o", "--output", required=False,
+                help="Path to a CSV file for the statistics of each diagram.")
+ap.add_argument("-v", "--verify", required=False,
+                help="Path to the annotation against which the graphs rebuilt "
+                     "from the logs are compared.")
+
+# Parse arguments
+args = vars(ap.parse_args())
+
+# Assign arguments to variables
+events_dir = args['events']
+idle = args['idle']
+
+# Verify the input path, print error and exit if not found
+if not Path(events_dir).is_dir():
+
+    exit("[ERROR] Cannot find {}. Check the input to -e!".format(events_dir))
+
+# Read the event logs, which are named after the diagram images
+logs = {f[:-len('.jsonl')]: EventLog(os.path.join(events_dir, f)).read()
+        for f in sorted(os.listdir(events_dir)) if f.endswith('.jsonl')}
+
+# Read the stored annotation for the logged diagrams if requested
+stored = None
+
+if args['verify'] is not None:
+
+    annotation_df = read_corpus(args['verify'], list(logs.keys()))
+    stored = dict(zip(annotation_df['image_name'], annotation_df['diagram']))
+
+# Set up lists for the statistics of each diagram and each command
+diagram_stats, command_stats = [], []
+
+for image_name, events in logs.items():
+
+    # Set up counters for the sessions and the time spent on each task
+    sessions, active = 0, {mode: 0.0 for mode in mode_graphs}
+
+    # Keep track of the time of the previous event in the session
+    previous = None
+
+    for event in events:
+
+        # Each session begins by opening the diagram
+        if event['type'] == 'open':
+
+            sessions += 1
+            previous = event['time']
+
+            continue
+
+        # Count the time since the previous event towards the task, unless the
+        # annotator was idle
+        elapsed = event['time'] - previous if previous is not None else 0.0
+
+        if event['type'] == 'command':
+
+            if elapsed <= idle:
+
+                active[event['graph']] += elapsed
+
+            command_stats.append({'image_name': image_name,
+                                  'task': event['graph'],
+                                  'command': event['command'],
+                                  'edits': len(event.get('ops', [])),
+                                  'seconds': elapsed if elapsed <= idle
+                                  else None})
+
+        previous = event['time']
+
+    # Find the latest save and get the status of the diagram when saved
+    saves = [i for i, e in enumerate(events) if e['type'] == 'save']
+    status = events[saves[-1]]['status'] if saves else {}
+
+    # Count the commands in total and since the latest save
+    command_ixs = [i for i, e in enumerate(events) if e['type'] == 'command']
+
+    stats = {'image_name': image_name,
+             'sessions': sessions,
+             'commands': len(command_ixs),
+             'unsaved': len([i for i in command_ixs if not saves or
+                             i > saves[-1]]),
+             'complete': status.get('complete', False),
+             'minutes': sum(active.values()) / 60}
+
+    for mode, seconds in active.items():
+
+        stats['{}_minutes'.format(mode)] = seconds / 60
+
+    # Compare the graphs rebuilt from the log to the stored annotation
+    if stored is not None:
+
+        stats['verified'] = None
+
+        # Diagrams with unsaved work are expected to differ
+        if image_name in stored and stored[image_name] is not None \
+                and saves and stats['unsaved'] == 0:
+
+            rebuilt = SimpleNamespace(**{a: None for a in
+                                         mode_graphs.values()})
+            replay_events(events, rebuilt)
+
+            # Compare each graph that has been logged
+            stats['verified'] = all(
+                nx.utils.graphs_equal(getattr(rebuilt, a),
+                                      getattr(stored[image_name], a))
+                for a in mode_graphs.values()
+                if getattr(rebuilt, a) is not None)
+
+    diagram_stats.append(stats)
+
+# Print error and exit if no events were found
+if not command_stats:
+
+    exit("[ERROR] No commands found in {}.".format(events_dir))
+
+diagram_df = pd.DataFrame(diagram_stats)
+command_df = pd.DataFrame(command_stats)
+
+# Print status message
+hours = diagram_df['minutes'].sum() / 60
+
+print("[INFO] {} diagrams, {} sessions and {} commands in {:.2f} hours of "
+      "annotation ({} diagrams complete, {:.1f} per hour).".format(
+          len(diagram_df), diagram_df['sessions'].sum(), len(command_df),
+          hours, diagram_df['complete'].sum(),
+          diagram_df['complete'].sum() / hours if hours > 0 else 0))
+
+# Summarise the commands and the time spent on each task
+tasks = command_df.groupby('task').agg(commands=('command', 'size'),
+                                       edits=('edits', 'sum'),
+                                       minutes=('seconds', 'sum'))
+tasks['minutes'] = tasks['minutes'] / 60
+tasks['seconds_per_command'] = tasks['minutes'] * 60 / tasks['commands']
+
+print("[INFO] Time spent on each task:")
+print(tasks.round(2).to_string())
+
+# Summarise the use of each command
+commands = command_df.groupby(['task', 'command']).agg(
+    count=('command', 'size'), edits=('edits', 'sum'),
+    median_seconds=('seconds', 'median'))
+
+print("[INFO] Commands entered:")
+print(commands.round(2).to_string())
+
+# Report unsaved work and the results of the verification
+unsaved = diagram_df.loc[diagram_df['unsaved'] > 0, 'image_name']
+
+if len(unsaved) > 0:
+
+    print("[INFO] Diagrams with unsaved work, which is recovered when the "
+          "annotator is run using -e: {}".format(', '.join(unsaved)))
+
+if stored is not None:
+
+    verified = diagram_df['verified']
+
+    print("[INFO] Graphs rebuilt from the logs match the annotation for {} "
+          "diagrams and differ for {} diagrams ({} not compared).".format(
+              (verified == True).sum(), (verified == False).sum(),
+              verified.isna().sum()))
+
+    for image_name in diagram_df.loc[verified == False, 'image_name']:
+
+        print("[WARNING] The graphs rebuilt for {} differ from the "
+              "annotation.".format(image_name))
+
+# Write the statistics for each diagram into a CSV file if requested
+if args['output'] is not None:
+
+    diagram_df.to_csv(args['output'], index=False)
+
+    # Print status message
+    print("[INFO] Saved the statistics for each diagram into {}.".format(
+        args['output']))
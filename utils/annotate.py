@@ -8,13 +8,27 @@ Usage:
     
 Arguments:
     -a/--annotation: Path to a pandas DataFrame with the original annotation
-                     extracted from the AI2D dataset.
+                     extracted from the AI2D dataset, e.g. using import_ai2d.py.
     -i/--images: Path to the directory with the AI2D diagram images.
     -o/--output: Path to the output file, in which the resulting annotation is
                  stored.
     -r/--review: Optional argument that activates review mode. This mode opens
                  each Diagram object marked as complete for editing.
     -dr/--disable_rst: Optional argument for disabling RST annotation.
+    -j/--journal: Optional argument for storing the annotation as a snapshot
+                  and an append-only journal, which only writes the diagrams
+                  that have changed.
+    -s/--sharded: Optional argument for storing the annotation in a directory
+                  with one file per diagram and an index. An existing directory
+                  given to -o is always treated as sharded.
+    -t/--timing: Optional argument for printing the time spent on drawing each
+                 graph.
+    -p/--prefetch: Optional argument for the number of upcoming diagrams that
+                   are prepared in the background (default 2, 0 disables).
+    -e/--events: Optional argument for logging each command entered into an
+                 event log for each diagram, stored in a directory next to the
+                 output file. Work that was not saved, e.g. if the annotator
+                 was interrupted, is recovered from the log.
 
 Returns:
     A pandas DataFrame containing a Diagram object for each diagram.
@@ -22,7 +36,11 @@ Returns:
 
 # Import packages
 from core.interface import *
+from core.draw import layout_engine
+from core.prefetch import *
 from core import Diagram
+from core.events import EventLog, events_path, log_save
+from core.storage import *
 from pathlib import Path
 import argparse
 import os
@@ -43,6 +61,20 @@ ap.add_argument("-r", "--review", required=False, action='store_true',
                      " complete for inspection.")
 ap.add_argument("-dr", "--disable_rst", required=False, action='store_true',
                 help="Disables RST annotation.")
+ap.add_argument("-j", "--journal", required=False, action='store_true',
+                help="Appends changed diagrams to a journal instead of "
+                     "rewriting the entire output file at each step.")
+ap.add_argument("-s", "--sharded", required=False, action='store_true',
+                help="Stores the annotation in a directory with one file per "
+                     "diagram.")
+ap.add_argument("-t", "--timing", required=False, action='store_true',
+                help="Prints the time spent on drawing each graph.")
+ap.add_argument("-p", "--prefetch", required=False, type=int, default=2,
+                help="The number of upcoming diagrams prepared in the "
+                     "background.")
+ap.add_argument("-e", "--events", required=False, action='store_true',
+                help="Logs each command into an event log, from which unsaved "
+                     "work is recovered.")
 
 # Parse arguments
 args = vars(ap.parse_args())
@@ -82,28 +114,58 @@ if not args['disable_rst']:
 
     disable_rst = False
 
+# Report the time spent on drawing graphs if requested using the -t/--timing
+# flag
+if args['timing']:
+
+    layout_engine.report = True
+
+# Set up storage for the output, using a journal or shards if requested
+store = open_store(output_path, journal=args['journal'],
+                   sharded=args['sharded'])
+
 # Check if the output file exists already, or whether to continue with previous
 # annotation.
-if os.path.isfile(output_path):
+if store.exists():
 
     # Read existing file
-    annotation_df = pd.read_pickle(output_path)
+    annotation_df = store.load()
 
     # Print status message
     print("[INFO] Continuing existing annotation in {}.".format(output_path))
 
 # Otherwise, read the annotation from the input DataFrame
-if not os.path.isfile(output_path):
+else:
 
     # Make a copy of the input DataFrame
-    annotation_df = pd.read_pickle(ann_path).copy()
+    annotation_df = read_corpus(ann_path).copy()
+
+    # Set up an empty column to hold the diagram, unless the Diagram objects
+    # were already created using import_ai2d.py
+    if 'diagram' not in annotation_df.columns:
+
+        annotation_df['diagram'] = None
+
+    # Write the initial DataFrame to disk
+    store.initialize(annotation_df)
+
+# Collect the rows of the input DataFrame
+rows = list(annotation_df.iterrows())
 
-    # Set up an empty column to hold the diagram
-    annotation_df['diagram'] = None
+# Set up a prefetcher for preparing the upcoming diagrams in the background
+prefetcher = Prefetcher(prepare_diagram)
 
 # Begin looping over the rows of the input DataFrame. Enumerate the result to
 # show annotation progress to the user.
-for i, (ix, row) in enumerate(annotation_df.iterrows(), start=1):
+for i, (ix, row) in enumerate(rows, start=1):
+
+    # Start preparing the upcoming diagrams
+    for next_ix, next_row in rows[i:i + args['prefetch']]:
+
+        prefetcher.prefetch(next_ix, next_row['annotation'],
+                            next_row['diagram'],
+                            os.path.join(images_path, next_row['image_name']),
+                            review)
 
     # Begin the annotation by clearing the screen
     os.system('cls' if os.name == 'nt' else 'clear')
@@ -122,27 +184,46 @@ for i, (ix, row) in enumerate(annotation_df.iterrows(), start=1):
     # Fetch the annotation dictionary from the DataFrame
     annotation = row['annotation']
 
-    # Assign diagram to variable
-    diagram = row['diagram']
+    # Fetch the Diagram object, which is initialized if needed. If the diagram
+    # has been prefetched, the images shown first have already been drawn.
+    diagram = prefetcher.get(ix, annotation, row['diagram'], image_path,
+                             review)
 
-    # Check if a Diagram object has been initialized
-    if diagram is not None:
+    # Set up a counter for the commands recovered from the event log
+    recovered = 0
 
-        # If the annotator runs in a review open the diagram for revision and
-        # editing.
-        if review:
+    # Set up the event log for the diagram if requested
+    if args['events']:
 
-            # Set the methods tracking completeness to False
-            diagram.group_complete = False
-            diagram.connectivity_complete = False
-            diagram.rst_complete = False
-            diagram.complete = False
+        diagram.event_log = EventLog(events_path(output_path, image_fname))
+
+        # Recover any work logged after the diagram was last saved
+        recovered = diagram.event_log.recover(diagram)
+
+        if recovered > 0:
+
+            # Print status message
+            print("[INFO] Recovered {} commands from {}.".format(
+                recovered, diagram.event_log.path))
 
-    # If a Diagram object has not been initialized, create new
-    elif diagram is None:
+    # If the annotator runs in a review open the diagram for revision and
+    # editing.
+    if review:
 
-        # Initialise a Diagram class and assign to variable
-        diagram = Diagram(annotation, image_path)
+        # Set the methods tracking completeness to False
+        diagram.group_complete = False
+        diagram.connectivity_complete = False
+        diagram.rst_complete = False
+        diagram.complete = False
+
+    # Diagrams marked as complete are skipped without opening them, so that
+    # they are only saved if work was recovered for them from the event log
+    opened = not diagram.complete
+
+    # Log the opening of the diagram
+    if opened and diagram.event_log is not None:
+
+        diagram.event_log.open(review)
 
     # Set grouping as initial annotation task
     task = 'group'
@@ -161,8 +242,16 @@ for i, (ix, row) in enumerate(annotation_df.iterrows(), start=1):
             # Store the diagram into the column 'diagram'
             annotation_df.at[ix, 'diagram'] = diagram
 
-            # Write the DataFrame to disk at each step
-            annotation_df.to_pickle(output_path)
+            # Write the diagram to disk at each step
+            store.save(annotation_df, ix)
+
+            # Log the saving of the diagram, also if the event log is not in
+            # use, so that older events are not recovered over the diagram
+            log_save(diagram, output_path, image_fname)
+
+            # Wait for any pending writes and prefetches to finish
+            store.close()
+            prefetcher.close()
 
             # Print status message
             exit("[INFO] Saving current graph and quitting.")
@@ -173,6 +262,9 @@ for i, (ix, row) in enumerate(annotation_df.iterrows(), start=1):
             # Annotate layout, use variable 'task' to track switches
             task = diagram.annotate_layout(review)
 
+            # Log the last command entered
+            diagram.log_changes()
+
             # If grouping is marked as complete, annotate connectivity
             if diagram.group_complete:
 
@@ -185,6 +277,9 @@ for i, (ix, row) in enumerate(annotation_df.iterrows(), start=1):
             # Annotate connectivity, use variable 'task' to track switches
             task = diagram.annotate_connectivity(review)
 
+            # Log the last command entered
+            diagram.log_changes()
+
             # If connectivity is marked as complete, annotate RST
             if diagram.connectivity_complete:
 
@@ -197,6 +292,9 @@ for i, (ix, row) in enumerate(annotation_df.iterrows(), start=1):
             # Annotate RST, use variable 'task' to track switches
             task = diagram.annotate_rst(review)
 
+            # Log the last command entered
+            diagram.log_changes()
+
             # If RST is marked as complete, break from the loop
             if diagram.rst_complete:
 
@@ -285,8 +383,22 @@ for i, (ix, row) in enumerate(annotation_df.iterrows(), start=1):
         # Otherwise continue
         continue
 
+    # Skip saving diagrams that were not opened or changed, so that only the
+    # diagrams changed are appended to the journal or written into shards
+    if not opened and recovered == 0:
+
+        continue
+
     # Store the diagram into the column 'diagram'
     annotation_df.at[ix, 'diagram'] = diagram
 
-    # Write the DataFrame to disk at each step
-    annotation_df.to_pickle(output_path)
+    # Write the diagram to disk at each step
+    store.save(annotation_df, ix)
+
+    # Log the saving of the diagram, also if the event log is not in use, so
+    # that older events are not recovered over the diagram
+    log_save(diagram, output_path, image_fname)
+
+# Wait for any pending writes and prefetches to finish
+store.close()
+prefetcher.close()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+
+"""
+This script compares the size and loading time of the graphs in AI2D-RST
+annotation when stored as pickled NetworkX graphs and in the compact
+representation defined in core/compact.py.
+
+Usage:
+    python benchmark_compact.py -a annotation.pkl
+
+Arguments:
+    -a/--annotation: Path to the pandas DataFrame or the sharded directory
+                     containing the annotation.
+    -r/--repeat: Optional argument for the number of times each graph is loaded
+                 (default 5).
+
+Returns:
+    Prints the total size and loading time for each annotation layer and
+    verifies that the compact representation is lossless.
+"""
+
+# Import packages
+from core.compact import *
+from core.storage import *
+from pathlib import Path
+import argparse
+import networkx as nx
+import pickle
+import time
+
+# Set up the argument parser
+ap = argparse.ArgumentParser()
+
+# Define arguments
+ap.add_argument("-a", "--annotation", required=True,
+                help="Path to the pandas DataFrame or sharded directory with "
+                     "AI2D-RST annotation.")
+ap.add_argument("-r", "--repeat", required=False, type=int, default=5,
+                help="The number of times each graph is loaded.")
+
+# Parse arguments
+args = vars(ap.parse_args())
+
+# Assign arguments to variables
+ann_path = args['annotation']
+repeat = args['repeat']
+
+# Verify the input path, print error and exit if not found
+if not Path(ann_path).exists():
+
+    exit("[ERROR] Cannot find {}. Check the input to -a!".format(ann_path))
+
+# Read the annotation
+annotation_df = read_corpus(ann_path)
+
+# Set up a dictionary for collecting results for each layer
+results = {name: {'graphs': 0, 'pickle_bytes': 0, 'compact_bytes': 0,
+                  'pickle_time': 0.0, 'compact_time': 0.0, 'mismatches': 0}
+           for name in graph_attributes}
+
+# Loop over the diagrams
+for ix, row in annotation_df.iterrows():
+
+    # Skip diagrams that have not been annotated
+    if row['diagram'] is None:
+
+        continue
+
+    for name in graph_attributes:
+
+        # Fetch the graph
+        graph = getattr(row['diagram'], name, None)
+
+        # Skip layers that have not been annotated
+        if graph is None:
+
+            continue
+
+        # Serialize the graph using pickle and the compact representation
+        pickled = pickle.dumps(graph, protocol=pickle.HIGHEST_PROTOCOL)
+        packed = pickle.dumps(pack_graph(graph),
+                              protocol=pickle.HIGHEST_PROTOCOL)
+
+        # Time loading the pickled graph
+        start = time.perf_counter()
+
+        for i in range(repeat):
+
+            pickle.loads(pickled)
+
+        pickle_time = time.perf_counter() - start
+
+        # Time loading the compact representation
+        start = time.perf_counter()
+
+        for i in range(repeat):
+
+            unpacked = unpack_graph(pickle.loads(packed))
+
+        compact_time = time.perf_counter() - start
+
+        # Check that the conversion is lossless
+        if type(unpacked) != type(graph) \
+                or list(unpacked.nodes(data=True)) != \
+                list(graph.nodes(data=True)) \
+                or nx.to_dict_of_dicts(unpacked) != \
+                nx.to_dict_of_dicts(graph):
+
+            results[name]['mismatches'] += 1
+
+        # Update the results
+        results[name]['graphs'] += 1
+        results[name]['pickle_bytes'] += len(pickled)
+        results[name]['compact_bytes'] += len(packed)
+        results[name]['pickle_time'] += pickle_time / repeat
+        results[name]['compact_time'] += compact_time / repeat
+
+# Print the results for each layer
+for name, r in results.items():
+
+    # Skip layers without graphs
+    if r['graphs'] == 0:
+
+        continue
+
+    print("[INFO] {}: {} graphs".format(name, r['graphs']))
+    print(" * size: {:.1f} kB pickled, {:.1f} kB compact ({:.0%})".format(
+        r['pickle_bytes'] / 1024, r['compact_bytes'] / 1024,
+        r['compact_bytes'] / r['pickle_bytes']))
+    print(" * load time: {:.1f} ms pickled, {:.1f} ms compact ({:.0%})".format(
+        r['pickle_time'] * 1000, r['compact_time'] * 1000,
+        r['compact_time'] / r['pickle_time']))
+    print(" * lossless: {}".format('yes' if r['mismatches'] == 0 else
+                                   'no, {} mismatches'.format(r['mismatches'])))
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+"""
+This script compares the time needed for extracting the types of diagram
+elements from AI2D annotation by scanning the annotation, as done before the
+AnnotationIndex was introduced in core/parse.py, and by using the index. The
+comparison is made on the largest diagrams in the given AI2D categories.
+
+Usage:
+    python benchmark_index.py -a annotation.pkl
+
+Arguments:
+    -a/--annotation: Path to the pandas DataFrame or the sharded directory
+                     containing the annotation.
+    -c/--categories: Optional argument for the AI2D categories to use (default
+                     partsOfA and foodChainsWebs).
+    -n/--number: Optional argument for the number of largest diagrams used in
+                 each category (default 50).
+    -r/--repeat: Optional argument for the number of times the types are
+                 extracted from each diagram (default 20).
+
+Returns:
+    Prints the time spent on extracting the element types using each method
+    and verifies that the methods give the same result.
+"""
+
+# Import packages
+from core.parse import *
+from core.storage import *
+from pathlib import Path
+import argparse
+import time
+
+
+def scan_types(elements, annotation):
+    """
+    Extracts the types of diagram elements by scanning the annotation, as done
+    by extract_types before the AnnotationIndex was introduced.
+
+    Parameters:
+        elements: A list of diagram elements.
+        annotation: A dictionary of AI2D annotation.
+
+    Returns:
+         A dictionary with element types as keys and identifiers as values.
+    """
+    targets = ['arrowHeads', 'arrows', 'blobs', 'text', 'containers',
+               'imageConsts']
+
+    element_types = {}
+
+    for e in elements:
+
+        try:
+            for t in targets:
+
+                ids = [i for i in annotation[t].keys()]
+
+                if e in ids:
+                    element_types[e] = t
+
+        except KeyError:
+            continue
+
+    return element_types
+
+
+# Set up the argument parser
+ap = argparse.ArgumentParser()
+
+# Define arguments
+ap.add_argument("-a", "--annotation", required=True,
+                help="Path to the pandas DataFrame or sharded directory with "
+                     "AI2D-RST annotation.")
+ap.add_argument("-c", "--categories", required=False, nargs='+',
+                default=['partsOfA', 'foodChainsWebs'],
+                help="The AI2D categories to use.")
+ap.add_argument("-n", "--number", required=False, type=int, default=50,
+                help="The number of largest diagrams used in each category.")
+ap.add_argument("-r", "--repeat", required=False, type=int, default=20,
+                help="The number of times the types are extracted.")
+
+# Parse arguments
+args = vars(ap.parse_args())
+
+# Assign arguments to variables
+ann_path = args['annotation']
+repeat = args['repeat']
+
+# Verify the input path, print error and exit if not found
+if not Path(ann_path).exists():
+
+    exit("[ERROR] Cannot find {}. Check the input to -a!".format(ann_path))
+
+# Read the index of the annotation
+index = open_corpus(ann_path).index
+
+for category in args['categories']:
+
+    # Read the annotation for the diagrams in the category
+    image_names = list(index.loc[index['category'] == category, 'image_name'])
+
+    if not image_names:
+
+        print("[INFO] {}: no diagrams found.".format(category))
+
+        continue
+
+    annotations = list(read_corpus(ann_path, image_names)['annotation'])
+
+    # Select the largest diagrams by the number of diagram elements
+    annotations = sorted(annotations, key=lambda x: len(AnnotationIndex(x)),
+                         reverse=True)[:args['number']]
+
+    # Set up counters for the time spent using each method
+    scan_time, cold_time, warm_time, mismatches = 0.0, 0.0, 0.0, 0
+
+    for annotation in annotations:
+
+        # Parse the diagram elements as done in create_graph
+        elements, relations = parse_annotation(annotation)
+
+        # Time scanning the annotation
+        start = time.perf_counter()
+
+        for i in range(repeat):
+
+            scanned = scan_types(elements, annotation)
+
+        scan_time += (time.perf_counter() - start) / repeat
+
+        # Time building the index and using it
+        start = time.perf_counter()
+
+        for i in range(repeat):
+
+            index_cache.clear()
+            indexed = extract_types(elements, annotation)
+
+        cold_time += (time.perf_counter() - start) / repeat
+
+        # Time using an index that has been built already
+        start = time.perf_counter()
+
+        for i in range(repeat):
+
+            extract_types(elements, annotation)
+
+        warm_time += (time.perf_counter() - start) / repeat
+
+        # Check that the methods give the same result
+        if scanned != indexed:
+
+            mismatches += 1
+
+    # Print the results for the category
+    sizes = [len(get_index(a)) for a in annotations]
+
+    print("[INFO] {}: {} diagrams with {} to {} elements".format(
+        category, len(annotations), min(sizes), max(sizes)))
+    print(" * scan: {:.2f} ms".format(scan_time * 1000))
+    print(" * index: {:.2f} ms when built ({:.1f}x faster), {:.2f} ms when "
+          "cached ({:.1f}x faster)".format(
+              cold_time * 1000, scan_time / cold_time, warm_time * 1000,
+              scan_time / warm_time))
+    print(" * identical: {}".format('yes' if mismatches == 0 else
+                                    'no, {} mismatches'.format(mismatches)))
@@ -5,10 +5,13 @@ This script loads a pandas DataFrame containing AI2D-RST annotation and
 prints out the status of each diagram in the file.
 
 Usage:
-    python examine_annotation.py -a annotation.pkl
+    python check_status.py -a annotation.pkl
     
 Arguments:
     -a/--annotation: Path to the pandas DataFrame containing the annotation.
+    -s/--summary: Optional argument for printing the number of completed
+                  annotation layers and comments for each AI2D category
+                  instead of the status of each diagram.
     
 Returns:
     Prints the contents of the DataFrame on the standard output.
@@ -16,6 +19,7 @@ Returns:
 
 # Import packages
 from colorama import Fore, Style, init
+from core.storage import *
 import argparse
 import pandas as pd
 
@@ -27,6 +31,9 @@ ap = argparse.ArgumentParser()
 
 # Define arguments
 ap.add_argument("-a", "--annotation", required=True)
+ap.add_argument("-s", "--summary", required=False, action='store_true',
+                help="Prints a summary of the annotation for each AI2D "
+                     "category.")
 
 # Parse arguments
 args = vars(ap.parse_args())
@@ -34,8 +41,37 @@ args = vars(ap.parse_args())
 # Assign arguments to variables
 ann_path = args['annotation']
 
-# Read the DataFrame
-annotation_df = pd.read_pickle(ann_path)
+# Open the annotation, loading each Diagram object only when needed
+annotation_df = open_corpus(ann_path)
+
+# Print a summary of the index if requested
+if args['summary']:
+
+    # Fetch the index, which holds the status of each diagram
+    index = annotation_df.index.copy()
+
+    # Mark diagrams without an AI2D category
+    index['category'] = index['category'].fillna('unknown')
+
+    # Count the completed layers and comments for each category
+    summary = index.groupby('category')[status_columns].sum().astype(int)
+
+    # Add the number of diagrams in each category
+    summary.insert(0, 'diagrams', index.groupby('category').size())
+
+    # Add totals for the entire corpus
+    summary.loc['total'] = summary.sum()
+
+    # Rename the columns for clarity
+    summary = summary.rename(columns={'annotated': 'started',
+                                      'group_complete': 'grouping',
+                                      'connectivity_complete': 'connectivity',
+                                      'rst_complete': 'rst'})
+
+    # Print the summary and exit
+    print(summary.to_string())
+
+    exit()
 
 # Begin looping over the rows of the input DataFrame. Enumerate the result to
 # show annotation progress to the user.
@@ -126,8 +162,11 @@ for i, (ix, row) in enumerate(annotation_df.iterrows(), start=1):
                     pass
 
                 try:
-                
-                    if len(diagram.comments) > 0:
+
+                    # Use the number of comments in the index to avoid loading
+                    # diagrams without comments.
+                    if row.get('comments', 1) > 0 and \
+                            len(diagram.comments) > 0:
                 
                         for comment in diagram.comments:
                 
@@ -139,7 +178,8 @@ for i, (ix, row) in enumerate(annotation_df.iterrows(), start=1):
 
         except AttributeError:
 
-            print("[ERROR] Diagram object does not exist.")
+            print("[INFO] No annotation work has been done on this diagram "
+                  "yet.")
 
     except KeyError:
 
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+"""
+This script compares the layout segmentations drawn using matplotlib and OpenCV
+by draw_layout(), reporting the time spent by each backend and the difference
+between their outputs.
+
+Usage:
+    python compare_layout_backends.py -a annotation.pkl -i images/
+
+Arguments:
+    -a/--annotation: Path to the pandas DataFrame or the sharded directory
+                     containing the annotation.
+    -i/--images: Path to the directory containing the original AI2D images.
+    -n/--number: Optional argument for the number of diagrams to compare
+                 (default 50).
+    -o/--output: Optional argument for a directory, into which the outputs of
+                 both backends are written side by side for inspection.
+
+Returns:
+    Prints the mean time spent per diagram by each backend and the mean
+    absolute difference between the outputs.
+"""
+
+# Import packages
+from core.draw import *
+from core.storage import *
+from pathlib import Path
+import argparse
+import cv2
+import numpy as np
+import os
+import time
+
+# Set up the argument parser
+ap = argparse.ArgumentParser()
+
+# Define arguments
+ap.add_argument("-a", "--annotation", required=True,
+                help="Path to the pandas DataFrame or sharded directory with "
+                     "AI2D-RST annotation.")
+ap.add_argument("-i", "--images", required=True,
+                help="Path to the directory with AI2D images.")
+ap.add_argument("-n", "--number", required=False, type=int, default=50,
+                help="The number of diagrams to compare.")
+ap.add_argument("-o", "--output", required=False,
+                help="Path to a directory for writing the outputs side by "
+                     "side.")
+
+# Parse arguments
+args = vars(ap.parse_args())
+
+# Assign arguments to variables
+ann_path = args['annotation']
+images_path = args['images']
+output_path = args['output']
+
+# Verify the input paths, print error and exit if not found
+if not Path(ann_path).exists():
+
+    exit("[ERROR] Cannot find {}. Check the input to -a!".format(ann_path))
+
+if not Path(images_path).exists():
+
+    exit("[ERROR] Cannot find {}. Check the input to -i!".format(images_path))
+
+# Create the output directory if requested
+if output_path is not None:
+
+    os.makedirs(output_path, exist_ok=True)
+
+# Read the annotation
+annotation_df = read_corpus(ann_path).head(args['number'])
+
+# Set up variables for collecting the results
+times = {'matplotlib': 0.0, 'opencv': 0.0}
+differences = []
+
+# Loop over the diagrams
+for ix, row in annotation_df.iterrows():
+
+    # Join the path to the image directory with the filename
+    image_path = os.path.join(images_path, row['image_name'])
+
+    # Draw the layout using matplotlib and time the drawing. Call the renderers
+    # directly to bypass the cache in draw_layout().
+    start = time.perf_counter()
+    mpl_img = render_layout(image_path, row['annotation'], 480)
+    times['matplotlib'] += time.perf_counter() - start
+
+    # Draw the layout using OpenCV and time the drawing
+    start = time.perf_counter()
+    cv_img = render_layout_cv(image_path, row['annotation'], 480)
+    times['opencv'] += time.perf_counter() - start
+
+    # Check that the images have the same size
+    if mpl_img.shape != cv_img.shape:
+
+        print("[ERROR] Image sizes differ for {}: {} and {}.".format(
+            row['image_name'], mpl_img.shape, cv_img.shape))
+
+        continue
+
+    # Calculate the mean absolute difference between the images
+    differences.append(np.abs(mpl_img.astype(np.int16) - cv_img).mean())
+
+    # Write the images side by side if requested
+    if output_path is not None:
+
+        cv2.imwrite(os.path.join(output_path, row['image_name']),
+                    np.hstack([mpl_img, cv_img]))
+
+# Print the results
+print("[INFO] Compared {} diagrams.".format(len(annotation_df)))
+
+for backend, total in times.items():
+
+    print("[INFO] {}: {:.1f} ms per diagram.".format(
+        backend, total / max(len(annotation_df), 1) * 1000))
+
+if differences:
+
+    print("[INFO] Mean absolute difference per pixel: {:.2f} (max {:.2f})."
+          .format(np.mean(differences), np.max(differences)))
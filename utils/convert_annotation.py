@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""
+This script converts AI2D-RST annotation between a single pandas DataFrame and
+a sharded directory, which holds one file per diagram and an index. Diagram
+objects pickled by earlier versions of the annotator are migrated to the current
+version on the way, which drops any transient state saved with them. To migrate
+a DataFrame without changing its format, give a new .pkl file as the output.
+
+Usage:
+    python convert_annotation.py -a annotation.pkl -o corpus/
+
+Arguments:
+    -a/--annotation: Path to the pandas DataFrame or the sharded directory
+                     containing the annotation.
+    -o/--output: Path to the output. Paths ending in .pkl are written as a
+                 single pandas DataFrame, other paths as a sharded directory.
+
+Returns:
+    Writes the annotation to disk in the requested format.
+"""
+
+# Import packages
+from core.storage import *
+from pathlib import Path
+import argparse
+
+# Set up the argument parser
+ap = argparse.ArgumentParser()
+
+# Define arguments
+ap.add_argument("-a", "--annotation", required=True,
+                help="Path to the pandas DataFrame or sharded directory with "
+                     "AI2D-RST annotation.")
+ap.add_argument("-o", "--output", required=True,
+                help="Path to the output DataFrame (.pkl) or directory.")
+
+# Parse arguments
+args = vars(ap.parse_args())
+
+# Assign arguments to variables
+ann_path = args['annotation']
+output_path = args['output']
+
+# Verify the input path, print error and exit if not found
+if not Path(ann_path).exists():
+
+    exit("[ERROR] Cannot find {}. Check the input to -a!".format(ann_path))
+
+# Verify that the output does not exist yet
+if Path(output_path).exists():
+
+    exit("[ERROR] {} exists already. Check the input to -o!".format(
+        output_path))
+
+# Read the annotation
+annotation_df = read_corpus(ann_path)
+
+# Set up storage for the output, using shards unless a pickle is requested
+store = open_store(output_path, sharded=not output_path.endswith('.pkl'))
+
+# Write the annotation to disk
+store.initialize(annotation_df)
+
+# Print status message
+print("[INFO] Wrote {} diagrams to {}.".format(len(annotation_df), output_path))
@@ -4,6 +4,9 @@ import string
 import random
 from .interface import *
 from .parse import *
+from .registry import add_aliased_node, add_edges, add_nodes, \
+    get_kind_index, get_registry, remove_edges, remove_nodes, \
+    set_node_attributes
 
 
 def create_id(length=6, chars=string.ascii_uppercase+string.digits):
@@ -92,13 +95,12 @@ def create_relation(rst_graph, user_input):
             new_rel_id = create_id()
 
             # Add a new node to the graph to represent the RST relation
-            rst_graph.add_node(new_rel_id,
-                               kind='relation',
-                               nucleus=' '.join(nucleus).upper(),
-                               satellites=' '.join(satellites).upper(),
-                               rel_name=relation_name,
-                               id=new_rel_id
-                               )
+            add_aliased_node(rst_graph, new_rel_id, 'relation',
+                             nucleus=' '.join(nucleus).upper(),
+                             satellites=' '.join(satellites).upper(),
+                             rel_name=relation_name,
+                             id=new_rel_id
+                             )
 
             # Draw edges from satellite(s) to the current RST relation
             for s in satellites:
@@ -110,15 +112,15 @@ def create_relation(rst_graph, user_input):
                     satellite_rel = rel_dict[s]
 
                     # Add edge from satellite relation to the new relation
-                    rst_graph.add_edge(satellite_rel, new_rel_id,
-                                       kind='satellite')
+                    add_edges(rst_graph, [(satellite_rel, new_rel_id)],
+                              kind='satellite')
 
                 # If the satellite is not a relation, draw edge from node
                 else:
 
                     # Add edge to graph
-                    rst_graph.add_edge(s.upper(), new_rel_id,
-                                       kind='satellite')
+                    add_edges(rst_graph, [(s.upper(), new_rel_id)],
+                              kind='satellite')
 
             # Draw edges from nucleus to relation
             for n in nucleus:
@@ -130,15 +132,15 @@ def create_relation(rst_graph, user_input):
                     nuclei_rel = rel_dict[n]
 
                     # Add edge from satellite relation to the new relation
-                    rst_graph.add_edge(new_rel_id, nuclei_rel,
-                                       kind='nucleus')
+                    add_edges(rst_graph, [(new_rel_id, nuclei_rel)],
+                              kind='nucleus')
 
                 # If the nucleus is not a relation, draw edge from node
                 else:
 
                     # Add edge to graph
-                    rst_graph.add_edge(new_rel_id, n.upper(),
-                                       kind='nucleus')
+                    add_edges(rst_graph, [(new_rel_id, n.upper())],
+                              kind='nucleus')
 
     # Continue by checking if the relation is multinuclear
     if relation_kind == 'multi':
@@ -177,12 +179,11 @@ def create_relation(rst_graph, user_input):
             new_rel_id = create_id()
 
             # Add a new node to the graph to represent the RST relation
-            rst_graph.add_node(new_rel_id,
-                               kind='relation',
-                               nuclei=' '.join(nuclei).upper(),
-                               rel_name=relation_name,
-                               id=new_rel_id
-                               )
+            add_aliased_node(rst_graph, new_rel_id, 'relation',
+                             nuclei=' '.join(nuclei).upper(),
+                             rel_name=relation_name,
+                             id=new_rel_id
+                             )
 
             # Draw edges from nuclei to the current RST relation
             for n in nuclei:
@@ -194,15 +195,15 @@ def create_relation(rst_graph, user_input):
                     origin = rel_dict[n]
 
                     # Add edge from the RST relation to the nuclei
-                    rst_graph.add_edge(new_rel_id, origin,
-                                       kind='nucleus')
+                    add_edges(rst_graph, [(new_rel_id, origin)],
+                              kind='nucleus')
 
                 # If all nuclei are nodes, draw edges from relation to nuclei
                 else:
 
                     # Add edge to graph
-                    rst_graph.add_edge(new_rel_id, n.upper(),
-                                       kind='nucleus')
+                    add_edges(rst_graph, [(new_rel_id, n.upper())],
+                              kind='nucleus')
 
 
 def group_nodes(graph, user_input):
@@ -217,39 +218,37 @@ def group_nodes(graph, user_input):
     Returns:
         An updated NetworkX Graph.
     """
-    # Create a dictionary of nodes in the graph
-    node_dict = get_node_dict(graph)
+    # Fetch the kind index of the graph
+    index = get_kind_index(graph)
 
-    # Check user input against the node dictionary for input types
+    # Check user input against the kind index for input types
+    node_dict = index.get_kinds()
     input_node_types = [node_dict[u.upper()] for u in user_input]
 
     # If the user input contains an imageConsts, do not add a node
     if 'imageConsts' in input_node_types:
 
-        # Loop over key/value pairs
-        for k, v in node_dict.items():
+        # Loop over image constants
+        for k in index.get_nodes('imageConsts'):
 
-            # If the node is an image image constants
-            if v == 'imageConsts':
+            # Loop over the elements in the user input
+            for valid_elem in user_input:
 
-                # Loop over image constants
-                for valid_elem in user_input:
-
-                    # Add edge from image constant to the element
-                    graph.add_edge(valid_elem.upper(), k.upper())
+                # Add edge from image constant to the element
+                add_edges(graph, [(valid_elem.upper(), k.upper())])
 
     else:
         # Generate a name for the new node that joins together the elements
         # provided by the user
         new_node = create_id()
 
-        # Add the new node to the graph
-        graph.add_node(new_node, kind='group')
+        # Add the new node to the graph and give the node an alias
+        add_aliased_node(graph, new_node, 'group')
 
         # Add edges from nodes in the user input to the new node
         for valid_elem in user_input:
 
-            graph.add_edge(valid_elem.upper(), new_node)
+            add_edges(graph, [(valid_elem.upper(), new_node)])
 
 
 def macro_group(graph, user_input):
@@ -363,7 +362,7 @@ def macro_group(graph, user_input):
                 row_dict = {}
 
                 # Add table shape attribute to the node
-                nx.set_node_attributes(graph, shape_dict, 'table_shape')
+                set_node_attributes(graph, shape_dict, 'table_shape')
 
                 # Prompt user to fill the table rows
                 for x in range(1, table_rows + 1):
@@ -432,7 +431,7 @@ def macro_group(graph, user_input):
                 table_data = {node: row_dict}
 
                 # Add table information to node
-                nx.set_node_attributes(graph, table_data, 'table_data')
+                set_node_attributes(graph, table_data, 'table_data')
 
                 # Check if table has axis labels
                 if table_axes > 0:
@@ -484,10 +483,10 @@ def macro_group(graph, user_input):
                     label_data = {node: axis_labels}
 
                     # Add table information to node
-                    nx.set_node_attributes(graph, label_data, 'table_labels')
+                    set_node_attributes(graph, label_data, 'table_labels')
 
         # Add macro grouping information to the graph nodes
-        nx.set_node_attributes(graph, macro_grouping, 'macro_group')
+        set_node_attributes(graph, macro_grouping, 'macro_group')
 
         # Print status message
         print("[INFO] Updated macro-group information for {}.".format(
@@ -516,7 +515,7 @@ def update_grouping(diagram, graph):
     edge_bunch = [(u, v) for (u, v, d) in edge_bunch if d['kind'] == 'grouping']
 
     # Remove grouping edges from current graph
-    graph.remove_edges_from(edge_bunch)
+    remove_edges(graph, edge_bunch)
 
     # Use the isolates function to locate obsolete grouping nodes
     isolates = list(nx.isolates(graph))
@@ -524,8 +523,8 @@ def update_grouping(diagram, graph):
     # Remove isolated grouping nodes
     isolates = [i for i in isolates if nodes[i]['kind'] == 'group']
 
-    # Remove isolated nodes from the graph
-    graph.remove_nodes_from(isolates)
+    # Remove isolated nodes from the graph and their aliases
+    remove_nodes(graph, isolates)
 
     # Create a temporary copy of the layout graph for filtering content
     temp_graph = diagram.layout_graph.copy()
@@ -555,6 +554,12 @@ def update_grouping(diagram, graph):
     # Add attributes to the remaining edges
     nx.set_edge_attributes(temp_graph, 'grouping', 'kind')
 
-    # Add the filtered nodes and edgesto the connectivity graph
-    graph.add_nodes_from(temp_graph.nodes(data=True))
-    graph.add_edges_from(temp_graph.edges(data=True))
+    # Add the filtered nodes and edges to the connectivity graph. Grouping
+    # nodes keep the aliases used in the layout graph, so that a group has the
+    # same alias in each graph and the aliases do not change each time the
+    # task is entered.
+    layout_registry = get_registry(diagram.layout_graph)
+
+    add_nodes(graph, list(temp_graph.nodes(data=True)),
+              aliases={n: layout_registry.alias(n) for n in temp_graph})
+    add_edges(graph, list(temp_graph.edges(data=True)))
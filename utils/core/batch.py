@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+from . import draw
+from .draw import draw_composite
+from .geometry import PairwiseFeatures
+from .storage import open_corpus
+
+import cv2
+import os
+
+
+# Set up a dictionary for the state of each worker process
+worker = {}
+
+
+def init_worker(ann_path, images_path, output_path, fmt, dpi):
+    """
+    Sets up a worker process for rendering diagrams, opening sharded
+    annotation once per process.
+
+    Parameters:
+        ann_path: Path to the sharded directory containing the annotation, or
+                  None if the Diagram objects are passed to the workers.
+        images_path: Path to the directory with AI2D images, or None to use
+                     the paths stored in the Diagram objects.
+        output_path: Path to the output directory.
+        fmt: The format of the output files, either 'png' or 'webp'.
+        dpi: The resolution of the images as dots per inch.
+
+    Returns:
+        None
+    """
+    # Open the annotation, from which each worker loads only the shards of the
+    # diagrams it renders. A pandas DataFrame would be read completely by each
+    # worker, so the Diagram objects in a DataFrame are passed to the workers
+    # instead.
+    worker['corpus'] = None
+
+    if ann_path is not None:
+
+        worker['corpus'] = open_corpus(ann_path, max_resident=1)
+
+    # Store the settings
+    worker.update({'images_path': images_path, 'output_path': output_path,
+                   'format': fmt, 'dpi': dpi})
+
+    # Each diagram is drawn once, so caching images in memory is not useful
+    draw.image_cache.max_bytes = 0
+    draw.layout_cache_size = 0
+
+
+def output_file(output_path, image_name, fmt):
+    """
+    Gets the path of the output file for a diagram.
+
+    Parameters:
+        output_path: Path to the output directory.
+        image_name: The filename of the AI2D diagram image, e.g. 1132.png.
+        fmt: The format of the output file, either 'png' or 'webp'.
+
+    Returns:
+        Path to the output file.
+    """
+    return os.path.join(output_path, '{}.{}'.format(
+        os.path.splitext(image_name)[0], fmt))
+
+
+def render_diagram(job):
+    """
+    Renders the composite image of a diagram and writes it to disk. The image
+    is written into a temporary file that is moved into place, so that an
+    interrupted run never leaves a partial file behind.
+
+    Parameters:
+        job: A tuple containing the filename of the AI2D diagram image, e.g.
+             1132.png, and the Diagram object, or None if the diagram is
+             loaded from the sharded annotation opened by the worker.
+
+    Returns:
+        A tuple of the image filename and None if successful, or an error
+        message otherwise.
+    """
+    image_name, diagram = job
+
+    try:
+        # Load the Diagram object with all its graphs if needed
+        if diagram is None:
+
+            diagram = worker['corpus'].materialize(image_name)
+
+        # Use the image directory given by the user, if any
+        image_path = None
+
+        if worker['images_path'] is not None:
+
+            image_path = os.path.join(worker['images_path'], image_name)
+
+        # Draw the composite image
+        img = draw_composite(diagram, dpi=worker['dpi'], image_path=image_path)
+
+        # Encode the image in the requested format
+        success, data = cv2.imencode('.' + worker['format'], img)
+
+        if not success:
+
+            return image_name, "could not encode image"
+
+        # Write the image into a temporary file and move it into place
+        path = output_file(worker['output_path'], image_name,
+                           worker['format'])
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+        with open(temp_path, 'wb') as out_file:
+
+            out_file.write(data.tobytes())
+
+        os.replace(temp_path, path)
+
+    # Report errors without stopping the other diagrams
+    except Exception as e:
+
+        return image_name, "{}: {}".format(type(e).__name__, e)
+
+    return image_name, None
+
+
+def diagram_features(job):
+    """
+    Computes the pairwise geometric features for the layout elements of a
+    diagram.
+
+    Parameters:
+        job: A tuple containing the image filename and a dictionary containing
+             the AI2D annotation.
+
+    Returns:
+        A tuple of the image filename and a dictionary of NumPy arrays, or an
+        error message if the features could not be computed.
+    """
+    image_name, annotation = job
+
+    try:
+        return image_name, PairwiseFeatures(annotation).to_dict()
+
+    # Report errors without stopping the other diagrams
+    except Exception as e:
+
+        return image_name, "{}: {}".format(type(e).__name__, e)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import os
+
+
+# Define the file formats available for screen captures
+capture_formats = ['png', 'svg', 'pdf']
+
+# Set up a background thread for writing screen captures to disk
+capture_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def save_capture(path, content):
+    """
+    Writes a screen capture to disk in a background thread, so that the
+    annotator does not need to wait for encoding and writing the file.
+
+    Parameters:
+        path: Path to the output file.
+        content: A bytes object containing the file, an image as a NumPy
+                 array, which is encoded according to the file extension, or a
+                 function returning either.
+
+    Returns:
+        A Future object for the pending write.
+    """
+    return capture_executor.submit(write_capture, path, content)
+
+
+def write_capture(path, content):
+    """
+    Encodes and writes a screen capture to disk.
+
+    Parameters:
+        path: Path to the output file.
+        content: A bytes object containing the file, an image as a NumPy
+                 array, which is encoded according to the file extension, or a
+                 function returning either.
+
+    Returns:
+        None
+    """
+    try:
+        # Produce the content if a function is given
+        if callable(content):
+
+            content = content()
+
+        # Encode images according to the file extension
+        if not isinstance(content, bytes):
+
+            content = cv2.imencode(os.path.splitext(path)[1], content)[1]\
+                .tobytes()
+
+        # Write the file into a temporary file and move it into place
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+        with open(temp_path, 'wb') as out_file:
+
+            out_file.write(content)
+
+        os.replace(temp_path, path)
+
+    # Report errors, as the annotator does not wait for the result
+    except Exception as e:
+
+        print("\n[ERROR] Could not save {}: {}".format(path, e))
+
+
+def wait_for_captures():
+    """
+    Waits for all pending screen captures to be written to disk.
+
+    Returns:
+        None
+    """
+    # Submit an empty task, which finishes after the earlier tasks in the
+    # single background thread
+    capture_executor.submit(lambda: None).result()
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+import networkx as nx
+import numpy as np
+import pickle
+
+
+# Define the attributes stored as integer codes into a vocabulary of values
+coded_attributes = ['kind', 'rel_name', 'macro_group']
+
+# Define the graph types that may be packed
+graph_types = {'Graph': nx.Graph,
+               'DiGraph': nx.DiGraph,
+               'MultiGraph': nx.MultiGraph,
+               'MultiDiGraph': nx.MultiDiGraph}
+
+# Define a version identifier for the packed format
+compact_format = 'ai2d-rst-compact-1'
+
+
+def pack_graph(graph):
+    """
+    Packs a NetworkX graph into a compact representation, in which node
+    identifiers are interned into a list, common attributes are stored as
+    integer codes and edges are stored as compressed sparse row (CSR) arrays.
+
+    Parameters:
+        graph: A NetworkX Graph, DiGraph, MultiGraph or MultiDiGraph.
+
+    Returns:
+        A dictionary containing the packed graph.
+    """
+    # Intern the node identifiers by assigning each node an integer
+    nodes = list(graph.nodes)
+    node_ix = {n: i for i, n in enumerate(nodes)}
+
+    # Set up vocabularies for coded attributes shared by nodes and edges
+    vocab = {a: {} for a in coded_attributes}
+
+    # Encode the node attributes
+    node_codes, node_extra = encode_attributes(
+        [d for n, d in graph.nodes(data=True)], vocab)
+
+    # Fetch the edges, including their keys for multigraphs. The edges are
+    # returned in the order of their source nodes, which allows storing them
+    # as CSR arrays.
+    if graph.is_multigraph():
+
+        edges = list(graph.edges(keys=True, data=True))
+
+    else:
+        edges = [(u, v, None, d) for u, v, d in graph.edges(data=True)]
+
+    # Convert sources and targets into arrays of node indices
+    sources = np.array([node_ix[e[0]] for e in edges], dtype=np.int32)
+    indices = np.array([node_ix[e[1]] for e in edges], dtype=np.int32)
+
+    # Count the edges for each source node and convert into row pointers
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int32)
+    indptr[1:] = np.cumsum(np.bincount(sources, minlength=len(nodes)))
+
+    # Encode the edge attributes
+    edge_codes, edge_extra = encode_attributes([e[3] for e in edges], vocab)
+
+    # Store the keys of a multigraph, using an array if the keys are integers
+    keys = None
+
+    if graph.is_multigraph():
+
+        keys = [e[2] for e in edges]
+
+        if all(type(k) == int for k in keys):
+
+            keys = np.array(keys, dtype=np.int32)
+
+    return {'format': compact_format,
+            'type': type(graph).__name__,
+            'frozen': nx.is_frozen(graph),
+            'graph': dict(graph.graph),
+            'nodes': nodes,
+            'vocab': {a: list(v.keys()) for a, v in vocab.items()},
+            'node_codes': node_codes,
+            'node_extra': node_extra,
+            'indptr': indptr,
+            'indices': indices,
+            'keys': keys,
+            'edge_codes': edge_codes,
+            'edge_extra': edge_extra}
+
+
+def unpack_graph(packed):
+    """
+    Converts a packed graph back into a NetworkX graph.
+
+    Parameters:
+        packed: A dictionary containing a graph packed using pack_graph().
+
+    Returns:
+        A NetworkX graph.
+    """
+    # Create a graph of the original type and restore graph attributes
+    graph = graph_types[packed['type']]()
+    graph.graph.update(packed['graph'])
+
+    # Decode the node attributes
+    node_attrs = decode_attributes(packed['node_codes'], packed['node_extra'],
+                                   packed['vocab'], len(packed['nodes']))
+
+    # Decode the edge attributes
+    edge_attrs = decode_attributes(packed['edge_codes'], packed['edge_extra'],
+                                   packed['vocab'], len(packed['indices']))
+
+    # Recover the source node of each edge from the row pointers
+    sources = np.repeat(np.arange(len(packed['nodes'])),
+                        np.diff(packed['indptr']))
+
+    # Look up the node identifiers for sources and targets
+    sources = [packed['nodes'][i] for i in sources.tolist()]
+    targets = [packed['nodes'][i] for i in packed['indices'].tolist()]
+
+    # Fetch the keys of a multigraph, converting an array back to integers
+    keys = packed['keys']
+
+    if isinstance(keys, np.ndarray):
+
+        keys = keys.tolist()
+
+    # Build the adjacency dictionaries of the graph directly, which is several
+    # times faster than adding the nodes and edges one by one.
+    succ = {n: {} for n in packed['nodes']}
+
+    # Directed graphs also track predecessors; undirected graphs store each
+    # edge under both nodes.
+    pred = {n: {} for n in packed['nodes']} if graph.is_directed() else succ
+
+    for i, (u, v) in enumerate(zip(sources, targets)):
+
+        # Multigraphs map each pair of nodes to a dictionary of keyed edges,
+        # which is shared by both directions.
+        if keys is not None:
+
+            keydict = succ[u].get(v)
+
+            if keydict is None:
+
+                keydict = succ[u][v] = pred[v][u] = {}
+
+            keydict[keys[i]] = edge_attrs[i]
+
+        else:
+            succ[u][v] = pred[v][u] = edge_attrs[i]
+
+    # Add the nodes and their attributes and edges to the graph
+    graph._node.update(zip(packed['nodes'], node_attrs))
+    graph._adj.update(succ)
+
+    if graph.is_directed():
+
+        graph._pred.update(pred)
+
+    # Freeze the graph if the original graph was frozen
+    if packed['frozen']:
+
+        nx.freeze(graph)
+
+    return graph
+
+
+def encode_attributes(attr_dicts, vocab):
+    """
+    Encodes the attributes of nodes or edges.
+
+    Parameters:
+        attr_dicts: A list of attribute dictionaries.
+        vocab: A dictionary of vocabularies for each coded attribute, which maps
+               values to integer codes and is updated in place.
+
+    Returns:
+        An integer array with a column for each coded attribute, in which -1
+        marks a missing attribute, and a dictionary mapping positions to any
+        remaining attributes.
+    """
+    # Set up an array for the codes, marking all attributes initially as
+    # missing. A single array keeps the overhead low for small graphs.
+    codes = np.full((len(attr_dicts), len(coded_attributes)), -1,
+                    dtype=np.int16)
+
+    # Map the coded attributes to columns
+    columns = {a: i for i, a in enumerate(coded_attributes)}
+
+    # Set up a dictionary for attributes that cannot be coded
+    extra = {}
+
+    for i, attrs in enumerate(attr_dicts):
+
+        for k, v in attrs.items():
+
+            # Encode the attribute if possible
+            if k in columns and isinstance(v, str):
+
+                codes[i, columns[k]] = vocab[k].setdefault(v, len(vocab[k]))
+
+            # Otherwise store the attribute as such
+            else:
+                extra.setdefault(i, {})[k] = v
+
+    return codes, extra
+
+
+def decode_attributes(codes, extra, vocab, length):
+    """
+    Decodes the attributes of nodes or edges.
+
+    Parameters:
+        codes: An integer array with a column for each coded attribute.
+        extra: A dictionary mapping positions to remaining attributes.
+        vocab: A dictionary of vocabularies for each coded attribute.
+        length: The number of nodes or edges.
+
+    Returns:
+        A list of attribute dictionaries.
+    """
+    # Set up an attribute dictionary for each node or edge
+    attr_dicts = [{} for i in range(length)]
+
+    # Decode the coded attributes
+    for a, column in zip(coded_attributes, codes.T):
+
+        # Fetch the vocabulary for the attribute
+        values = vocab[a]
+
+        for i, code in enumerate(column.tolist()):
+
+            # Skip missing attributes
+            if code >= 0:
+
+                attr_dicts[i][a] = values[code]
+
+    # Add the remaining attributes
+    for i, attrs in extra.items():
+
+        attr_dicts[i].update(attrs)
+
+    return attr_dicts
+
+
+def dump_graph(graph):
+    """
+    Serializes a graph, using the compact representation for frozen graphs,
+    which are no longer edited.
+
+    Parameters:
+        graph: A NetworkX graph or None.
+
+    Returns:
+        A bytes object.
+    """
+    # Pack frozen graphs
+    if graph is not None and nx.is_frozen(graph):
+
+        graph = pack_graph(graph)
+
+    return pickle.dumps(graph, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_graph(data):
+    """
+    Deserializes a graph serialized using dump_graph().
+
+    Parameters:
+        data: A bytes object.
+
+    Returns:
+        A NetworkX graph or None.
+    """
+    graph = pickle.loads(data)
+
+    # Unpack graphs stored in the compact representation
+    if isinstance(graph, dict) and graph.get('format') == compact_format:
+
+        graph = unpack_graph(graph)
+
+    return graph
@@ -2,8 +2,11 @@
 
 from .annotate import *
 from .draw import *
+from .geometry import PairwiseFeatures, SpatialIndex
+from .history import get_history, unfreeze
 from .interface import *
 from .parse import *
+from .registry import add_edges
 
 import cv2
 import numpy as np
@@ -14,6 +17,16 @@ class Diagram:
     """
     This class holds the annotation for a single AI2D-RST diagram.
     """
+    # Define the version of the state saved when pickling a Diagram object
+    state_version = 1
+
+    # Define the attributes saved when pickling a Diagram object. Any other
+    # attributes, such as the graph saved for resetting annotation and the flag
+    # for tracking updates, are transient and not saved.
+    persisted = ['complete', 'group_complete', 'connectivity_complete',
+                 'rst_complete', 'image_filename', 'annotation', 'layout_graph',
+                 'connectivity_graph', 'rst_graph', 'comments']
+
     def __init__(self, ai2d_ann, image):
         """
         This function initializes the Diagram class.
@@ -60,9 +73,205 @@ class Diagram:
         # Set up a placeholder for comments
         self.comments = []
 
+        # Set up the transient attributes
+        self.init_transient()
+
+    def __getstate__(self):
+        """
+        Collects the state of the Diagram object for pickling.
+
+        Returns:
+            A dictionary containing the persisted attributes and the version of
+            the state.
+        """
+        # Collect the persisted attributes
+        state = {k: v for k, v in self.__dict__.items() if k in self.persisted}
+
+        # Add the version of the state
+        state['state_version'] = self.state_version
+
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restores the state of the Diagram object when unpickling, migrating the
+        state of Diagram objects pickled by earlier versions.
+
+        Parameters:
+            state: A dictionary containing the pickled state.
+
+        Returns:
+            None
+        """
+        # Migrate the state to the current version
+        state = migrate_state(state)
+
+        # Restore the persisted attributes
+        self.__dict__.update(state)
+
+        # Set up the transient attributes
+        self.init_transient()
+
+    def init_transient(self):
+        """
+        Sets up the attributes that are not saved when pickling.
+
+        Returns:
+            None
+        """
+        # Set up a placeholder for the history of the graph being annotated,
+        # which is used for undoing changes and resetting annotation, and for
+        # the mode in which the graph is annotated
+        self.history = None
+        self.mode = None
+
+        # Set up placeholders for the event log, which is set up by the
+        # annotator if requested, and the name of the command being processed
+        self.event_log = None
+        self.command = None
+
         # Set up a flag for tracking updates to the graph (for drawing)
         self.update = False
 
+        # Set up a dictionary for the renderers used for drawing the graphs
+        # during annotation
+        self.renderers = {}
+
+        # Set up placeholders for the spatial index and the pairwise features
+        # of the layout elements
+        self.spatial = None
+        self.pairwise = None
+
+    def get_spatial_index(self):
+        """
+        Gets the spatial index of the layout elements in the diagram, which is
+        built on first use and kept until the Diagram object is pickled.
+
+        Returns:
+            A SpatialIndex object.
+        """
+        if self.spatial is None:
+
+            self.spatial = SpatialIndex(self.annotation)
+
+        return self.spatial
+
+    def get_pairwise_features(self):
+        """
+        Gets the geometric features for all pairs of layout elements in the
+        diagram, which are computed on first use and kept until the Diagram
+        object is pickled.
+
+        Returns:
+            A PairwiseFeatures object.
+        """
+        if self.pairwise is None:
+
+            self.pairwise = PairwiseFeatures(self.annotation)
+
+        return self.pairwise
+
+    def start_history(self, graph, mode):
+        """
+        Starts recording the changes made to a graph during an annotation task,
+        setting the current state of the graph as the state restored by the
+        command 'reset'.
+
+        Parameters:
+            graph: A NetworkX Graph.
+            mode: The mode in which the graph is annotated, i.e. 'layout',
+                  'connectivity' or 'rst'.
+
+        Returns:
+            None
+        """
+        self.history = get_history(graph)
+        self.history.mark()
+        self.mode = mode
+
+        # Log the state of the graph, on top of which the changes made by the
+        # commands are logged
+        if self.event_log is not None:
+
+            self.event_log.snapshot(mode, graph)
+
+    def begin_command(self, user_input):
+        """
+        Begins a new step in the history for undoing the command entered by
+        the user, and names the command for the event log.
+
+        Parameters:
+            user_input: A string containing the input from the user.
+
+        Returns:
+            None
+        """
+        self.history.checkpoint()
+
+        # Escape input without commands
+        if len(user_input.split()) == 0:
+
+            self.command = None
+
+            return
+
+        # Use the name of the command entered, or the name of the edit made
+        # by entering identifiers in the current mode
+        command = user_input.split()[0]
+
+        if command in [c for v in commands.values() for c in v] + \
+                ['hide', 'macro', 'new', 'show']:
+
+            self.command = command
+
+        else:
+            self.command = {'layout': 'group', 'connectivity': 'connect',
+                            'rst': 'invalid'}[self.mode]
+
+    def log_changes(self):
+        """
+        Writes the command entered by the user and the changes made to the
+        graph into the event log, if the log is in use.
+
+        Returns:
+            None
+        """
+        if self.event_log is None or self.history is None:
+
+            return
+
+        changes = self.history.take_changes()
+
+        if self.command is not None:
+
+            self.event_log.command(self.mode, self.command, changes)
+
+        self.command = None
+
+    def render_graph(self, graph, mode, dpi=100):
+        """
+        Draws an image of a graph using a renderer that is kept for the
+        annotation session, so that only the parts of the graph that have
+        changed are drawn again.
+
+        Parameters:
+            graph: A NetworkX Graph.
+            mode: String indicating the diagram structure to be drawn, valid
+                  options include 'layout', 'connectivity' and 'rst'.
+            dpi: The resolution of the image as dots per inch.
+
+        Returns:
+            An image showing the graph.
+        """
+        # Set up a renderer for the mode and resolution if needed
+        if (mode, dpi) not in self.renderers:
+
+            self.renderers[(mode, dpi)] = GraphRenderer(
+                dpi=dpi, mode=mode, key=self.image_filename)
+
+        # Draw the graph
+        return self.renderers[(mode, dpi)].render(graph)
+
     def annotate_layout(self, review):
         """
         A function for annotating the logical / layout structure (DPG-L) of a
@@ -79,17 +288,18 @@ class Diagram:
         # If review mode is active, unfreeze the layout graph
         if review:
 
-            # Unfreeze the layout graph by making a copy
-            self.layout_graph = self.layout_graph.copy()
+            # Unfreeze the layout graph in place
+            unfreeze(self.layout_graph)
 
-        # Freeze and save current graph for resetting annotation if required
-        self.reset = nx.freeze(self.layout_graph.copy())
+        # Start recording changes to the graph for undoing and resetting
+        # annotation if required
+        self.start_history(self.layout_graph, 'layout')
 
         # Visualize the layout segmentation
         segmentation = draw_layout(self.image_filename, self.annotation, 480)
 
         # Draw the graph
-        diagram = draw_graph(self.layout_graph, dpi=100, mode='layout')
+        diagram = self.render_graph(self.layout_graph, mode='layout')
 
         # Set up flag a for tracking whether annotation is hidden
         hide = False
@@ -100,11 +310,8 @@ class Diagram:
             # Check if the graph needs to be updated
             if self.update:
 
-                # Close previous plot
-                plt.close()
-
                 # Re-draw the graph
-                diagram = draw_graph(self.layout_graph, dpi=100, mode='layout')
+                diagram = self.render_graph(self.layout_graph, mode='layout')
 
                 # Mark update complete
                 self.update = False
@@ -115,9 +322,16 @@ class Diagram:
             # Show the resulting visualization
             cv2.imshow("Annotation", preview)
 
+            # Write the changes made by the previous command into the event
+            # log
+            self.log_changes()
+
             # Prompt user for input
             user_input = input(prompts['layout_default'])
 
+            # Begin a new step in the history for undoing the command
+            self.begin_command(user_input)
+
             # Escape accidental / purposeful carrier returns without input
             if len(user_input.split()) == 0:
 
@@ -302,17 +516,12 @@ class Diagram:
             Updated the graph contained in the Diagram object
             (self.connectivity_graph) according to the user input.
         """
-        # If review mode is active, unfreeze the layout graph
-        if review:
-
-            try:
-                # Unfreeze the layout graph by making a copy
-                self.connectivity_graph = self.connectivity_graph.copy()
+        # If review mode is active, unfreeze the connectivity graph in place.
+        # If a connectivity graph has never been annotated, there is nothing
+        # to unfreeze.
+        if review and self.connectivity_graph is not None:
 
-            # If a connectivity graph has never been annotated, catch the error
-            except AttributeError:
-
-                pass
+            unfreeze(self.connectivity_graph)
 
         # Visualize the layout segmentation
         segmentation = draw_layout(self.image_filename, self.annotation, 480)
@@ -326,12 +535,13 @@ class Diagram:
         # Update grouping information using the grouping layer
         update_grouping(self, self.connectivity_graph)
 
-        # Freeze and save current graph for resetting annotation if required
-        self.reset = nx.freeze(self.connectivity_graph.copy())
+        # Start recording changes to the graph for undoing and resetting
+        # annotation if required
+        self.start_history(self.connectivity_graph, 'connectivity')
 
         # Draw the graph using the connectivity mode
-        diagram = draw_graph(self.connectivity_graph, dpi=100,
-                             mode='connectivity')
+        diagram = self.render_graph(self.connectivity_graph,
+                                    mode='connectivity')
 
         # Set up flag a for tracking whether annotation is hidden
         hide = False
@@ -342,12 +552,9 @@ class Diagram:
             # Check if the graph needs to be updated
             if self.update:
 
-                # Close previous plot
-                plt.close()
-
                 # Re-draw the graph using the layout mode
-                diagram = draw_graph(self.connectivity_graph, dpi=100,
-                                     mode='connectivity')
+                diagram = self.render_graph(self.connectivity_graph,
+                                            mode='connectivity')
 
                 # Mark update complete
                 self.update = False
@@ -358,9 +565,16 @@ class Diagram:
             # Show the resulting visualization
             cv2.imshow("Annotation", preview)
 
+            # Write the changes made by the previous command into the event
+            # log
+            self.log_changes()
+
             # Prompt user for input
             user_input = input(prompts['conn_default'])
 
+            # Begin a new step in the history for undoing the command
+            self.begin_command(user_input)
+
             # Escape accidental / purposeful carrier returns without input
             if len(user_input.split()) == 0:
 
@@ -552,8 +766,8 @@ class Diagram:
 
                     # When edges have been added for all connections, add edges
                     # from the edge list
-                    self.connectivity_graph.add_edges_from(edge_bunch,
-                                                           kind=connection_type)
+                    add_edges(self.connectivity_graph, edge_bunch,
+                              kind=connection_type)
 
                     # Flag the graph for re-drawing
                     self.update = True
@@ -571,17 +785,11 @@ class Diagram:
         Returns:
             Updates the RST graph in the Diagram object (self.rst_graph).
         """
-        # If review mode is active, unfreeze the RST graph
-        if review:
-
-            try:
-                # Unfreeze the RST graph by making a copy
-                self.rst_graph = self.rst_graph.copy()
-
-            # If RST graph has never been annotated, catch the error
-            except AttributeError:
+        # If review mode is active, unfreeze the RST graph in place. If the RST
+        # graph has never been annotated, there is nothing to unfreeze.
+        if review and self.rst_graph is not None:
 
-                pass
+            unfreeze(self.rst_graph)
 
         # Visualize the layout segmentation
         segmentation = draw_layout(self.image_filename, self.annotation, 480)
@@ -595,11 +803,12 @@ class Diagram:
         # Update grouping information using the grouping layer
         update_grouping(self, self.rst_graph)
 
-        # Freeze and save current graph for resetting annotation if required
-        self.reset = nx.freeze(self.rst_graph.copy())
+        # Start recording changes to the graph for undoing and resetting
+        # annotation if required
+        self.start_history(self.rst_graph, 'rst')
 
         # Draw the graph using RST mode
-        diagram = draw_graph(self.rst_graph, dpi=100, mode='rst')
+        diagram = self.render_graph(self.rst_graph, mode='rst')
 
         # Set up flag a for tracking whether annotation is hidden
         hide = False
@@ -610,11 +819,8 @@ class Diagram:
             # Check if the graph needs to be updated
             if self.update:
 
-                # Close previous plot
-                plt.close()
-
                 # Re-draw the graph
-                diagram = draw_graph(self.rst_graph, dpi=100, mode='rst')
+                diagram = self.render_graph(self.rst_graph, mode='rst')
 
                 # Mark update complete
                 self.update = False
@@ -625,9 +831,16 @@ class Diagram:
             # Show the resulting visualization
             cv2.imshow("Annotation", preview)
 
+            # Write the changes made by the previous command into the event
+            # log
+            self.log_changes()
+
             # Prompt user for input
             user_input = input(prompts['rst_default'])
 
+            # Begin a new step in the history for undoing the command
+            self.begin_command(user_input)
+
             # Escape accidental / purposeful carrier returns without input
             if len(user_input.split()) == 0:
 
@@ -747,3 +960,37 @@ class Diagram:
 
             # Continue until the annotation process is complete
             continue
+
+
+def migrate_state(state):
+    """
+    Migrates the pickled state of a Diagram object to the current version.
+
+    Parameters:
+        state: A dictionary containing the pickled state.
+
+    Returns:
+        A dictionary containing the persisted attributes.
+    """
+    # Copy the state and fetch its version. Diagram objects pickled before the
+    # state was versioned do not record a version.
+    state = dict(state)
+    version = state.pop('state_version', 0)
+
+    # Unversioned states hold every attribute, including transient ones such as
+    # the frozen copy of a graph used for resetting annotation.
+    if version < 1:
+
+        # Drop the transient attributes
+        state = {k: v for k, v in state.items() if k in Diagram.persisted}
+
+        # Set up defaults for attributes added after the first annotations
+        state.setdefault('complete', False)
+        state.setdefault('group_complete', False)
+        state.setdefault('connectivity_complete', False)
+        state.setdefault('rst_complete', False)
+        state.setdefault('connectivity_graph', None)
+        state.setdefault('rst_graph', None)
+        state.setdefault('comments', [])
+
+    return state
@@ -1,16 +1,80 @@
 # -*- coding: utf-8 -*-
 
+from .geometry import get_geometry
+from .layout import LayoutEngine
 from .parse import *
+from .registry import get_kind_index, get_registry
+
+from collections import OrderedDict
+from functools import partial
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 
 import cv2
+import io
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
 import numpy as np
 import networkx as nx
 import os
-
-
-def draw_graph(graph, dpi=100, mode='layout'):
+import threading
+import time
+
+
+# Set up a layout engine for computing the positions of nodes in graphs
+layout_engine = LayoutEngine()
+
+# Set up a cache for images rendered by draw_layout(), which holds the most
+# recently used images up to the given size.
+layout_cache = OrderedDict()
+layout_cache_size = 32
+layout_cache_lock = threading.Lock()
+
+# Set up the default backend for drawing layouts, either 'matplotlib' or
+# 'opencv'
+layout_backend = 'matplotlib'
+
+# Define the colours used for drawing layout elements in matplotlib
+layout_colour_names = {'blobs': 'orangered',
+                       'arrows': 'mediumseagreen',
+                       'text': 'dodgerblue'}
+
+# Define the same colours in the BGR colourspace used by OpenCV
+layout_colours = {'blobs': (0, 69, 255),
+                  'arrows': (113, 179, 60),
+                  'text': (255, 144, 30)}
+
+# Set up a dictionary for the position of the axis used for drawing layouts
+layout_axes = {}
+
+# Define the styles for drawing nodes of each kind
+node_styles = OrderedDict([('text', {'node_color': 'dodgerblue'}),
+                           ('blobs', {'node_color': 'orangered'}),
+                           ('arrowHeads', {'node_color': 'darkorange'}),
+                           ('arrows', {'node_color': 'mediumseagreen'}),
+                           ('imageConsts', {'node_color': 'palegoldenrod'}),
+                           ('group', {'node_color': 'navajowhite'}),
+                           ('relation', {'node_color': 'peru',
+                                         'node_shape': 's',
+                                         'linewidths': 4})])
+
+# Define the styles for drawing edges in each mode. Each style applies to a
+# list of edge kinds, or to all edges if the list is None.
+edge_styles = {'layout': [(None, {'alpha': 0.75})],
+               'connectivity': [(['undirectional'],
+                                 {'alpha': 0.75, 'arrows': False}),
+                                (['directional', 'bidirectional'],
+                                 {'alpha': 0.75, 'arrows': True}),
+                                (['grouping'],
+                                 {'alpha': 0.5, 'style': 'dotted',
+                                  'arrows': False})],
+               'rst': [(['satellite'], {'alpha': 0.75, 'arrows': False}),
+                       (['nucleus'], {'alpha': 0.75, 'arrows': True}),
+                       (['grouping'], {'alpha': 0.5, 'style': 'dotted',
+                                       'arrows': False})]}
+
+
+def draw_graph(graph, dpi=100, mode='layout', key=None):
     """
     Draws an image of a NetworkX Graph for visual inspection.
     
@@ -19,101 +83,485 @@ def draw_graph(graph, dpi=100, mode='layout'):
         dpi: The resolution of the image as dots per inch.
         mode: String indicating the diagram structure to be drawn, valid options
               include 'layout' (default), 'connectivity' and 'rst'.
+        key: An optional hashable identifying the graph across redraws, such
+             as the filename of the diagram image. Nodes already drawn using
+             the same key and mode keep their positions.
         
     Returns:
          An image showing the NetworkX Graph.
     """
+    # Set up a renderer for drawing the graph once
+    renderer = GraphRenderer(dpi=dpi, mode=mode, key=key)
 
-    # Set up the matplotlib Figure, its resolution and Axis
-    fig = plt.figure(dpi=dpi)
-    ax = fig.add_subplot(1, 1, 1)
+    # Draw the graph
+    img = renderer.render(graph)
+
+    # Remove the artists from the Figure
+    renderer.close()
+
+    return img
+
+
+def draw_composite(diagram, height=720, dpi=100, image_path=None):
+    """
+    Draws a composite image of all annotation layers of a diagram, with the
+    layout segmentation and the grouping graph on top and the connectivity and
+    RST graphs below. Layers that have not been annotated are left blank.
+
+    Parameters:
+        diagram: A Diagram object.
+        height: Target height of the layout segmentation.
+        dpi: The resolution of the images as dots per inch.
+        image_path: An optional path to the diagram image, which overrides the
+                    path stored in the Diagram object.
+
+    Returns:
+        An image showing all annotation layers.
+    """
+    # Draw the layout segmentation
+    segmentation = draw_layout(image_path or diagram.image_filename,
+                               diagram.annotation, height=height, dpi=dpi)
+
+    # Draw each graph, or a blank panel if the graph does not exist
+    panels = []
+
+    for graph, mode in [(diagram.layout_graph, 'layout'),
+                        (diagram.connectivity_graph, 'connectivity'),
+                        (diagram.rst_graph, 'rst')]:
+
+        if graph is None:
+
+            panels.append(np.full_like(segmentation, 255))
+
+            continue
+
+        panels.append(draw_graph(graph, dpi=dpi, mode=mode,
+                                 key=diagram.image_filename))
+
+    # Stack the images side by side and on top of each other
+    return np.vstack([np.hstack([segmentation, panels[0]]),
+                      np.hstack([panels[1], panels[2]])])
+
+
+class GraphRenderer:
+    """
+    This class draws images of a NetworkX Graph using a Figure that persists
+    across redraws. The artists are grouped into layers, e.g. nodes of a given
+    kind or their labels, and only the layers that have changed since the last
+    redraw are drawn again.
+    """
+    def __init__(self, dpi=100, mode='layout', key=None):
+        """
+        This function initializes the GraphRenderer class.
+
+        Parameters:
+            dpi: The resolution of the image as dots per inch.
+            mode: String indicating the diagram structure to be drawn, valid
+                  options include 'layout' (default), 'connectivity' and 'rst'.
+            key: An optional hashable identifying the graph across redraws,
+                 such as the filename of the diagram image.
+
+        Returns:
+            A GraphRenderer object.
+        """
+        self.dpi = dpi
+        self.mode = mode
+        self.key = key
+
+        # Set up the matplotlib Figure, its resolution and Axis. The Figure is
+        # not managed by pyplot and is rendered using Agg.
+        self.fig = Figure(dpi=dpi)
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot(1, 1, 1)
+
+        # Remove margins from the graph and axes from the plot
+        self.fig.tight_layout(pad=0)
+        self.ax.axis('off')
+
+        # Set up a dictionary mapping layers to their signatures and artists
+        self.layers = OrderedDict()
+
+        # Set up a placeholder for the latest image
+        self.image = None
+
+    def render(self, graph):
+        """
+        Draws an image of a NetworkX Graph, updating the layers that have
+        changed since the previous call.
+
+        Parameters:
+            graph: A NetworkX Graph.
+
+        Returns:
+            An image showing the NetworkX Graph.
+        """
+        # Start timing the redraw
+        start = time.perf_counter()
+
+        # Fetch the positions of the nodes from the layout engine
+        pos = layout_engine.layout(graph, key=None if self.key is None
+                                   else (self.key, self.mode))
+
+        # Get the layers for the current graph
+        layers = graph_layers(graph, pos, mode=self.mode)
+
+        # Remove the layers that no longer exist
+        removed = [n for n in self.layers if n not in layers]
+
+        for name in removed:
+
+            self.remove_layer(name)
+
+        # Draw the layers that are new or have changed
+        changed = len(removed) > 0
+
+        for name, (signature, draw) in layers.items():
+
+            if name in self.layers and self.layers[name][0] == signature:
+
+                continue
+
+            self.remove_layer(name)
+            self.layers[name] = (signature, draw(self.ax))
+            changed = True
+
+        # Return the latest image if nothing has changed
+        if not changed and self.image is not None:
+
+            return self.image
+
+        # Fit the axis to the positions of the nodes
+        if pos:
+
+            xs, ys = zip(*[(p[0], p[1]) for p in pos.values()])
+            pad_x = max((max(xs) - min(xs)) * 0.1, 0.1)
+            pad_y = max((max(ys) - min(ys)) * 0.1, 0.1)
+            self.ax.set_xlim(min(xs) - pad_x, max(xs) + pad_x)
+            self.ax.set_ylim(min(ys) - pad_y, max(ys) + pad_y)
+
+        # Render the figure into an image
+        img = render_figure(self.fig)
+
+        # Store the image and prevent modifying the stored copy
+        img.setflags(write=False)
+        self.image = img
+
+        # Report the time spent if requested
+        if layout_engine.report:
+
+            print("[INFO] Drew {} graph in {:.1f} ms (layout: {}, {:.1f} ms)."
+                  .format(self.mode, (time.perf_counter() - start) * 1000,
+                          layout_engine.last_method,
+                          layout_engine.last_time * 1000))
+
+        return img
+
+    def rasterize(self, dpi):
+        """
+        Renders the current Figure into an image in a given resolution, e.g.
+        for saving a high-resolution capture, without changing the resolution
+        used for redrawing.
+
+        Parameters:
+            dpi: The resolution of the image as dots per inch.
+
+        Returns:
+            An image showing the graph.
+        """
+        # Return the latest image if the resolution is the same
+        if dpi == self.dpi and self.image is not None:
+
+            return self.image
+
+        # Render the Figure in the requested resolution and restore the
+        # original resolution
+        img = render_figure(self.fig, dpi=dpi)
+        self.fig.set_dpi(self.dpi)
+
+        return img
+
+    def export(self, fmt, dpi=None):
+        """
+        Saves the current Figure into a file format supported by matplotlib,
+        such as a vector format.
+
+        Parameters:
+            fmt: The file format, e.g. 'svg' or 'pdf'.
+            dpi: An optional resolution for raster formats and any raster
+                 elements.
+
+        Returns:
+            A bytes object containing the file.
+        """
+        return figure_bytes(self.fig, fmt, dpi=dpi)
+
+    def remove_layer(self, name):
+        """
+        Removes the artists in a layer from the Figure.
+
+        Parameters:
+            name: The name of the layer.
+
+        Returns:
+            None
+        """
+        if name not in self.layers:
+
+            return
+
+        for artist in self.layers.pop(name)[1]:
 
-    # Initialize a neato layout for the graph
-    pos = nx.nx_pydot.graphviz_layout(graph, prog='neato')
+            artist.remove()
 
-    # Generate a dictionary with nodes and their kind
-    node_types = nx.get_node_attributes(graph, 'kind')
+    def close(self):
+        """
+        Removes all artists from the Figure.
+
+        Returns:
+            None
+        """
+        for name in list(self.layers):
+
+            self.remove_layer(name)
+
+        self.image = None
+
+
+def graph_layers(graph, pos, mode='layout', draw_edges=True, labels=True):
+    """
+    Groups the elements of a graph into layers for drawing. Each layer has a
+    signature, which changes whenever the elements in the layer or their
+    positions change.
+
+    Parameters:
+        graph: A NetworkX Graph.
+        pos: Positions for the NetworkX Graph.
+        mode: A string indicating the selected drawing mode. Valid options are
+             'layout' (default), 'connectivity' and 'rst'.
+        draw_edges: A boolean indicating whether edges should be drawn.
+        labels: A boolean indicating whether labels should be drawn.
+
+    Returns:
+        An ordered dictionary mapping layer names to tuples of the signature
+        and a function, which draws the layer on a matplotlib Axis and returns
+        a list of artists.
+    """
+    # Set up a dictionary for the layers
+    layers = OrderedDict()
+
+    # Fetch the kind index of the graph, which groups the nodes by kind
+    index = get_kind_index(graph)
+
+    # Add a layer for each kind of node. RST relations are only drawn when
+    # annotating RST with edges.
+    for kind, style in node_styles.items():
+
+        if kind == 'relation' and not (mode == 'rst' and draw_edges):
+
+            continue
+
+        nodes = index.get_nodes(kind)
+
+        layers['nodes_' + kind] = (
+            tuple((n, tuple(pos[n])) for n in nodes),
+            partial(draw_layer, nx.draw_networkx_nodes, graph, pos,
+                    nodelist=nodes, alpha=1, **style))
+
+    # Add a layer for each kind of edge in the current mode
+    if draw_edges:
+
+        edge_list = list(graph.edges(data=True))
+
+        for i, (kinds, style) in enumerate(edge_styles[mode]):
+
+            # Filter the edges by their kind
+            edges = [(u, v) for u, v, d in edge_list
+                     if kinds is None or d.get('kind') in kinds]
+
+            layers['edges_{}'.format(i)] = (
+                tuple((u, v, tuple(pos[u]), tuple(pos[v])) for u, v in edges),
+                partial(draw_layer, nx.draw_networkx_edges, graph, pos,
+                        edgelist=edges, **style))
+
+    # Return the layers if labels are not needed
+    if not labels:
+
+        return layers
 
     # Create a label dictionary for nodes
     node_dict = get_node_dict(graph, kind='node')
 
-    # Create a label dictionary for grouping nodes
-    group_dict = get_node_dict(graph, kind='group')
+    # Fetch the alias registry of the graph
+    registry = get_registry(graph)
 
-    # Enumerate groups and use their numbers as labels for clarity
-    group_dict = {k: "G{}".format(i) for i, (k, v) in
-                  enumerate(group_dict.items(), start=1)}
+    # Use the aliases of grouping nodes as labels for clarity
+    group_dict = {k: a.upper() for a, k in
+                  registry.get_aliases('group').items()}
+
+    label_dicts = [('labels_nodes', node_dict), ('labels_groups', group_dict)]
 
     # If annotating RST structure, draw relations
     if mode == 'rst':
 
-        # Create a label dictionary for RST relations
-        rel_dict = get_node_dict(graph, kind='relation')
+        # Use the aliases of RST relations as labels for clarity
+        rel_dict = {k: a.upper() for a, k in
+                    registry.get_aliases('relation').items()}
+
+        label_dicts.append(('labels_relations', rel_dict))
+
+    # Add a layer for each set of labels
+    for name, label_dict in label_dicts:
+
+        layers[name] = (
+            tuple((n, l, tuple(pos[n])) for n, l in label_dict.items()),
+            partial(draw_layer, nx.draw_networkx_labels, graph, pos,
+                    font_size=10, labels=label_dict))
+
+    # Draw edge labels for nuclei and satellites, replacing the labels with
+    # 's' and 'n' for clarity and omitting grouping edges
+    if mode == 'rst':
+
+        edge_dict = {k: {'satellite': 's', 'nucleus': 'n'}.get(v, v) for k, v
+                     in nx.get_edge_attributes(graph, 'kind').items()
+                     if v != 'grouping'}
 
-        # Enumerate relations and use their numbers as labels for clarity
-        rel_dict = {k: "R{}".format(i) for i, (k, v) in
-                    enumerate(rel_dict.items(), start=1)}
+        layers['labels_edges'] = (
+            tuple((k, l, tuple(pos[k[0]]), tuple(pos[k[1]]))
+                  for k, l in edge_dict.items()),
+            partial(draw_layer, nx.draw_networkx_edge_labels, graph, pos,
+                    edge_labels=edge_dict))
 
-        # Get a dictionary of edge labels
-        edge_dict = nx.get_edge_attributes(graph, 'kind')
+    return layers
 
-        # Set up a temporary edge dict
-        temp_edge_dict = edge_dict.copy()
 
-        # Replace edge labels for clarity by looping over the temporary edge
-        # dict. Note that modifications are made on the actual edge dict.
-        for k, v in temp_edge_dict.items():
+def draw_layer(function, graph, pos, ax, **kwargs):
+    """
+    Draws a layer of a graph using a NetworkX drawing function.
 
-            # If the edge type is group, pop
-            if v == 'grouping':
+    Parameters:
+        function: A NetworkX drawing function.
+        graph: A NetworkX Graph.
+        pos: Positions for the NetworkX Graph.
+        ax: Matplotlib Figure Axis on which to draw.
+        kwargs: Keyword arguments passed to the drawing function.
 
-                edge_dict.pop(k)
+    Returns:
+        A list of artists added to the Axis.
+    """
+    # Skip empty layers
+    for arg in ['nodelist', 'edgelist', 'labels', 'edge_labels']:
 
-            # If the edge type is satellite, replace with 's'
-            if v == 'satellite':
+        if arg in kwargs and len(kwargs[arg]) == 0:
 
-                edge_dict[k] = 's'
+            return []
 
-            # If the edge type is nucleus, replace with 'n'
-            if v == 'nucleus':
+    # Draw the layer
+    artists = function(graph, pos, ax=ax, **kwargs)
 
-                edge_dict[k] = 'n'
+    # Collect the artists, which are returned as a single artist, a list or a
+    # dictionary depending on the function
+    if artists is None:
 
-    # Draw nodes present in the graph
-    draw_nodes(graph, pos=pos, ax=ax, node_types=node_types, mode=mode)
+        return []
 
-    # Draw labels for each node in the graph
-    nx.draw_networkx_labels(graph, pos, font_size=10, labels=node_dict)
+    if isinstance(artists, dict):
 
-    # Draw labels for groups
-    nx.draw_networkx_labels(graph, pos, font_size=10, labels=group_dict)
+        return list(artists.values())
 
-    if mode == 'rst':
+    if isinstance(artists, list):
 
-        # Draw labels for nodes representing for RST relations
-        nx.draw_networkx_labels(graph, pos, font_size=10, labels=rel_dict)
+        return artists
 
-        # Draw edge labels for nuclei and satellites
-        nx.draw_networkx_edge_labels(graph, pos, edge_labels=edge_dict)
+    return [artists]
 
-    # Remove margins from the graph and axes from the plot
-    fig.tight_layout(pad=0)
-    plt.axis('off')
 
-    # Save figure to file, read the file using OpenCV and remove the file
-    plt.savefig('temp.png')
-    img = cv2.imread('temp.png')
-    os.remove('temp.png')
+def draw_layout(path_to_image, annotation, height, hide=False, backend=None,
+                **kwargs):
+    """
+    Visualizes the AI2D layout annotation on the original input image. The
+    rendered images are cached, so that redrawing the same view, e.g. after
+    toggling the annotation or switching between annotation tasks, does not
+    render the image again.
+
+    Parameters:
+        path_to_image: Path to the original AI2D diagram image.
+        annotation: A dictionary containing AI2D annotation.
+        height: Target height of the image.
+        hide: A Boolean indicating whether to draw annotation or not.
+        backend: String indicating the backend used for drawing, valid options
+                 include 'matplotlib' and 'opencv'. Defaults to the value of
+                 layout_backend.
+
+    Optional parameters:
+        dpi: An integer indicating the resolution to use.
+        point: A list of layout elements to draw.
+
+    Returns:
+        An image with the AI2D annotation overlaid. The image is shared with
+        the cache and cannot be modified in place.
+    """
+    # Fetch the highlighted elements, converting lists into hashable tuples
+    point = kwargs.get('point')
+
+    if isinstance(point, list):
+
+        point = tuple(point)
+
+    # Use the default backend unless requested otherwise
+    backend = backend or layout_backend
+
+    # Set up a key for the cache
+    key = (path_to_image, height, kwargs.get('dpi'), hide, point, backend)
+
+    # Return the cached image if available and mark it as recently used
+    with layout_cache_lock:
+
+        if key in layout_cache:
+
+            layout_cache.move_to_end(key)
+
+            return layout_cache[key]
+
+    # Otherwise render the image and prevent modifying the cached copy
+    if backend == 'opencv':
+
+        img = render_layout_cv(path_to_image, annotation, height, hide=hide,
+                               **kwargs)
+
+    else:
+        img = render_layout(path_to_image, annotation, height, hide=hide,
+                            **kwargs)
 
-    # Close matplotlib figure
-    plt.close()
+    img.setflags(write=False)
+
+    # Add the image to the cache and remove the least recently used images if
+    # the cache is full
+    with layout_cache_lock:
+
+        layout_cache[key] = img
+
+        while len(layout_cache) > layout_cache_size:
+
+            layout_cache.popitem(last=False)
 
     return img
 
 
-def draw_layout(path_to_image, annotation, height, hide=False, **kwargs):
+def clear_layout_cache():
+    """
+    Removes all images from the cache of rendered layouts.
+
+    Returns:
+        None
+    """
+    with layout_cache_lock:
+
+        layout_cache.clear()
+
+
+def render_layout(path_to_image, annotation, height, hide=False, **kwargs):
     """
-    Visualizes the AI2D layout annotation on the original input image.
+    Renders the AI2D layout annotation on the original input image.
 
     Parameters:
         path_to_image: Path to the original AI2D diagram image.
@@ -128,6 +576,31 @@ def draw_layout(path_to_image, annotation, height, hide=False, **kwargs):
     Returns:
         An image with the AI2D annotation overlaid.
     """
+    # Build the Figure
+    fig = build_layout(path_to_image, annotation, height, hide=hide, **kwargs)
+
+    # Render the figure into an image, using the requested resolution if any
+    return render_figure(fig, dpi=kwargs.get('dpi'))
+
+
+def build_layout(path_to_image, annotation, height, hide=False, **kwargs):
+    """
+    Builds a matplotlib Figure showing the AI2D layout annotation on the
+    original input image, which may be rendered into an image or saved in a
+    vector format.
+
+    Parameters:
+        path_to_image: Path to the original AI2D diagram image.
+        annotation: A dictionary containing AI2D annotation.
+        height: Target height of the image.
+        hide: A Boolean indicating whether to draw annotation or not.
+
+    Optional parameters:
+        point: A list of layout elements to draw.
+
+    Returns:
+        A matplotlib Figure.
+    """
 
     # Load the diagram image and make a copy
     img, r = resize_img(path_to_image, height)
@@ -136,482 +609,400 @@ def draw_layout(path_to_image, annotation, height, hide=False, **kwargs):
     img = img[:, :, ::-1]
 
     # Create a matplotlib Figure
-    fig, ax = plt.subplots(1)
-    plt.tight_layout(pad=0)
+    fig, ax = layout_figure()
 
     # Add the image to the axis
     ax.imshow(img)
 
     # Hide grid and axes
-    plt.axis('off')
+    ax.axis('off')
 
     # Check if the annotation should be hidden
     if hide:
 
-        # Save figure to file, read the file using OpenCV and remove the file
-        plt.savefig('temp.png')
-        img = cv2.imread('temp.png')
-        os.remove('temp.png')
+        return fig
 
-        return img
+    # Get the geometry of the layout elements and scale it to the image
+    geometry = get_geometry(annotation)
+    polygons = geometry.polygons(r)
+    centroids = geometry.centroids(r)
 
-    # Draw blobs
-    try:
-        for b in annotation['blobs']:
+    # Check if some annotation should be highlighted
+    point = set(kwargs['point']) if kwargs and 'point' in kwargs else None
 
-            # Check if some annotation should be highlighted
-            if kwargs and 'point' in kwargs:
+    # Draw blobs, arrows and text blocks
+    for i, (e, label, kind) in enumerate(zip(geometry.keys, geometry.ids,
+                                             geometry.kinds)):
 
-                # Continue if the blob is not in the list of elements to draw
-                if b not in kwargs['point']:
+        # Continue if the element is not in the set of elements to draw
+        if point is not None and e not in point:
 
-                    continue
+            continue
 
-            # Get blob ID
-            blob_id = annotation['blobs'][b]['id']
+        # Get the colour for the element
+        colour = layout_colour_names[kind]
 
-            # Assign the blob points into a variable and convert into numpy
-            # array
-            points = np.array(annotation['blobs'][b]['polygon'], np.int32)
+        # Create a rectangle for text blocks from the start and end points
+        if kind == 'text':
 
-            # Scale the coordinates according to the ratio; convert to int
-            points = np.round(points * r, decimals=0).astype('int')
+            (startx, starty), (endx, endy) = polygons[i][[0, 2]]
 
-            # Creat arrow polygon
-            blob = patches.Polygon(points,
-                                   closed=True,
-                                   fill=False,
-                                   alpha=1,
-                                   color='orangered')
+            patch = patches.Rectangle((startx, starty),
+                                      endx - startx, endy - starty,
+                                      fill=False,
+                                      alpha=1,
+                                      color=colour,
+                                      edgecolor=None)
 
-            # Add arrow to the image
-            ax.add_patch(blob)
+        # Otherwise create a polygon for blobs and arrows
+        else:
+            patch = patches.Polygon(polygons[i],
+                                    closed=True,
+                                    fill=False,
+                                    alpha=1,
+                                    color=colour)
 
-            # Add artist for patch
-            ax.add_artist(blob)
+        # Add patch to the image
+        ax.add_patch(patch)
 
-            # Get centroid
-            cx, cy = np.round(points.mean(axis=0), decimals=0).astype('int')[:2]
+        # Annotate the element at its centroid
+        cx, cy = centroids[i]
 
-            # Annotate the blob
-            ann = ax.annotate(blob_id, (cx, cy), color='white',
-                              fontsize=10, ha='center', va='center')
+        ann = ax.annotate(label, (cx, cy), color='white',
+                          fontsize=10, ha='center', va='center')
 
-            # Add a box around the annotation
-            ann.set_bbox(dict(alpha=1, color='orangered', pad=0))
+        # Add a box around the annotation
+        ann.set_bbox(dict(alpha=1, color=colour, pad=0))
 
-    # Skip if there are no blobs to draw
-    except KeyError:
-        pass
+    return fig
 
-    # Draw arrows
-    try:
-        for a in annotation['arrows']:
 
-            # Check if some annotation should be highlighted
-            if kwargs and 'point' in kwargs:
+def draw_nodes(graph, pos, ax, node_types, draw_edges=True, mode='layout'):
+    """
+    A generic function for visualising the nodes in a graph.
 
-                # Continue if the blob is not in the list of elements to draw
-                if a not in kwargs['point']:
+    Parameters:
+        graph: A NetworkX Graph.
+        pos: Positions for the NetworkX Graph.
+        ax: Matplotlib Figure Axis on which to draw.
+        node_types: A dictionary of node types extracted from the Graph.
+        draw_edges: A boolean indicating whether edges should be drawn.
+        mode: A string indicating the selected drawing mode. Valid options are
+             'layout' (default), 'connectivity' and 'rst'.
 
-                    continue
+    Returns:
+         None
+    """
+    # Draw the layers for nodes and edges
+    for name, (signature, draw) in graph_layers(graph, pos, mode=mode,
+                                                draw_edges=draw_edges,
+                                                labels=False).items():
 
-            # Get arrow ID
-            arrow_id = annotation['arrows'][a]['id']
+        draw(ax)
 
-            # Assign the points into a variable
-            points = np.array(annotation['arrows'][a]['polygon'], np.int32)
 
-            # Scale the coordinates according to the ratio; convert to int
-            points = np.round(points * r, decimals=0).astype('int')
+def render_layout_cv(path_to_image, annotation, height, hide=False, **kwargs):
+    """
+    Renders the AI2D layout annotation on the original input image using
+    OpenCV. The output matches the size, colours and labels of the image
+    rendered using matplotlib in render_layout(), but draws the outlines and
+    labels directly onto the image.
 
-            # Create an arrow polygon
-            arrow = patches.Polygon(points,
-                                    closed=True,
-                                    fill=False,
-                                    alpha=1,
-                                    color='mediumseagreen')
+    Parameters:
+        path_to_image: Path to the original AI2D diagram image.
+        annotation: A dictionary containing AI2D annotation.
+        height: Target height of the image.
+        hide: A Boolean indicating whether to draw annotation or not.
 
-            # Add arrow to the image
-            ax.add_patch(arrow)
+    Optional parameters:
+        dpi: An integer indicating the resolution to use.
+        point: A list of layout elements to draw.
 
-            # Add artist for patch
-            ax.add_artist(arrow)
+    Returns:
+        An image with the AI2D annotation overlaid.
+    """
+    # Load the diagram image
+    img, r = resize_img(path_to_image, height)
 
-            # Get centroid
-            cx, cy = np.round(points.mean(axis=0), decimals=0).astype('int')[:2]
+    # Get the size of the default matplotlib Figure in the requested resolution
+    dpi = kwargs.get('dpi', plt.rcParams['figure.dpi'])
+    fig_w, fig_h = plt.rcParams['figure.figsize']
+    canvas_w, canvas_h = int(fig_w * dpi), int(fig_h * dpi)
 
-            # Annotate the arrow
-            ann = ax.annotate(arrow_id, (cx, cy), color='white', fontsize=10,
-                              ha='center', va='center')
+    # Get the area of the Figure covered by the axis in render_layout()
+    left, bottom, width, height = layout_axes_bounds()
+    ax_x, ax_w = left * canvas_w, width * canvas_w
+    ax_y, ax_h = (1 - bottom - height) * canvas_h, height * canvas_h
 
-            # Add a box around the annotation
-            ann.set_bbox(dict(alpha=1, color='mediumseagreen', pad=0))
+    # Calculate the ratio for fitting the image into the axis, and the offset
+    # for centering the image, as done by matplotlib
+    (h, w) = img.shape[:2]
+    s = min(ax_w / w, ax_h / h)
+    dim = (max(int(round(w * s)), 1), max(int(round(h * s)), 1))
+    x0 = int(round(ax_x + (ax_w - dim[0]) / 2))
+    y0 = int(round(ax_y + (ax_h - dim[1]) / 2))
 
-    # Skip if there are no arrows to draw
-    except KeyError:
-        pass
+    # Place the resized image onto a white canvas
+    canvas = np.full((canvas_h, canvas_w, 3), 255, dtype=np.uint8)
+    canvas[y0:y0 + dim[1], x0:x0 + dim[0]] = cv2.resize(
+        img, dim, interpolation=cv2.INTER_AREA)
 
-    # Draw text blocks
-    try:
-        for t in annotation['text']:
+    # Check if the annotation should be hidden
+    if hide:
 
-            # Check if some annotation should be highlighted
-            if kwargs and 'point' in kwargs:
+        return canvas
 
-                # Continue if the blob is not in the list of elements to draw
-                if t not in kwargs['point']:
+    # Set up the line width and font size to match 1 point lines and 10 point
+    # text in matplotlib. Capital letters are about 0.7 times the font size in
+    # matplotlib and 22 pixels high at scale 1 in OpenCV.
+    thickness = max(int(round(dpi / 72)), 1)
+    font_scale = 10 * dpi / 72 * 0.7 / 22
 
-                    continue
+    # Get the geometry of the layout elements, scale it to the image and then
+    # to the canvas, and add the offset of the image
+    geometry = get_geometry(annotation)
+    offset = np.array([x0, y0], dtype=np.int32)
+    points = np.round(geometry.scaled(r) * s).astype(np.int32) + offset
+    polygons = np.split(points, geometry.offsets[1:-1])
+    centroids = np.round(geometry.centroids(r) * s).astype(np.int32) + offset
 
-            # Get text ID
-            text_id = annotation['text'][t]['id']
+    # Select the elements to draw
+    point = set(kwargs['point']) if kwargs and 'point' in kwargs else None
+    selected = [i for i, e in enumerate(geometry.keys)
+                if point is None or e in point]
 
-            # Get the start and end points of the rectangle and cast
-            # them into tuples for drawing.
-            rect = np.array(annotation['text'][t]['rectangle'], np.int32)
+    # Draw the outlines for each type of element in a single call
+    for kind, colour in layout_colours.items():
 
-            # Get start and end coordinates, convert to int and cast into tuple
-            startx, starty = np.round(rect[0] * r, decimals=0).astype('int')
-            endx, endy = np.round(rect[1] * r, decimals=0).astype('int')
+        outlines = [polygons[i] for i in selected if geometry.kinds[i] == kind]
 
-            # Calculate bounding box width and height
-            width = endx - startx
-            height = endy - starty
+        if outlines:
 
-            # Define a rectangle and add to batch
-            rectangle = patches.Rectangle((startx, starty),
-                                          width, height,
-                                          fill=False,
-                                          alpha=1,
-                                          color='dodgerblue',
-                                          edgecolor=None)
+            cv2.polylines(canvas, outlines, True, colour, thickness,
+                          cv2.LINE_AA)
 
-            # Add patch to the image
-            ax.add_patch(rectangle)
+    # Collect the labels, their centres and colours
+    labels = [(geometry.ids[i], int(centroids[i][0]), int(centroids[i][1]),
+               layout_colours[geometry.kinds[i]]) for i in selected]
 
-            # Add artist object for rectangle
-            ax.add_artist(rectangle)
+    # Draw the labels in white on boxes of the same colour
+    for label, cx, cy, colour in labels:
 
-            # Get starting coordinates
-            x, y = rectangle.get_xy()
+        # Get the size of the label and centre the label
+        (tw, th), base = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX,
+                                         font_scale, 1)
+        x, y = cx - tw // 2, cy + th // 2
 
-            # Get coordinates for the centre; adjust positioning
-            cx = (x + rectangle.get_width() / 2.0)
-            cy = (y + rectangle.get_height() / 2.0)
+        # Draw the box and the label
+        cv2.rectangle(canvas, (x, y - th), (x + tw, y + base), colour, -1)
+        cv2.putText(canvas, label, (x, y), cv2.FONT_HERSHEY_SIMPLEX,
+                    font_scale, (255, 255, 255), 1, cv2.LINE_AA)
 
-            # Add annotation to the text box
-            ann = ax.annotate(text_id, (cx, cy), color='white',
-                              fontsize=10, ha='center', va='center')
+    return canvas
 
-            # Add a box around the annotation
-            ann.set_bbox(dict(alpha=1, color='dodgerblue', pad=0))
 
-    # Skip if there are no text boxes to draw
-    except KeyError:
-        pass
+def layout_axes_bounds():
+    """
+    Gets the position of the axis in the Figure created by render_layout(),
+    which is measured once and then cached.
 
-    # Check if a high-resolution image has been requested
-    if kwargs and 'dpi' in kwargs:
+    Returns:
+        A tuple of left, bottom, width and height of the axis as fractions of
+        the Figure size.
+    """
+    # Measure the position of the axis if not done already
+    if 'bounds' not in layout_axes:
 
-        # Save figure to file in the requested resolution
-        plt.savefig('temp.png', dpi=kwargs['dpi'])
+        # Set up the Figure as in render_layout() and fetch the position
+        fig, ax = layout_figure()
+        layout_axes['bounds'] = tuple(ax.get_position().bounds)
 
-        img = cv2.imread('temp.png')
-        os.remove('temp.png')
+    return layout_axes['bounds']
 
-        return img
 
-    # Save figure to file, read the file using OpenCV and remove the file
-    plt.savefig('temp.png')
-    img = cv2.imread('temp.png')
-    os.remove('temp.png')
+def layout_figure():
+    """
+    Sets up a matplotlib Figure for drawing layouts. The Figure is not managed
+    by pyplot, so it can be drawn outside the main thread and does not need to
+    be closed.
 
-    # Close the plot
-    plt.close()
+    Returns:
+        A matplotlib Figure and Axis.
+    """
+    # Set up the Figure and attach a canvas for rendering using Agg
+    fig = Figure()
+    FigureCanvasAgg(fig)
 
-    # Return the annotated image
-    return img
+    # Add an axis and remove margins
+    ax = fig.add_subplot(1, 1, 1)
+    fig.tight_layout(pad=0)
 
+    return fig, ax
 
-def draw_nodes(graph, pos, ax, node_types, draw_edges=True, mode='layout'):
+
+def figure_bytes(fig, fmt, dpi=None):
     """
-    A generic function for visualising the nodes in a graph.
+    Saves a matplotlib Figure into a file format in memory.
 
     Parameters:
-        graph: A NetworkX Graph.
-        pos: Positions for the NetworkX Graph.
-        ax: Matplotlib Figure Axis on which to draw.
-        node_types: A dictionary of node types extracted from the Graph.
-        draw_edges: A boolean indicating whether edges should be drawn.
-        mode: A string indicating the selected drawing mode. Valid options are
-             'layout' (default), 'connectivity' and 'rst'.
+        fig: A matplotlib Figure.
+        fmt: The file format, e.g. 'png', 'svg' or 'pdf'.
+        dpi: An optional resolution. By default, the resolution of the Figure
+             is used.
 
     Returns:
-         None
+        A bytes object containing the file.
     """
+    # Save the Figure into a buffer. Matplotlib restores the resolution of the
+    # Figure afterwards.
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt, dpi=dpi or fig.dpi)
+
+    return buffer.getvalue()
+
+
+def render_figure(fig, dpi=None):
+    """
+    Renders a matplotlib Figure into an image in memory, without writing the
+    figure to disk.
+
+    Parameters:
+        fig: A matplotlib Figure.
+        dpi: An optional integer indicating the resolution to use. By default,
+             the resolution of the Figure is used.
+
+    Returns:
+        The rendered image as a NumPy array in the BGR colourspace used by
+        OpenCV.
+    """
+    # Set the requested resolution
+    if dpi is not None:
+
+        fig.set_dpi(dpi)
+
+    # Fetch the canvas of the Figure. If the current backend does not render
+    # using Agg, attach an Agg canvas to the Figure.
+    canvas = fig.canvas
+
+    if not isinstance(canvas, FigureCanvasAgg):
+
+        canvas = FigureCanvasAgg(fig)
+
+    # Draw the Figure and fetch the pixels from the buffer of the canvas
+    canvas.draw()
+    img = np.asarray(canvas.buffer_rgba())
+
+    # Convert from RGBA to the BGR colourspace, which also copies the pixels out
+    # of the buffer of the canvas
+    return cv2.cvtColor(img, cv2.COLOR_RGBA2BGR)
+
+
+class ImageCache:
+    """
+    This class holds decoded diagram images and their resized variants in
+    memory, so that each image is read from disk and decoded only once.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        """
+        This function initializes the ImageCache class.
+
+        Parameters:
+            max_bytes: The memory budget of the cache in bytes.
 
-    # Draw nodes for text elements
-    try:
-        # Retrieve text nodes for the list of nodes
-        texts = [k for k, v in node_types.items() if v == 'text']
-
-        # Add the list of nodes to the graph
-        nx.draw_networkx_nodes(graph,
-                               pos,
-                               nodelist=texts,
-                               alpha=1,
-                               node_color='dodgerblue',
-                               ax=ax
-                               )
-
-    # Skip if there are no text nodes to draw
-    except KeyError:
-        pass
-
-    # Draw nodes for blobs
-    try:
-        # Retrieve blob nodes for the list of nodes
-        blobs = [k for k, v in node_types.items() if v == 'blobs']
-
-        # Add the list of nodes to the graph
-        nx.draw_networkx_nodes(graph,
-                               pos,
-                               nodelist=blobs,
-                               alpha=1,
-                               node_color='orangered',
-                               ax=ax
-                               )
-
-    # Skip if there are no blob nodes to draw
-    except KeyError:
-        pass
-
-    # Draw nodes for arrowheads
-    try:
-        # Retrieve arrowhead nodes for the list of nodes
-        arrowhs = [k for k, v in node_types.items() if v == 'arrowHeads']
-
-        # Add the list of arrowheads to the graph
-        nx.draw_networkx_nodes(graph,
-                               pos,
-                               nodelist=arrowhs,
-                               alpha=1,
-                               node_color='darkorange',
-                               ax=ax
-                               )
-
-    # Skip if there are no arrowheads to draw
-    except KeyError:
-        pass
-
-    # Draw nodes for arrows
-    try:
-        # Retrieve arrow nodes for the list of nodes
-        arrows = [k for k, v in node_types.items() if v == 'arrows']
-
-        # Add the list of arrows to the graph
-        nx.draw_networkx_nodes(graph,
-                               pos,
-                               nodelist=arrows,
-                               alpha=1,
-                               node_color='mediumseagreen',
-                               ax=ax
-                               )
-
-    # Skip if there are no arrows to draw
-    except KeyError:
-        pass
-
-    # Draw nodes for image constants
-    try:
-        # Retrieve image constants (in most cases, only one per diagram)
-        constants = [k for k, v in node_types.items() if
-                     v == 'imageConsts']
-
-        # Add the image constants to the graph
-        nx.draw_networkx_nodes(graph,
-                               pos,
-                               nodelist=constants,
-                               alpha=1,
-                               node_color='palegoldenrod',
-                               ax=ax
-                               )
-
-    # Skip if there are no image constants to draw
-    except KeyError:
-        pass
-
-    # Draw nodes for groups
-    try:
-        # Retrieve group nodes from the list of nodes
-        groups = [k for k, v in node_types.items() if v == 'group']
-
-        # Add the group nodes to the graph
-        nx.draw_networkx_nodes(graph,
-                               pos,
-                               nodelist=groups,
-                               alpha=1,
-                               node_color='navajowhite',
-                               ax=ax
-                               )
-
-    # Skip if there are no group nodes to draw
-    except KeyError:
-        pass
-
-    # Check drawing mode, continue with RST
-    if mode == 'rst' and draw_edges:
-
-        # Draw nodes for RST relations
-        try:
-            # Retrieve relations from the list of nodes
-            relations = [k for k, v in node_types.items() if v == 'relation']
-
-            # Add the relations to the graph
-            nx.draw_networkx_nodes(graph,
-                                   pos,
-                                   nodelist=relations,
-                                   alpha=1,
-                                   linewidths=4,
-                                   node_color='peru',
-                                   node_shape='s',
-                                   ax=ax
-                                   )
-
-        # Skip if there are no relations to draw
-        except KeyError:
-            pass
-
-        # Get edge list
-        edge_list = graph.edges(data=True)
-
-        # Filter the edge list for satellite edges
-        satellites = [(u, v, d) for (u, v, d) in edge_list
-                      if d['kind'] == 'satellite']
-
-        # Draw edges for satellites without arrows
-        nx.draw_networkx_edges(graph,
-                               pos,
-                               satellites,
-                               alpha=0.75,
-                               arrows=False,
-                               ax=ax)
-
-        # Filter the edge list for nuclei edges
-        nuclei = [(u, v, d) for (u, v, d) in edge_list
-                  if d['kind'] == 'nucleus']
-
-        # Draw edges for nuclei with arrows
-        nx.draw_networkx_edges(graph,
-                               pos,
-                               nuclei,
-                               alpha=0.75,
-                               arrows=True,
-                               ax=ax)
-
-        # Draw grouping edges
-        try:
-            # Fetch a list of grouping edges (which do not have any attributes!)
-            grouping_edges = [(u, v, d) for (u, v, d) in edge_list if
-                              d['kind'] == 'grouping']
-
-            # Draw edges between elements and their grouping nodes
-            nx.draw_networkx_edges(graph,
-                                   pos,
-                                   grouping_edges,
-                                   alpha=0.5,
-                                   style='dotted',
-                                   arrows=False,
-                                   ax=ax)
-
-        # Skip if no grouping edges are found
-        except KeyError:
-
-            pass
-
-    # Check drawing mode, finish with connectivity
-    if mode == 'connectivity' and draw_edges:
-
-        # Get a list of all edges
-        all_edges = list(graph.edges(data=True))
-
-        # Draw undirectional edges
-        try:
-
-            # Filter the edges, retaining only undirectional edges
-            undirectional = [(u, v, d) for u, v, d in all_edges
-                             if d['kind'] == 'undirectional']
-
-            # Draw edges without arrows
-            nx.draw_networkx_edges(graph,
-                                   pos,
-                                   undirectional,
-                                   alpha=0.75,
-                                   arrows=False,
-                                   ax=ax
-                                   )
-
-        # Skip if no undirectional arrows are found
-        except KeyError:
-
-            pass
-
-        # Draw other edges
-        try:
-
-            # Filter the edges, retaining only directional/bidirectional edges
-            directional = [(u, v, d) for (u, v, d) in all_edges
-                           if d['kind'] in ['directional', 'bidirectional']]
-
-            # Draw edges with arrows
-            nx.draw_networkx_edges(graph,
-                                   pos,
-                                   directional,
-                                   alpha=0.75,
-                                   arrows=True,
-                                   ax=ax
-                                   )
-
-        # Skip if no directional/bidirectional edges are found
-        except KeyError:
-
-            pass
-
-        # Draw grouping edges
-        try:
-            # Fetch a list of grouping edges (which do not have any attributes!)
-            grouping_edges = [(u, v, d) for (u, v, d) in all_edges if
-                              d['kind'] == 'grouping']
-
-            # Draw edges between elements and their grouping nodes
-            nx.draw_networkx_edges(graph,
-                                   pos,
-                                   grouping_edges,
-                                   alpha=0.5,
-                                   style='dotted',
-                                   arrows=False,
-                                   ax=ax)
-
-        # Skip if no grouping edges are found
-        except KeyError:
-
-            pass
-
-    # Otherwise, draw standard edges if requested
-    if draw_edges and mode == 'layout':
-
-        # Draw edges between nodes
-        nx.draw_networkx_edges(graph,
-                               pos,
-                               alpha=0.75,
-                               ax=ax
-                               )
+        Returns:
+            An ImageCache object.
+        """
+        self.max_bytes = max_bytes
+
+        # Set up a dictionary mapping keys to images and their ratios, ordered
+        # from the least to the most recently used, and a count of the bytes
+        # used by the images.
+        self.images = OrderedDict()
+        self.nbytes = 0
+
+        # Set up a lock, so that the cache may be used in several threads
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Fetches an image from the cache.
+
+        Parameters:
+            key: A hashable identifying the image.
+
+        Returns:
+            A tuple of the image and the ratio used for resizing, or None if
+            the image is not in the cache.
+        """
+        with self.lock:
+
+            if key not in self.images:
+
+                return None
+
+            # Mark the image as recently used
+            self.images.move_to_end(key)
+
+            return self.images[key]
+
+    def put(self, key, img, r):
+        """
+        Adds an image to the cache, removing the least recently used images if
+        the memory budget is exceeded. The image is marked as read-only.
+
+        Parameters:
+            key: A hashable identifying the image.
+            img: The image as a NumPy array.
+            r: The ratio used for resizing the image.
+
+        Returns:
+            None
+        """
+        # Skip images that do not fit into the cache at all
+        if img.nbytes > self.max_bytes:
+
+            return
+
+        # Prevent modifying the cached image
+        img.setflags(write=False)
+
+        with self.lock:
+
+            # Replace any previous image with the same key
+            if key in self.images:
+
+                self.nbytes -= self.images.pop(key)[0].nbytes
+
+            self.images[key] = (img, r)
+            self.nbytes += img.nbytes
+
+            # Remove the least recently used images until within the budget
+            while self.nbytes > self.max_bytes:
+
+                self.nbytes -= self.images.popitem(last=False)[1][0].nbytes
+
+    def clear(self):
+        """
+        Removes all images from the cache.
+
+        Returns:
+            None
+        """
+        with self.lock:
+
+            self.images.clear()
+            self.nbytes = 0
+
+
+# Set up a cache for diagram images
+image_cache = ImageCache()
 
 
 def resize_img(path_to_image, height):
     """
-    Resizes an image.
+    Resizes an image. The decoded image and each resized version are cached,
+    so the returned image is shared with the cache and cannot be modified in
+    place.
 
     Parameters:
         path_to_image: Path to the image to resize.
@@ -620,9 +1011,29 @@ def resize_img(path_to_image, height):
     Returns:
         The resized image and the ratio used for resizing.
     """
+    # Include the modification time in the key, so that images changed on
+    # disk are read again
+    mtime = os.path.getmtime(path_to_image)
 
-    # Load the diagram image and make a copy
-    img = cv2.imread(path_to_image).copy()
+    # Return the resized image if cached
+    cached = image_cache.get((path_to_image, mtime, height))
+
+    if cached is not None:
+
+        return cached
+
+    # Fetch the decoded image from the cache
+    cached = image_cache.get((path_to_image, mtime, None))
+
+    if cached is not None:
+
+        img = cached[0]
+
+    # Otherwise load the diagram image and add it to the cache
+    else:
+        img = cv2.imread(path_to_image)
+
+        image_cache.put((path_to_image, mtime, None), img, 1.0)
 
     # Calculate aspect ratio (target width / current width) and new
     # width of the preview image.
@@ -635,5 +1046,8 @@ def resize_img(path_to_image, height):
     # Resize the preview image
     img = cv2.resize(img, dim, interpolation=cv2.INTER_AREA)
 
+    # Add the resized image to the cache
+    image_cache.put((path_to_image, mtime, height), img, r)
+
     # Return image
     return img, r
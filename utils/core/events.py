@@ -0,0 +1,474 @@
+# -*- coding: utf-8 -*-
+
+from .history import unfreeze
+from .registry import apply_changes, get_registry, missing
+from .storage import status_flags
+
+import json
+import networkx as nx
+import os
+import time
+
+
+# Define the types of events written into the event log of a diagram
+event_types = ['open', 'snapshot', 'command', 'save']
+
+# Define the graphs annotated in each mode, and the flags marking the
+# annotation of the graph as complete
+mode_graphs = {'layout': 'layout_graph',
+               'connectivity': 'connectivity_graph',
+               'rst': 'rst_graph'}
+mode_flags = {'layout': 'group_complete',
+              'connectivity': 'connectivity_complete',
+              'rst': 'rst_complete'}
+
+# Define the short codes used for storing the changes made to the graphs
+op_codes = {'node+': 'n+', 'node-': 'n-', 'edge+': 'e+', 'edge-': 'e-',
+            'attr': 'a', 'edge~': 'e~'}
+
+
+def encode_change(change):
+    """
+    Encodes a change applied to a graph as a list for the event log. Only the
+    information needed for applying the change again is kept, that is, the
+    attributes of removed nodes and edges and the old values of attributes
+    are dropped.
+
+    Parameters:
+        change: A change as defined in apply_changes in core/registry.py.
+
+    Returns:
+        A list beginning with the code of the change, e.g. ['n-', 'B0'].
+    """
+    code = op_codes[change[0]]
+
+    if change[0] == 'node+':
+
+        node, attributes, alias = change[1:]
+
+        return [code, node, attributes] + ([alias] if alias else [])
+
+    if change[0] == 'node-':
+
+        return [code, change[1]]
+
+    if change[0] == 'edge+':
+
+        return [code] + list(change[1:])
+
+    if change[0] == 'edge-':
+
+        return [code] + list(change[1:4])
+
+    if change[0] == 'attr':
+
+        node, name, old, new = change[1:]
+
+        return [code, node, name] + ([] if new is missing else [new])
+
+    u, v, key, old, new = change[1:]
+
+    return [code, u, v, key, new]
+
+
+def decode_change(op):
+    """
+    Decodes a change stored in the event log.
+
+    Parameters:
+        op: A list encoded using encode_change.
+
+    Returns:
+        A change as defined in apply_changes in core/registry.py.
+    """
+    code = op[0]
+
+    if code == 'n+':
+
+        return ('node+', op[1], op[2], op[3] if len(op) > 3 else None)
+
+    if code == 'n-':
+
+        return ('node-', op[1], None, None)
+
+    if code == 'e+':
+
+        return ('edge+', op[1], op[2], op[3], op[4])
+
+    if code == 'e-':
+
+        return ('edge-', op[1], op[2], op[3], None)
+
+    if code == 'a':
+
+        return ('attr', op[1], op[2], missing,
+                op[3] if len(op) > 3 else missing)
+
+    if code == 'e~':
+
+        return ('edge~', op[1], op[2], op[3], None, op[4])
+
+    raise ValueError("Unknown change in event log: {}".format(op))
+
+
+def snapshot_ops(graph):
+    """
+    Encodes the current state of a graph as a list of changes that build the
+    graph from an empty graph.
+
+    Parameters:
+        graph: A NetworkX Graph.
+
+    Returns:
+        A list of changes encoded using encode_change.
+    """
+    registry = get_registry(graph)
+
+    ops = [encode_change(('node+', n, dict(d), registry.alias(n)))
+           for n, d in graph.nodes(data=True)]
+
+    # Include the keys of edges in multigraphs
+    if graph.is_multigraph():
+
+        edges = graph.edges(keys=True, data=True)
+
+    else:
+        edges = [(u, v, None, d) for u, v, d in graph.edges(data=True)]
+
+    ops.extend(encode_change(('edge+', u, v, k, dict(d)))
+               for u, v, k, d in edges)
+
+    return ops
+
+
+def to_json(value):
+    """
+    Converts values that the json module cannot serialize, such as NumPy
+    numbers and arrays, into Python objects.
+
+    Parameters:
+        value: The value to convert.
+
+    Returns:
+        A Python object.
+    """
+    if hasattr(value, 'tolist'):
+
+        return value.tolist()
+
+    raise TypeError("Cannot store {} in the event log.".format(type(value)))
+
+
+class EventLog:
+    """
+    This class writes the edits made to the graphs of a diagram into an
+    append-only log with one JSON object per line. Each command entered by
+    the user is written as an event holding the changes made to the graph,
+    and the state of each graph is written as a snapshot when its annotation
+    begins. The log can be replayed for rebuilding the graphs, e.g. for
+    recovering the work done after the diagram was last saved.
+    """
+    def __init__(self, path):
+        """
+        This function initializes the EventLog class.
+
+        Parameters:
+            path: Path to the file holding the log.
+
+        Returns:
+            An EventLog object.
+        """
+        self.path = path
+
+        # Set up a flag for tracking whether the end of the log has been
+        # checked for a truncated event before appending
+        self.repaired = False
+
+    def repair(self):
+        """
+        Removes a truncated event from the end of the log, which is left if
+        the annotator was interrupted while writing the event. Otherwise the
+        next event would be appended to the same line.
+
+        Returns:
+            None
+        """
+        if not os.path.isfile(self.path):
+
+            return
+
+        with open(self.path, 'r+b') as log:
+
+            # Find the end of the last complete line, reading the log
+            # backwards in blocks
+            end = log.seek(0, os.SEEK_END)
+            offset = end
+
+            while offset > 0:
+
+                start = max(0, offset - 4096)
+                log.seek(start)
+                block = log.read(offset - start)
+
+                if b'\n' in block:
+
+                    offset = start + block.rindex(b'\n') + 1
+
+                    break
+
+                offset = start
+
+            # Truncate the log after the last complete line
+            if offset < end:
+
+                print("[WARNING] Removing a truncated event from the end of "
+                      "{}.".format(self.path))
+
+                log.truncate(offset)
+
+                log.flush()
+                os.fsync(log.fileno())
+
+    def append(self, event_type, **fields):
+        """
+        Appends an event to the log, making sure that the event has reached
+        the disk.
+
+        Parameters:
+            event_type: The type of the event, as defined in event_types.
+            fields: The fields of the event.
+
+        Returns:
+            None
+        """
+        event = dict(time=round(time.time(), 3), type=event_type, **fields)
+
+        # Create the directory for the log if needed
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        # Remove a truncated event before appending the first event
+        if not self.repaired:
+
+            self.repair()
+            self.repaired = True
+
+        with open(self.path, 'a', encoding='utf-8') as log:
+
+            log.write(json.dumps(event, separators=(',', ':'),
+                                 default=to_json) + '\n')
+
+            log.flush()
+            os.fsync(log.fileno())
+
+    def open(self, review):
+        """
+        Logs the opening of the diagram for annotation.
+
+        Parameters:
+            review: A Boolean defining whether review mode is active or not.
+
+        Returns:
+            None
+        """
+        self.append('open', review=review)
+
+    def snapshot(self, mode, graph):
+        """
+        Logs the state of a graph.
+
+        Parameters:
+            mode: The mode in which the graph is annotated, i.e. 'layout',
+                  'connectivity' or 'rst'.
+            graph: A NetworkX Graph.
+
+        Returns:
+            None
+        """
+        self.append('snapshot', graph=mode, cls=type(graph).__name__,
+                    ops=snapshot_ops(graph))
+
+    def command(self, mode, command, changes):
+        """
+        Logs a command entered by the user and the changes it made.
+
+        Parameters:
+            mode: The mode in which the command was entered.
+            command: The name of the command, e.g. 'group' or 'rm'.
+            changes: A list of changes as defined in apply_changes.
+
+        Returns:
+            None
+        """
+        fields = {'graph': mode, 'command': command}
+
+        if changes:
+
+            fields['ops'] = [encode_change(c) for c in changes]
+
+        self.append('command', **fields)
+
+    def save(self, diagram):
+        """
+        Logs the saving of the diagram to disk. Events logged before have
+        been included in the saved diagram.
+
+        Parameters:
+            diagram: A Diagram object.
+
+        Returns:
+            None
+        """
+        self.append('save', status={f: bool(getattr(diagram, f))
+                                    for f in status_flags})
+
+    def read(self):
+        """
+        Reads the events in the log.
+
+        Returns:
+            A list of events, which are dictionaries.
+        """
+        events = []
+
+        # Return if the log does not exist
+        if not os.path.isfile(self.path):
+
+            return events
+
+        with open(self.path, encoding='utf-8') as log:
+
+            for line in log:
+
+                try:
+                    events.append(json.loads(line))
+
+                # An event may be truncated if the annotator was interrupted
+                # while writing to the log: skip the event and continue with
+                # the events appended after it.
+                except ValueError:
+
+                    print("[WARNING] Skipping a truncated event in {}."
+                          .format(self.path))
+
+                    continue
+
+        return events
+
+    def recover(self, diagram):
+        """
+        Replays the events logged after the diagram was last saved into the
+        diagram, recovering work that was not saved, e.g. if the annotator
+        was interrupted.
+
+        Parameters:
+            diagram: A Diagram object.
+
+        Returns:
+            The number of commands recovered.
+        """
+        events = self.read()
+
+        # Find the events after the latest save
+        saves = [i for i, e in enumerate(events) if e['type'] == 'save']
+        events = events[saves[-1] + 1:] if saves else events
+
+        return replay_events(events, diagram)
+
+
+def replay_events(events, diagram):
+    """
+    Replays events from an event log into the graphs of a diagram. Snapshots
+    replace the graph with the logged state, and the changes made by commands
+    are applied to the current graph. Graphs marked as complete using the
+    command 'done' are frozen.
+
+    Parameters:
+        events: A list of events read using EventLog.
+        diagram: A Diagram object, or any object with the attributes for the
+                 graphs and flags defined in mode_graphs and mode_flags.
+
+    Returns:
+        The number of commands replayed.
+    """
+    commands = 0
+
+    for event in events:
+
+        if event['type'] not in ('snapshot', 'command'):
+
+            continue
+
+        mode = event['graph']
+        graph = getattr(diagram, mode_graphs[mode])
+
+        # Build a new graph from the snapshot
+        if event['type'] == 'snapshot':
+
+            graph = getattr(nx, event['cls'])()
+            setattr(diagram, mode_graphs[mode], graph)
+
+        # Skip commands for graphs that have not been logged
+        elif graph is None:
+
+            continue
+
+        else:
+            commands += 1
+
+            # Graphs are frozen when their annotation is marked as complete.
+            # Commands logged after must have been entered in review mode.
+            unfreeze(graph)
+
+        apply_changes(graph, [decode_change(op)
+                              for op in event.get('ops', [])])
+
+        # Mark the annotation as complete if requested
+        if event.get('command') == 'done':
+
+            setattr(diagram, mode_flags[mode], True)
+            nx.freeze(graph)
+
+    return commands
+
+
+def log_save(diagram, output_path, image_name):
+    """
+    Logs the saving of a diagram into its event log. The save is logged also
+    when the log is not in use, if the diagram has been annotated using a log
+    earlier, so that the events logged before are not recovered over the
+    saved diagram later.
+
+    Parameters:
+        diagram: A Diagram object.
+        output_path: Path to the output file or directory of shards.
+        image_name: The filename of the diagram image, e.g. 1132.png.
+
+    Returns:
+        None
+    """
+    log = diagram.event_log
+
+    if log is None:
+
+        log = EventLog(events_path(output_path, image_name))
+
+    # Do not create logs for diagrams that have not been annotated using a log
+    if os.path.isfile(log.path):
+
+        log.save(diagram)
+
+
+def events_path(output_path, image_name):
+    """
+    Gets the path to the event log of a diagram, which is stored in a
+    directory next to the output file.
+
+    Parameters:
+        output_path: Path to the output file or directory of shards.
+        image_name: The filename of the diagram image, e.g. 1132.png.
+
+    Returns:
+        The path to the event log.
+    """
+    return os.path.join(os.path.normpath(output_path) + '.events',
+                        image_name + '.jsonl')
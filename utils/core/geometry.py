@@ -0,0 +1,653 @@
+# -*- coding: utf-8 -*-
+
+from .parse import get_index
+from collections import OrderedDict
+
+import numpy as np
+import threading
+
+
+# Define the types of layout elements with geometry, in the order drawn
+geometry_kinds = ['blobs', 'arrows', 'text']
+
+# Set up a cache for geometry tables, which maps the identity of annotation
+# dictionaries to the dictionary and its table
+geometry_cache = OrderedDict()
+geometry_cache_size = 64
+geometry_cache_lock = threading.Lock()
+
+
+class GeometryTable:
+    """
+    This class holds the geometry of all layout elements in a diagram as NumPy
+    arrays. The polygons of blobs and arrows, and the corners of text boxes,
+    are stored in a single buffer of points with offsets marking where each
+    element begins, so that measures for all elements can be computed at once.
+    """
+    def __init__(self, annotation):
+        """
+        This function initializes the GeometryTable class.
+
+        Parameters:
+            annotation: A dictionary containing AI2D annotation.
+
+        Returns:
+            A GeometryTable object.
+        """
+        # Set up lists for the element keys, their identifiers, kinds and
+        # points
+        self.keys, self.ids, self.kinds, points = [], [], [], []
+
+        # Set up a list for the rectangles of text boxes
+        rectangles = []
+
+        # Fetch the elements from the index of the annotation
+        index = get_index(annotation)
+
+        for kind in geometry_kinds:
+
+            for k in index.of_kind(kind):
+
+                # Store text boxes as rectangles and as polygons of four
+                # corners
+                if kind == 'text':
+
+                    rect = np.array(index.geometry[k], np.int32)[:, :2]
+                    (sx, sy), (ex, ey) = rect
+                    polygon = np.array([[sx, sy], [ex, sy], [ex, ey],
+                                        [sx, ey]], np.int32)
+
+                    rectangles.append(rect)
+
+                else:
+                    polygon = np.array(index.geometry[k],
+                                       np.int32).reshape(-1, 2)
+
+                # Skip elements without any points
+                if len(polygon) == 0:
+
+                    continue
+
+                self.keys.append(k)
+                self.ids.append(index.labels[k])
+                self.kinds.append(kind)
+                points.append(polygon)
+
+        # Convert the kinds into an array for selecting elements
+        self.kinds = np.array(self.kinds, dtype=object)
+
+        # Concatenate the points into a single buffer and store the offsets
+        self.points = np.concatenate(points) if points else \
+            np.zeros((0, 2), np.int32)
+        self.counts = np.array([len(p) for p in points], dtype=np.int64)
+        self.offsets = np.zeros(len(points) + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(self.counts)
+
+        # Store the rectangles of text boxes as an array of start and end
+        # points
+        self.rectangles = np.array(rectangles, np.int32).reshape(-1, 2, 2)
+
+        # Store the index of the next point in each polygon for computing
+        # areas
+        self.next_points = np.arange(len(self.points)) + 1
+        self.next_points[self.offsets[1:] - 1] = self.offsets[:-1]
+
+    def __len__(self):
+        """
+        Returns the number of elements in the table.
+        """
+        return len(self.keys)
+
+    def select(self, kind):
+        """
+        Gets the positions of elements of a given kind.
+
+        Parameters:
+            kind: A string indicating the kind, i.e. 'blobs', 'arrows' or
+                  'text'.
+
+        Returns:
+            An array of positions.
+        """
+        return np.flatnonzero(self.kinds == kind)
+
+    def scaled(self, r=1.0):
+        """
+        Scales the points of all elements and rounds them to integers.
+
+        Parameters:
+            r: The ratio used for scaling.
+
+        Returns:
+            An integer array of points.
+        """
+        return np.round(self.points * r, decimals=0).astype('int')
+
+    def polygons(self, r=1.0):
+        """
+        Gets the scaled points of each element.
+
+        Parameters:
+            r: The ratio used for scaling.
+
+        Returns:
+            A list of integer arrays, one for each element.
+        """
+        return np.split(self.scaled(r), self.offsets[1:-1])
+
+    def centroids(self, r=1.0):
+        """
+        Calculates the centroid of each element from its scaled points.
+
+        Parameters:
+            r: The ratio used for scaling.
+
+        Returns:
+            An integer array of centroids.
+        """
+        if len(self) == 0:
+
+            return np.zeros((0, 2), dtype='int')
+
+        sums = np.add.reduceat(self.scaled(r), self.offsets[:-1], axis=0)
+
+        return np.round(sums / self.counts[:, None], decimals=0).astype('int')
+
+    def bboxes(self, r=1.0):
+        """
+        Calculates the bounding box of each element from its scaled points.
+
+        Parameters:
+            r: The ratio used for scaling.
+
+        Returns:
+            An integer array of minimum x, minimum y, maximum x and maximum y.
+        """
+        if len(self) == 0:
+
+            return np.zeros((0, 4), dtype='int')
+
+        points = self.scaled(r)
+        mins = np.minimum.reduceat(points, self.offsets[:-1], axis=0)
+        maxs = np.maximum.reduceat(points, self.offsets[:-1], axis=0)
+
+        return np.hstack([mins, maxs])
+
+    def areas(self, r=1.0):
+        """
+        Calculates the area of each element using the shoelace formula.
+
+        Parameters:
+            r: The ratio used for scaling.
+
+        Returns:
+            A float array of areas.
+        """
+        if len(self) == 0:
+
+            return np.zeros(0)
+
+        points = self.points * r
+        following = points[self.next_points]
+
+        # Calculate the cross product of each point and the following point
+        cross = points[:, 0] * following[:, 1] - following[:, 0] * points[:, 1]
+
+        return np.abs(np.add.reduceat(cross, self.offsets[:-1])) / 2
+
+
+def get_geometry(annotation):
+    """
+    Gets the geometry table for an annotation dictionary, building the table
+    only once for each dictionary.
+
+    Parameters:
+        annotation: A dictionary containing AI2D annotation.
+
+    Returns:
+        A GeometryTable object.
+    """
+    key = id(annotation)
+
+    # Return the cached table if it belongs to the same dictionary. The cache is
+    # also used by the thread preparing upcoming diagrams, so access is locked.
+    with geometry_cache_lock:
+
+        if key in geometry_cache and geometry_cache[key][0] is annotation:
+
+            geometry_cache.move_to_end(key)
+
+            return geometry_cache[key][1]
+
+    # Otherwise build the table and add it to the cache. The dictionary is kept
+    # in the cache, so that its identity is not reused by another dictionary.
+    table = GeometryTable(annotation)
+
+    with geometry_cache_lock:
+
+        # Use the table built by another thread in the meantime, if any
+        if key in geometry_cache and geometry_cache[key][0] is annotation:
+
+            return geometry_cache[key][1]
+
+        geometry_cache[key] = (annotation, table)
+
+        while len(geometry_cache) > geometry_cache_size:
+
+            geometry_cache.popitem(last=False)
+
+    return table
+
+
+class SpatialIndex:
+    """
+    This class indexes the bounding boxes of the layout elements in a diagram
+    using a uniform grid, in which each cell lists the elements whose bounding
+    boxes overlap the cell. Queries only examine the elements in the cells
+    covered by the query, which are then tested exactly using NumPy.
+    """
+    def __init__(self, annotation):
+        """
+        This function initializes the SpatialIndex class.
+
+        Parameters:
+            annotation: A dictionary containing AI2D annotation.
+
+        Returns:
+            A SpatialIndex object.
+        """
+        # Get the geometry of the layout elements
+        geometry = get_geometry(annotation)
+
+        self.keys = list(geometry.keys)
+        self.kinds = geometry.kinds
+        self.positions = {k: i for i, k in enumerate(self.keys)}
+
+        # Store the bounding boxes as minimum x, minimum y, maximum x and
+        # maximum y
+        self.bboxes = geometry.bboxes().astype(np.float64)
+
+        # Define the extent of the grid, which covers all elements
+        if len(self.keys) > 0:
+
+            self.origin = self.bboxes[:, :2].min(axis=0)
+            extent = self.bboxes[:, 2:].max(axis=0) - self.origin
+
+        else:
+            self.origin = np.zeros(2)
+            extent = np.zeros(2)
+
+        # Use roughly as many cells as there are elements
+        side = max(int(np.ceil(np.sqrt(len(self.keys)))), 1)
+        self.cell = max(float(extent.max()) / side, 1.0)
+        self.shape = np.floor(extent / self.cell).astype(np.int64) + 1
+
+        # Get the range of cells covered by each element
+        first, last = self.cell_range(self.bboxes)
+
+        # List the cells covered by each element
+        cells, items = [], []
+
+        for i in range(len(self.keys)):
+
+            xs = np.arange(first[i, 0], last[i, 0] + 1)
+            ys = np.arange(first[i, 1], last[i, 1] + 1)
+            covered = (ys[:, None] * self.shape[0] + xs[None, :]).ravel()
+
+            cells.append(covered)
+            items.append(np.full(len(covered), i, dtype=np.int64))
+
+        cells = np.concatenate(cells) if cells else np.zeros(0, np.int64)
+        items = np.concatenate(items) if items else np.zeros(0, np.int64)
+
+        # Sort the elements by cell and store the offsets where each cell
+        # begins
+        order = np.argsort(cells, kind='stable')
+        self.items = items[order]
+        self.starts = np.searchsorted(cells[order],
+                                      np.arange(self.shape.prod() + 1))
+
+    def __len__(self):
+        """
+        Returns the number of elements in the index.
+        """
+        return len(self.keys)
+
+    def cell_range(self, boxes):
+        """
+        Gets the range of grid cells covered by boxes, clipped to the grid.
+
+        Parameters:
+            boxes: An array of minimum x, minimum y, maximum x and maximum y.
+
+        Returns:
+            Arrays of the first and last cells along x and y for each box.
+        """
+        first = np.floor((boxes[:, :2] - self.origin) / self.cell)
+        last = np.floor((boxes[:, 2:] - self.origin) / self.cell)
+
+        first = np.clip(first, 0, self.shape - 1).astype(np.int64)
+        last = np.clip(last, 0, self.shape - 1).astype(np.int64)
+
+        return first, last
+
+    def candidates(self, first, last):
+        """
+        Gets the elements listed in a rectangular range of grid cells.
+
+        Parameters:
+            first: The first cell along x and y.
+            last: The last cell along x and y.
+
+        Returns:
+            An array of element positions.
+        """
+        rows = [self.items[self.starts[y * self.shape[0] + first[0]]:
+                           self.starts[y * self.shape[0] + last[0] + 1]]
+                for y in range(first[1], last[1] + 1)]
+
+        return np.unique(np.concatenate(rows)) if rows else \
+            np.zeros(0, np.int64)
+
+    def query(self, boxes, contain=False, kind=None):
+        """
+        Finds the elements whose bounding boxes intersect or lie within boxes.
+
+        Parameters:
+            boxes: A list or an array of boxes as minimum x, minimum y, maximum
+                   x and maximum y.
+            contain: A Boolean indicating whether the elements must lie within
+                     the boxes or only intersect them.
+            kind: An optional kind of element to return, e.g. 'text'.
+
+        Returns:
+            A list containing a list of element identifiers for each box.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        first, last = self.cell_range(boxes)
+
+        # Check which boxes overlap the grid at all
+        overlap = (boxes[:, :2] <= self.origin + self.shape * self.cell).all(
+            axis=1) & (boxes[:, 2:] >= self.origin).all(axis=1)
+
+        results = []
+
+        for i, box in enumerate(boxes):
+
+            if len(self.keys) == 0 or not overlap[i]:
+
+                results.append([])
+
+                continue
+
+            # Test the candidates exactly
+            found = self.candidates(first[i], last[i])
+            bboxes = self.bboxes[found]
+
+            if contain:
+
+                mask = (bboxes[:, :2] >= box[:2]).all(axis=1) & \
+                       (bboxes[:, 2:] <= box[2:]).all(axis=1)
+
+            else:
+                mask = (bboxes[:, :2] <= box[2:]).all(axis=1) & \
+                       (bboxes[:, 2:] >= box[:2]).all(axis=1)
+
+            if kind is not None:
+
+                mask &= self.kinds[found] == kind
+
+            results.append([self.keys[j] for j in found[mask]])
+
+        return results
+
+    def within(self, boxes, kind=None):
+        """
+        Finds the elements whose bounding boxes lie within boxes.
+
+        Parameters:
+            boxes: A list or an array of boxes as minimum x, minimum y, maximum
+                   x and maximum y.
+            kind: An optional kind of element to return, e.g. 'text'.
+
+        Returns:
+            A list containing a list of element identifiers for each box.
+        """
+        return self.query(boxes, contain=True, kind=kind)
+
+    def intersecting(self, boxes, kind=None):
+        """
+        Finds the elements whose bounding boxes intersect boxes.
+
+        Parameters:
+            boxes: A list or an array of boxes as minimum x, minimum y, maximum
+                   x and maximum y.
+            kind: An optional kind of element to return, e.g. 'text'.
+
+        Returns:
+            A list containing a list of element identifiers for each box.
+        """
+        return self.query(boxes, contain=False, kind=kind)
+
+    def nearest(self, boxes, k=1, kind=None, exclude=None):
+        """
+        Finds the elements closest to boxes or points, measuring the distance
+        between bounding boxes. The search begins from the cells covered by
+        each box and expands one ring of cells at a time until no element
+        outside the searched cells can be closer.
+
+        Parameters:
+            boxes: A list or an array of boxes as minimum x, minimum y, maximum
+                   x and maximum y, or of points as x and y.
+            k: The number of elements to return for each box.
+            kind: An optional kind of element to return, e.g. 'text'.
+            exclude: An optional list of element identifiers to skip for each
+                     box, e.g. the element used for the query.
+
+        Returns:
+            A list containing a list of (identifier, distance) tuples for each
+            box, sorted by distance.
+        """
+        boxes = np.asarray(boxes, dtype=np.float64)
+
+        # Convert points into boxes of zero size
+        if boxes.ndim == 2 and boxes.shape[1] == 2:
+
+            boxes = np.hstack([boxes, boxes])
+
+        boxes = boxes.reshape(-1, 4)
+        first, last = self.cell_range(boxes)
+
+        # Get a mask for the elements of the requested kind
+        allowed = np.ones(len(self.keys), dtype=bool) if kind is None else \
+            self.kinds == kind
+
+        results = []
+
+        for i, box in enumerate(boxes):
+
+            mask = allowed.copy()
+
+            if exclude is not None and exclude[i] in self.positions:
+
+                mask[self.positions[exclude[i]]] = False
+
+            available = int(mask.sum())
+            ring = 0
+
+            while True:
+
+                # Get the range of cells searched and the elements in them
+                lo = np.maximum(first[i] - ring, 0)
+                hi = np.minimum(last[i] + ring, self.shape - 1)
+
+                found = self.candidates(lo, hi)
+                found = found[mask[found]]
+
+                # Measure the distances between the box and the candidates
+                bboxes = self.bboxes[found]
+                dx = np.maximum(0, np.maximum(bboxes[:, 0] - box[2],
+                                              box[0] - bboxes[:, 2]))
+                dy = np.maximum(0, np.maximum(bboxes[:, 1] - box[3],
+                                              box[1] - bboxes[:, 3]))
+                distances = np.hypot(dx, dy)
+
+                order = np.argsort(distances, kind='stable')[:k]
+
+                # Stop if all cells have been searched
+                if (lo == 0).all() and (hi == self.shape - 1).all():
+
+                    break
+
+                # Otherwise stop if enough elements have been found and any
+                # element outside the searched cells would be further away
+                if len(order) >= min(k, available):
+
+                    edge = np.concatenate([self.origin + lo * self.cell,
+                                           self.origin + (hi + 1) * self.cell])
+                    reach = min(box[0] - edge[0] if lo[0] > 0 else np.inf,
+                                box[1] - edge[1] if lo[1] > 0 else np.inf,
+                                edge[2] - box[2] if hi[0] < self.shape[0] - 1
+                                else np.inf,
+                                edge[3] - box[3] if hi[1] < self.shape[1] - 1
+                                else np.inf)
+
+                    if len(order) == 0 or distances[order[-1]] <= reach:
+
+                        break
+
+                ring += 1
+
+            results.append([(self.keys[found[j]], float(distances[j]))
+                            for j in order])
+
+        return results
+
+    def nearest_to(self, element, k=1, kind=None):
+        """
+        Finds the elements closest to a given element.
+
+        Parameters:
+            element: The identifier of an element, e.g. B3.
+            k: The number of elements to return.
+            kind: An optional kind of element to return, e.g. 'text'.
+
+        Returns:
+            A list of (identifier, distance) tuples sorted by distance.
+        """
+        box = self.bboxes[self.positions[element]]
+
+        return self.nearest([box], k=k, kind=kind, exclude=[element])[0]
+
+
+class PairwiseFeatures:
+    """
+    This class holds geometric features for all pairs of layout elements in a
+    diagram as NumPy matrices, in which the element at row i and column j
+    describes the pair of elements i and j in the order of the geometry table.
+    """
+    # Define the matrices available for each diagram
+    matrices = ['distance', 'iou', 'containment', 'direction']
+
+    def __init__(self, annotation):
+        """
+        This function initializes the PairwiseFeatures class.
+
+        Parameters:
+            annotation: A dictionary containing AI2D annotation.
+
+        Returns:
+            A PairwiseFeatures object.
+        """
+        # Get the geometry of the layout elements
+        geometry = get_geometry(annotation)
+
+        self.keys = list(geometry.keys)
+        self.kinds = geometry.kinds
+        self.positions = {k: i for i, k in enumerate(self.keys)}
+
+        # Calculate the centroids without rounding them to pixels
+        if len(self.keys) > 0:
+
+            centroids = np.add.reduceat(geometry.points.astype(np.float64),
+                                        geometry.offsets[:-1], axis=0) / \
+                geometry.counts[:, None]
+
+        else:
+            centroids = np.zeros((0, 2))
+
+        # Calculate the offsets from the centroid of each element to the
+        # centroids of the other elements
+        offsets = centroids[None, :, :] - centroids[:, None, :]
+
+        # Calculate the distances between the centroids
+        self.distance = np.hypot(offsets[..., 0], offsets[..., 1])
+
+        # Calculate the direction from each element to the other elements in
+        # radians, measured from the x-axis. The y-axis of the image points
+        # down, so that e.g. pi / 2 means that the other element is below.
+        self.direction = np.arctan2(offsets[..., 1], offsets[..., 0])
+
+        # Calculate the area of intersection between the bounding boxes
+        bboxes = geometry.bboxes().astype(np.float64)
+        mins = np.maximum(bboxes[:, None, :2], bboxes[None, :, :2])
+        maxs = np.minimum(bboxes[:, None, 2:], bboxes[None, :, 2:])
+        sides = np.clip(maxs - mins, 0, None)
+        intersection = sides[..., 0] * sides[..., 1]
+
+        # Calculate the areas of the bounding boxes and their unions
+        areas = (bboxes[:, 2] - bboxes[:, 0]) * (bboxes[:, 3] - bboxes[:, 1])
+        union = areas[:, None] + areas[None, :] - intersection
+
+        # Calculate the intersection over union of the bounding boxes
+        self.iou = np.divide(intersection, union, out=np.zeros_like(union),
+                             where=union > 0)
+
+        # Calculate the share of the bounding box of each element that lies
+        # within the bounding box of the other element
+        area_rows = np.broadcast_to(areas[:, None], intersection.shape)
+        self.containment = np.divide(intersection, area_rows,
+                                     out=np.zeros_like(intersection),
+                                     where=area_rows > 0)
+
+    def __len__(self):
+        """
+        Returns the number of elements in the matrices.
+        """
+        return len(self.keys)
+
+    def pair(self, first, second):
+        """
+        Gets the features for a pair of elements.
+
+        Parameters:
+            first: The identifier of the first element, e.g. T1.
+            second: The identifier of the second element, e.g. B3.
+
+        Returns:
+            A dictionary mapping the names of the matrices to the values for
+            the pair.
+        """
+        i, j = self.positions[first], self.positions[second]
+
+        return {name: float(getattr(self, name)[i, j])
+                for name in self.matrices}
+
+    def to_dict(self, dtype=np.float32):
+        """
+        Collects the identifiers, kinds and matrices into a dictionary of
+        arrays, e.g. for saving the features using NumPy.
+
+        Parameters:
+            dtype: The data type of the matrices.
+
+        Returns:
+            A dictionary of NumPy arrays.
+        """
+        arrays = {'keys': np.array(self.keys, dtype=str),
+                  'kinds': np.array(self.kinds, dtype=str)}
+
+        arrays.update({name: getattr(self, name).astype(dtype)
+                       for name in self.matrices})
+
+        return arrays
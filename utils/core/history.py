@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+from .registry import apply_changes, histories, invert_change
+
+import networkx as nx
+import weakref
+
+
+class GraphHistory:
+    """
+    This class records the changes made to a graph through the functions in
+    core/registry.py, so that the changes can be undone and redone. The
+    changes are grouped into steps, e.g. one step for each command entered by
+    the user. Undoing a step applies the reverse of its changes, so that the
+    cost depends on the number of changes, not on the size of the graph.
+    """
+    def __init__(self, graph, max_steps=100):
+        """
+        This function initializes the GraphHistory class.
+
+        Parameters:
+            graph: A NetworkX Graph.
+            max_steps: The maximum number of steps kept for undoing.
+
+        Returns:
+            A GraphHistory object.
+        """
+        self.graph = weakref.ref(graph)
+        self.max_steps = max_steps
+
+        # Set up lists for the steps that can be undone and redone, and for
+        # the changes in the current step
+        self.undo_steps, self.redo_steps, self.current = [], [], []
+
+        # Set up a list for the changes made since the reset point, which is
+        # not limited by the maximum number of steps
+        self.since_mark = []
+
+        # Set up a list for all changes applied since they were last taken,
+        # including those made by undoing and redoing, e.g. for logging
+        self.applied = []
+
+        # Set up a flag for tracking whether undo or redo is being applied
+        self.replaying = False
+
+    def record(self, changes):
+        """
+        Records changes applied to the graph.
+
+        Parameters:
+            changes: A list of changes as defined in apply_changes.
+
+        Returns:
+            None
+        """
+        self.since_mark.extend(changes)
+        self.applied.extend(changes)
+
+        # Changes made while undoing or redoing are recorded by the caller
+        if self.replaying:
+
+            return
+
+        self.current.extend(changes)
+
+        # Any new change makes the steps undone earlier obsolete
+        self.redo_steps.clear()
+
+    def checkpoint(self):
+        """
+        Ends the current step, e.g. after each command entered by the user.
+
+        Returns:
+            None
+        """
+        if self.current:
+
+            self.undo_steps.append(self.current)
+            self.current = []
+
+            # Drop the oldest step if the maximum has been reached
+            if len(self.undo_steps) > self.max_steps:
+
+                self.undo_steps.pop(0)
+
+    def mark(self):
+        """
+        Sets the state of the graph to which the graph is reset and starts a
+        new history, so that changes made before cannot be undone.
+
+        Returns:
+            None
+        """
+        self.undo_steps, self.redo_steps, self.current = [], [], []
+        self.since_mark, self.applied = [], []
+
+    def take_changes(self):
+        """
+        Gets the changes applied to the graph since the changes were last
+        taken, including the changes made by undoing and redoing steps.
+
+        Returns:
+            A list of changes as defined in apply_changes.
+        """
+        changes, self.applied = self.applied, []
+
+        return changes
+
+    def replay(self, changes):
+        """
+        Applies the reverse of a list of changes in reverse order.
+
+        Parameters:
+            changes: A list of changes as defined in apply_changes.
+
+        Returns:
+            The list of changes applied.
+        """
+        # Collect the changes applied from the records
+        start = len(self.since_mark)
+
+        self.replaying = True
+
+        try:
+            apply_changes(self.graph(), [invert_change(c)
+                                         for c in reversed(changes)])
+
+        finally:
+            self.replaying = False
+
+        return self.since_mark[start:]
+
+    def undo(self):
+        """
+        Undoes the latest step.
+
+        Returns:
+            True if a step was undone, otherwise False.
+        """
+        self.checkpoint()
+
+        if not self.undo_steps:
+
+            return False
+
+        self.redo_steps.append(self.replay(self.undo_steps.pop()))
+
+        return True
+
+    def redo(self):
+        """
+        Redoes the latest step that was undone.
+
+        Returns:
+            True if a step was redone, otherwise False.
+        """
+        self.checkpoint()
+
+        if not self.redo_steps:
+
+            return False
+
+        self.undo_steps.append(self.replay(self.redo_steps.pop()))
+
+        return True
+
+    def reset(self):
+        """
+        Resets the graph to the reset point by undoing all changes made since.
+        The reset is recorded as a single step, which can be undone.
+
+        Returns:
+            None
+        """
+        self.checkpoint()
+
+        # Undo the changes, recording them as a new step
+        self.current = self.replay(list(self.since_mark))
+        self.redo_steps.clear()
+        self.checkpoint()
+
+        # The graph is now in the state of the reset point
+        self.since_mark = []
+
+
+def get_history(graph):
+    """
+    Gets the history of a graph, setting up the history if needed. Changes are
+    recorded once the history has been set up.
+
+    Parameters:
+        graph: A NetworkX Graph.
+
+    Returns:
+        A GraphHistory object.
+    """
+    if graph not in histories:
+
+        histories[graph] = GraphHistory(graph)
+
+    return histories[graph]
+
+
+def unfreeze(graph):
+    """
+    Unfreezes a graph frozen using NetworkX in place, without copying the
+    graph.
+
+    Parameters:
+        graph: A NetworkX Graph.
+
+    Returns:
+        The graph.
+    """
+    if nx.is_frozen(graph):
+
+        # Freezing replaces the methods that modify the graph with a function
+        # raising an error, and sets a flag. Removing these attributes from
+        # the instance restores the methods of the class.
+        for name in [k for k, v in vars(graph).items()
+                     if v is nx.classes.function.frozen]:
+
+            delattr(graph, name)
+
+        del graph.frozen
+
+    return graph
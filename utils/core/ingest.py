@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+from .diagram import Diagram
+from .parse import load_annotation
+from multiprocessing import Pool
+import os
+import pandas as pd
+import time
+
+
+def find_annotations(ann_dir):
+    """
+    Finds the JSON files containing the original AI2D annotation.
+
+    Parameters:
+        ann_dir: Path to the AI2D directory with the JSON annotation.
+
+    Returns:
+        A list of (image filename, path to JSON file) tuples sorted by the
+        number of the diagram.
+    """
+    # Collect the JSON files, whose names consist of the image filename and
+    # the suffix .json, e.g. 4.png.json.
+    files = [(f[:-len('.json')], os.path.join(ann_dir, f))
+             for f in os.listdir(ann_dir) if f.endswith('.json')]
+
+    # Sort the files numerically by the number of the diagram where possible
+    def sort_key(item):
+
+        stem = item[0].split('.')[0]
+
+        return (0, int(stem), item[0]) if stem.isdigit() else (1, 0, item[0])
+
+    return sorted(files, key=sort_key)
+
+
+def import_diagram(job):
+    """
+    Reads the annotation for a single diagram and builds a Diagram object,
+    which creates the graph for layout annotation.
+
+    Parameters:
+        job: A tuple containing the image filename, the path to the JSON file
+             and the path to the directory with AI2D images.
+
+    Returns:
+        A tuple containing the image filename, the annotation dictionary and
+        the Diagram object.
+    """
+    # Unpack the job
+    image_name, json_path, images_path = job
+
+    # Load the annotation from the JSON file
+    annotation = load_annotation(json_path)
+
+    # Initialize a Diagram object, which builds the layout graph
+    diagram = Diagram(annotation, os.path.join(images_path, image_name))
+
+    return image_name, annotation, diagram
+
+
+def import_corpus(ann_dir, images_path, processes=None, chunksize=16):
+    """
+    Imports the original AI2D annotation from a directory of JSON files into a
+    pandas DataFrame, using a pool of processes for parsing the files and
+    building the layout graphs.
+
+    Parameters:
+        ann_dir: Path to the AI2D directory with the JSON annotation.
+        images_path: Path to the directory with AI2D images.
+        processes: The number of processes to use (default: number of CPUs).
+        chunksize: The number of diagrams sent to a process at a time.
+
+    Returns:
+        A pandas DataFrame with the columns 'image_name', 'annotation' and
+        'diagram', and the time spent on importing in seconds.
+    """
+    # Find the JSON files and set up a job for each diagram
+    jobs = [(image_name, json_path, images_path)
+            for image_name, json_path in find_annotations(ann_dir)]
+
+    # Start timing the import
+    start = time.perf_counter()
+
+    # Parse the files using a pool of processes. The results are returned in
+    # the order of the jobs, which keeps the rows sorted.
+    with Pool(processes=processes) as pool:
+
+        rows = pool.map(import_diagram, jobs, chunksize=chunksize)
+
+    # Stop timing
+    elapsed = time.perf_counter() - start
+
+    # Collect the results into a DataFrame
+    annotation_df = pd.DataFrame(rows,
+                                 columns=['image_name', 'annotation', 'diagram'])
+
+    return annotation_df, elapsed
@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 
+from .capture import *
 from .draw import *
+from .geometry import geometry_kinds
+from .history import unfreeze
+from .registry import add_nodes, remove_edges, remove_nodes
 
 
 def process_command(user_input, mode, diagram, current_graph):
@@ -31,56 +35,43 @@ def process_command(user_input, mode, diagram, current_graph):
         # Join filename to get a string
         fname = ''.join(fname)
 
-        # Draw segmentation
+        # Draw segmentation, which is usually in the cache already
         segmentation = draw_layout(diagram.image_filename,
                                    diagram.annotation,
                                    height=720,
                                    dpi=100)
 
-        # Draw grouping graph
-        try:
-            grouping = draw_graph(diagram.layout_graph, dpi=100, mode='layout')
+        # Draw the grouping, connectivity and RST graphs using the renderers
+        # kept for the diagram, which only redraw the graphs if they have
+        # changed since they were last shown.
+        graphs = [('layout', diagram.layout_graph),
+                  ('connectivity', diagram.connectivity_graph),
+                  ('rst', diagram.rst_graph)]
 
-        except AttributeError:
+        images = []
 
-            # Print error message
-            print("[ERROR] Sorry, you have not annotated the {} graph yet."
-                  .format(mode))
-
-            return
-
-        # Draw connectivity graph
-        try:
-            connectivity = draw_graph(diagram.connectivity_graph, dpi=100,
-                                      mode='connectivity')
-
-        except AttributeError:
+        for graph_mode, graph in graphs:
 
-            # Print error message
-            print("[ERROR] Sorry, you have not annotated the {} graph yet."
-                  .format(mode))
+            try:
+                images.append(diagram.render_graph(graph, mode=graph_mode))
 
-            return
+            except AttributeError:
 
-        # Draw RST graph
-        try:
-            rst = draw_graph(diagram.rst_graph, dpi=100, mode='rst')
+                # Print error message
+                print("[ERROR] Sorry, you have not annotated the {} graph yet."
+                      .format(graph_mode))
 
-        except AttributeError:
+                return
 
-            # Print error message
-            print("[ERROR] Sorry, you have not annotated the {} graph yet."
-                  .format(mode))
-
-            return
+        grouping, connectivity, rst = images
 
         # Stack images of all graphs side by side and on top of each other
         seg_group = np.hstack([segmentation, grouping])
         rst_group = np.hstack([connectivity, rst])
         all_graphs = np.vstack([seg_group, rst_group])
 
-        # Write image on disk
-        cv2.imwrite("all_graphs_{}.png".format(fname), all_graphs)
+        # Encode and write image on disk in the background
+        save_capture("all_graphs_{}.png".format(fname), all_graphs)
 
         # Print status message
         print("[INFO] Saved screenshots for all graphs on disk for {}.png"
@@ -91,28 +82,62 @@ def process_command(user_input, mode, diagram, current_graph):
     # Save a screenshot if requested
     if command == 'cap':
 
+        # Get the requested file format, which defaults to PNG
+        fmt = user_input.split()[1] if len(user_input.split()) > 1 else 'png'
+
+        if fmt not in capture_formats:
+
+            # Print error message
+            print("[ERROR] Sorry, {} is not a valid format for captures. "
+                  "Valid formats include: {}.".format(
+                      fmt, ', '.join(capture_formats)))
+
+            return
+
         # Get filename of current image (without extension)
         fname = os.path.basename(diagram.image_filename).split('.')[0]
 
         # Join filename to get a string
         fname = ''.join(fname)
 
-        # Render high-resolution versions of graph and segmentation
-        layout_hires = draw_layout(diagram.image_filename,
-                                   diagram.annotation,
-                                   height=720,
-                                   dpi=200)
+        # Make sure the renderer for the current graph is up to date. The
+        # renderer keeps the Figure, so the graph is not laid out and drawn
+        # again for the capture.
+        diagram.render_graph(current_graph, mode=mode)
+        renderer = diagram.renderers[(mode, 100)]
 
-        diag_hires = draw_graph(current_graph, dpi=200,
-                                mode=mode)
+        if fmt == 'png':
 
-        # Write image on disk
-        cv2.imwrite("segmentation_{}.png".format(fname), layout_hires)
-        cv2.imwrite("{}_{}.png".format(mode, fname), diag_hires)
+            # Render a high-resolution version of the graph now, as the Figure
+            # changes when the graph is edited, and render the segmentation in
+            # the background. The segmentation is cached after the first
+            # capture.
+            diag_hires = renderer.rasterize(200)
+
+            def layout_hires(path=diagram.image_filename,
+                             annotation=diagram.annotation):
+
+                return draw_layout(path, annotation, height=720, dpi=200)
+
+        else:
+
+            # Save the graph in the vector format now, as the Figure changes
+            # when the graph is edited, and build and save the segmentation
+            # in the background.
+            diag_hires = renderer.export(fmt)
+
+            def layout_hires(path=diagram.image_filename,
+                             annotation=diagram.annotation):
+
+                return figure_bytes(build_layout(path, annotation, 720), fmt)
+
+        # Encode and write images on disk in the background
+        save_capture("segmentation_{}.{}".format(fname, fmt), layout_hires)
+        save_capture("{}_{}.{}".format(mode, fname, fmt), diag_hires)
 
         # Print status message
-        print("[INFO] Saved separate screenshots on disk for {}.png".format(
-            fname
+        print("[INFO] Saved separate screenshots on disk for {}.{}".format(
+            fname, fmt
         ))
 
         return
@@ -155,11 +180,8 @@ def process_command(user_input, mode, diagram, current_graph):
 
             print("[INFO] Marking rhetorical structure as complete.")
 
-        # Check if the current graph is frozen
-        if nx.is_frozen(current_graph):
-
-            # If the graph is frozen, unfreeze by making a copy
-            current_graph = current_graph.copy()
+        # Unfreeze the current graph in place if it is frozen
+        unfreeze(current_graph)
 
         # Remove grouping edges from RST and connectivity annotation
         if mode == 'rst' or mode == 'connectivity':
@@ -176,13 +198,13 @@ def process_command(user_input, mode, diagram, current_graph):
                 pass
 
             # Remove grouping edges from current graph
-            current_graph.remove_edges_from(edge_bunch)
+            remove_edges(current_graph, edge_bunch)
 
         # Find nodes without edges (isolates)
         isolates = list(nx.isolates(current_graph))
 
-        # Remove isolates
-        current_graph.remove_nodes_from(isolates)
+        # Remove isolates and their aliases
+        remove_nodes(current_graph, isolates)
 
         # Freeze the graph
         nx.freeze(current_graph)
@@ -195,6 +217,9 @@ def process_command(user_input, mode, diagram, current_graph):
     # If requested, exit the annotator immediately
     if command == 'exit':
 
+        # Wait for any screen captures to be written to disk
+        wait_for_captures()
+
         # Destroy any remaining windows
         cv2.destroyAllWindows()
 
@@ -224,13 +249,13 @@ def process_command(user_input, mode, diagram, current_graph):
                 pass
 
             # Remove grouping edges from current graph
-            current_graph.remove_edges_from(edge_bunch)
+            remove_edges(current_graph, edge_bunch)
 
         # Find nodes without edges (isolates)
         isolates = list(nx.isolates(current_graph))
 
-        # Remove isolates
-        current_graph.remove_nodes_from(isolates)
+        # Remove isolates and their aliases
+        remove_nodes(current_graph, isolates)
 
         # Write DOT graph to disk
         nx.nx_pydot.write_dot(current_graph,
@@ -265,7 +290,7 @@ def process_command(user_input, mode, diagram, current_graph):
             edge_bunch = list(current_graph.edges(user_input))
 
             # Remove designated edges
-            current_graph.remove_edges_from(edge_bunch)
+            remove_edges(current_graph, edge_bunch)
 
             # Flag the graph for re-drawing
             diagram.update = True
@@ -286,8 +311,8 @@ def process_command(user_input, mode, diagram, current_graph):
         # Find nodes without edges (isolates)
         isolates = list(nx.isolates(current_graph))
 
-        # Remove isolates
-        current_graph.remove_nodes_from(isolates)
+        # Remove isolates and their aliases
+        remove_nodes(current_graph, isolates)
 
         # Print status message
         print("[INFO] Removing isolates from the graph as requested.")
@@ -329,9 +354,63 @@ def process_command(user_input, mode, diagram, current_graph):
 
         return
 
+    # If requested, print the layout elements closest to an element
+    if command == 'near':
+
+        # Get the element and the optional kind of elements to search for
+        user_input = user_input.split()[1:]
+
+        if len(user_input) == 0 or len(user_input) > 2:
+
+            # Print error message
+            print("[ERROR] Please enter an element and optionally a type of "
+                  "element, e.g. near b3 text.")
+
+            return
+
+        element = user_input[0].upper()
+        kind = user_input[1].lower() if len(user_input) > 1 else None
+
+        # Fetch the spatial index of the diagram
+        spatial = diagram.get_spatial_index()
+
+        if element not in spatial.positions:
+
+            # Print error message
+            print("[ERROR] Sorry, {} is not a blob, arrow or text block."
+                  .format(element))
+
+            return
+
+        if kind not in [None] + geometry_kinds:
+
+            # Print error message
+            print("[ERROR] Sorry, {} is not a valid type. Valid types include: "
+                  "{}.".format(kind, ', '.join(geometry_kinds)))
+
+            return
+
+        # Find the closest elements
+        nearest = spatial.nearest_to(element, k=5, kind=kind)
+
+        # Print the elements and their distances in pixels
+        print("---\nElements closest to {}\n---".format(element))
+
+        for k, distance in nearest:
+
+            print("{} ({}): {:.0f} px".format(k, spatial.kinds[
+                spatial.positions[k]], distance))
+
+        print("---")
+
+        return
+
     # If requested, move to the next graph
     if command == 'next':
 
+        # Wait for any screen captures to be written to disk
+        wait_for_captures()
+
         # Destroy any remaining windows
         cv2.destroyAllWindows()
 
@@ -348,7 +427,7 @@ def process_command(user_input, mode, diagram, current_graph):
                       if d['kind'] == 'grouping']
 
         # Remove grouping edges from current graph
-        current_graph.remove_edges_from(edge_bunch)
+        remove_edges(current_graph, edge_bunch)
 
         # Flag the graph for re-drawing
         diagram.update = True
@@ -375,12 +454,9 @@ def process_command(user_input, mode, diagram, current_graph):
         # Print closing line
         print("---")
 
-        # Generate a dictionary of RST relations present in the graph
-        relation_ix = get_node_dict(current_graph, kind='relation')
-
-        # Loop through current RST relations and rename for convenience.
-        relation_ix = {"R{}".format(i): k for i, (k, v) in
-                       enumerate(relation_ix.items(), start=1)}
+        # Fetch the aliases of RST relations present in the graph
+        relation_ix = {a.upper(): k for a, k in
+                       replace_aliases(current_graph, 'relation').items()}
 
         # If more than one macro-group has been defined, print groups
         if len(relation_ix) > 0:
@@ -405,24 +481,21 @@ def process_command(user_input, mode, diagram, current_graph):
         # Reset layout graph if requested
         if mode == 'layout':
 
-            # Unfreeze the reset graph and assign to layout_graph
+            # Create a new layout graph from the annotation
             diagram.layout_graph = create_graph(diagram.annotation,
                                                 edges=False,
                                                 arrowheads=False,
                                                 mode='layout'
                                                 )
 
-        # Reset connectivity graph if requested
-        if mode == 'connectivity':
+            # Start recording changes to the new graph
+            diagram.start_history(diagram.layout_graph, 'layout')
 
-            # Unfreeze the connectivity graph and assign to connectivity_graph
-            diagram.connectivity_graph = diagram.reset.copy()
+        # Reset connectivity and RST graphs if requested by undoing the changes
+        # made during the current task
+        if mode == 'connectivity' or mode == 'rst':
 
-        # Reset RST graph if requested
-        if mode == 'rst':
-
-            # Unfreeze the RST graph and assign to rst_graph
-            diagram.rst_graph = diagram.reset.copy()
+            diagram.history.reset()
 
         # Flag the graph for re-drawing
         diagram.update = True
@@ -471,14 +544,37 @@ def process_command(user_input, mode, diagram, current_graph):
                 user_input = [rel_dict[u] if u in rel_dict.keys()
                               else u.upper() for u in user_input]
 
-            # Remove the designated nodes from the graph
-            current_graph.remove_nodes_from(user_input)
+            # Remove the designated nodes from the graph and their aliases
+            remove_nodes(current_graph, user_input)
 
             # Flag the graph for re-drawing
             diagram.update = True
 
             return
 
+    # If requested, undo or redo the latest command that changed the graph
+    if command == 'undo' or command == 'redo':
+
+        # Undo or redo the command
+        done = diagram.history.undo() if command == 'undo' else \
+            diagram.history.redo()
+
+        if not done:
+
+            # Print error message
+            print("[ERROR] Sorry, there is nothing to {}.".format(command))
+
+            return
+
+        # Print status message
+        print("[INFO] {} the latest change.".format(
+            'Undid' if command == 'undo' else 'Redid'))
+
+        # Flag the graph for re-drawing
+        diagram.update = True
+
+        return
+
     # if requested, split a node
     if command == 'split':
 
@@ -518,10 +614,10 @@ def process_command(user_input, mode, diagram, current_graph):
                     split_list.append((s, attr_dict))
 
                 # Remove node from the RST graph
-                current_graph.remove_node(n.upper())
+                remove_nodes(current_graph, [n.upper()])
 
             # Add split nodes to the graph
-            current_graph.add_nodes_from(split_list)
+            add_nodes(current_graph, split_list)
 
             # Flag the graph for re-drawing
             diagram.update = True
@@ -533,8 +629,8 @@ def process_command(user_input, mode, diagram, current_graph):
 commands = {'rst': ['rels', 'split', 'ungroup'],
             'connectivity': ['ungroup'],
             'generic': ['acap', 'cap', 'comment', 'done', 'exit', 'export',
-                        'free', 'info', 'isolate', 'macrogroups', 'next',
-                        'reset', 'rm'],
+                        'free', 'info', 'isolate', 'macrogroups', 'near',
+                        'next', 'redo', 'reset', 'rm', 'undo'],
             'tasks': ['conn', 'group', 'rst']
             }
 
@@ -594,6 +690,7 @@ info = {'layout': "---\n"
         'generic': "Other valid commands include:\n\n"
                    "acap: Save a screen capture for all graphs in diagram.\n"
                    "cap: Save a screen capture of the current visualisation.\n"
+                   "     Use cap svg or cap pdf to save in a vector format.\n"
                    "comment: Enter a comment about current diagram.\n"
                    "free: Remove all edges leading to a node, e.g. free b0.\n"
                    "exit: Exit the annotator immediately.\n"
@@ -602,10 +699,14 @@ info = {'layout': "---\n"
                    "hide: Hide the layout segmentation.\n"
                    "info: Print this message.\n"
                    "isolate: Remove isolates from the graph.\n"
+                   "near: Print the elements closest to an element, e.g.\n"
+                   "      near b3 or near b3 text.\n"
                    "next: Save current work and move on to the next diagram.\n"
+                   "redo: Redo the latest change that was undone.\n"
                    "reset: Reset the current annotation.\n"
                    "show: Show the layout segmentation. Use e.g. show b0 to\n"
                    "      a single unit.\n"
+                   "undo: Undo the latest change to the graph.\n"
                    "---",
         }
 
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+from collections import OrderedDict
+
+import networkx as nx
+import numpy as np
+import threading
+import time
+
+
+class LayoutEngine:
+    """
+    This class computes the positions of nodes for drawing graphs. Positions
+    are cached for each graph and new layouts are seeded from the previous
+    positions, so that existing nodes keep their place when the graph changes.
+    """
+    def __init__(self, max_nodes=100, cache_size=64, seed=42):
+        """
+        This function initializes the LayoutEngine class.
+
+        Parameters:
+            max_nodes: The largest number of nodes laid out in-process. Larger
+                       graphs are laid out using Graphviz neato if available,
+                       unless previous positions exist for the key.
+            cache_size: The number of layouts stored in the cache.
+            seed: An integer used to seed the placement of new nodes.
+
+        Returns:
+            A LayoutEngine object.
+        """
+        self.max_nodes = max_nodes
+        self.cache_size = cache_size
+        self.seed = seed
+
+        # Set up a cache mapping keys and graph fingerprints to positions
+        self.cache = OrderedDict()
+
+        # Set up a dictionary holding the latest positions for each key, e.g.
+        # for each diagram and layer, which is limited to the same size as the
+        # cache
+        self.previous = OrderedDict()
+
+        # Set up a lock, so that layouts may be computed in several threads
+        self.lock = threading.RLock()
+
+        # Set up attributes for reporting the latest layout
+        self.report = False
+        self.last_method = None
+        self.last_time = 0.0
+
+    def fingerprint(self, graph):
+        """
+        Creates a fingerprint for the structure of a graph.
+
+        Parameters:
+            graph: A NetworkX graph.
+
+        Returns:
+            A hashable fingerprint of the nodes and edges in the graph.
+        """
+        return (frozenset(graph.nodes), frozenset(graph.edges))
+
+    def layout(self, graph, key=None):
+        """
+        Computes the positions of nodes in a graph.
+
+        Parameters:
+            graph: A NetworkX graph.
+            key: An optional hashable identifying the graph across edits, e.g.
+                 the filename of the diagram and the annotation layer. The
+                 positions of the previous layout with the same key are used
+                 for seeding the new layout.
+
+        Returns:
+            A dictionary mapping nodes to positions.
+        """
+        with self.lock:
+
+            return self.compute_layout(graph, key)
+
+    def compute_layout(self, graph, key):
+        """
+        Computes the positions of nodes in a graph, using the cache if possible.
+        Called by layout() while holding the lock.
+
+        Parameters:
+            graph: A NetworkX graph.
+            key: An optional hashable identifying the graph across edits.
+
+        Returns:
+            A dictionary mapping nodes to positions.
+        """
+        # Start timing the layout
+        start = time.perf_counter()
+
+        # Fingerprint the graph and check the cache. The key is included, so
+        # that diagrams with graphs of the same structure do not share their
+        # positions, which depend on the previous layouts of each diagram.
+        fingerprint = (key, self.fingerprint(graph))
+
+        if fingerprint in self.cache:
+
+            # Mark the layout as recently used
+            self.cache.move_to_end(fingerprint)
+
+            pos = self.cache[fingerprint]
+            method = 'cache'
+
+        # Otherwise compute a new layout
+        else:
+
+            # Fetch the previous positions for the graph
+            seed_pos = self.previous.get(key) if key is not None else None
+
+            # Use Graphviz for the first layout of large graphs. Later layouts
+            # are seeded from the previous positions in-process, so that the
+            # nodes do not jump between redraws.
+            pos, method = None, None
+
+            if len(graph) > self.max_nodes and not seed_pos:
+
+                pos, method = self.graphviz_layout(graph), 'neato'
+
+            # Lay out small graphs, and large graphs if Graphviz is not
+            # available, in-process.
+            if pos is None:
+
+                pos, method = self.spring_layout(graph, seed_pos), 'spring'
+
+            # Add the layout to the cache and remove the least recently used
+            # layout if the cache is full
+            self.cache[fingerprint] = pos
+
+            if len(self.cache) > self.cache_size:
+
+                self.cache.popitem(last=False)
+
+        # Store the positions for seeding the next layout
+        if key is not None:
+
+            self.previous[key] = pos
+            self.previous.move_to_end(key)
+
+            # Remove the positions of the least recently drawn key
+            if len(self.previous) > self.cache_size:
+
+                self.previous.popitem(last=False)
+
+        # Store the method and the time spent
+        self.last_method = method
+        self.last_time = time.perf_counter() - start
+
+        return pos
+
+    def spring_layout(self, graph, seed_pos=None):
+        """
+        Computes a force-directed layout in-process, keeping the nodes placed
+        in the previous layout fixed.
+
+        Parameters:
+            graph: A NetworkX graph.
+            seed_pos: An optional dictionary of previous positions.
+
+        Returns:
+            A dictionary mapping nodes to positions scaled into [-1, 1].
+        """
+        # Lay out graphs without previous positions from scratch
+        if not seed_pos:
+
+            return nx.rescale_layout_dict(
+                nx.spring_layout(graph, seed=self.seed))
+
+        # Collect the nodes that were present in the previous layout
+        fixed = [n for n in graph.nodes if n in seed_pos]
+
+        # Return the previous positions if no nodes were added
+        if len(fixed) == len(graph):
+
+            return {n: seed_pos[n] for n in graph.nodes}
+
+        # Set up a random number generator for placing new nodes
+        rng = np.random.RandomState(self.seed)
+
+        # Place new nodes next to their neighbours that have a position, or
+        # near the centre if no such neighbours exist
+        init = {n: seed_pos[n] for n in fixed}
+
+        for n in graph.nodes:
+
+            if n in init:
+
+                continue
+
+            neighbours = [init[m] for m in nx.all_neighbors(graph, n)
+                          if m in init]
+
+            centre = np.mean(neighbours, axis=0) if neighbours else \
+                np.zeros(2)
+
+            init[n] = centre + rng.uniform(-0.1, 0.1, 2)
+
+        # Move only the new nodes. If none of the nodes are fixed, lay out the
+        # graph from the initial positions.
+        pos = nx.spring_layout(graph, pos=init, fixed=fixed or None,
+                               k=1 / np.sqrt(len(graph)), seed=self.seed)
+
+        # Only rescale if the nodes were not fixed, so that they stay in place
+        return pos if fixed else nx.rescale_layout_dict(pos)
+
+    def graphviz_layout(self, graph):
+        """
+        Computes a layout using Graphviz neato.
+
+        Parameters:
+            graph: A NetworkX graph.
+
+        Returns:
+            A dictionary mapping nodes to positions scaled into [-1, 1], or
+            None if Graphviz is not available.
+        """
+        try:
+            pos = nx.nx_pydot.graphviz_layout(graph, prog='neato')
+
+        # Return None if Graphviz cannot be found
+        except (OSError, ImportError):
+
+            return None
+
+        # Scale the positions to match the in-process layout
+        return nx.rescale_layout_dict(pos)
+
+    def clear(self):
+        """
+        Removes all layouts from the cache.
+
+        Returns:
+            None
+        """
+        self.cache.clear()
+        self.previous.clear()
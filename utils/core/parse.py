@@ -1,7 +1,22 @@
 # -*- coding: utf-8 -*-
 
+from .registry import get_kind_index, get_registry
+from collections import OrderedDict
+
 import networkx as nx
 import json
+import threading
+
+
+# Define the categories of diagram elements in AI2D annotation
+element_categories = ['arrowHeads', 'arrows', 'blobs', 'text', 'containers',
+                      'imageConsts']
+
+# Set up a cache for annotation indices, which maps the identity of annotation
+# dictionaries to the dictionary and its index
+index_cache = OrderedDict()
+index_cache_size = 64
+index_cache_lock = threading.Lock()
 
 
 def create_graph(annotation, edges=False, arrowheads=False, mode='layout'):
@@ -136,34 +151,138 @@ def extract_types(elements, annotation):
     assert isinstance(elements, list)
     assert isinstance(annotation, dict)
 
-    # Define the target categories for various diagram elements
-    targets = ['arrowHeads', 'arrows', 'blobs', 'text', 'containers',
-               'imageConsts']
+    # Fetch the index of the annotation, which maps identifiers to types
+    types = get_index(annotation).types
 
-    # Create a dictionary for holding element types
-    element_types = {}
+    # Look up the type of each diagram element
+    element_types = {e: types[e] for e in elements if e in types}
 
-    # Loop over the diagram elements
-    for e in elements:
+    # Return the element type dictionary
+    return element_types
 
-        try:
-            # Search for matches in the target categories
-            for t in targets:
 
-                # Get the identifiers for each element category
-                ids = [i for i in annotation[t].keys()]
+class AnnotationIndex:
+    """
+    This class maps the identifiers of diagram elements in AI2D annotation to
+    their type, geometry and text value, so that elements can be looked up
+    without scanning the annotation.
+    """
+    def __init__(self, annotation):
+        """
+        This function initializes the AnnotationIndex class.
 
-                # If the element is found among the identifiers, add the
-                # type to the dictionary
-                if e in ids:
-                    element_types[e] = t
+        Parameters:
+            annotation: A dictionary containing AI2D annotation.
 
-        # Skip if the category is not found
-        except KeyError:
-            continue
+        Returns:
+            An AnnotationIndex object.
+        """
+        # Set up dictionaries mapping identifiers to the type, the label shown
+        # in the image, the geometry and the text value of each element
+        self.types, self.labels, self.geometry, self.values = {}, {}, {}, {}
 
-    # Return the element type dictionary
-    return element_types
+        # Set up a dictionary mapping types to lists of identifiers
+        self.elements = {}
+
+        for t in element_categories:
+
+            self.elements[t] = list(annotation.get(t, {}).keys())
+
+            for k, v in annotation.get(t, {}).items():
+
+                # If an identifier appears in several categories, the last
+                # category is used
+                self.types[k] = t
+                self.labels[k] = v.get('id', k)
+
+                # Text blocks are defined by rectangles and other elements by
+                # polygons
+                self.geometry[k] = v.get('polygon', v.get('rectangle'))
+
+                # Store the value of text blocks
+                if 'value' in v:
+
+                    self.values[k] = v['value']
+
+    def __contains__(self, element):
+        """
+        Checks if an identifier belongs to a diagram element.
+        """
+        return element in self.types
+
+    def __len__(self):
+        """
+        Returns the number of diagram elements in the index.
+        """
+        return len(self.types)
+
+    def kind(self, element):
+        """
+        Gets the type of a diagram element.
+
+        Parameters:
+            element: The identifier of a diagram element, e.g. B0.
+
+        Returns:
+            The type of the element, e.g. 'blobs', or None if the identifier
+            is not found.
+        """
+        return self.types.get(element)
+
+    def of_kind(self, kind):
+        """
+        Gets the identifiers of diagram elements of a given type.
+
+        Parameters:
+            kind: The type of the elements, e.g. 'blobs'.
+
+        Returns:
+            A list of identifiers in the order of the annotation.
+        """
+        return self.elements.get(kind, [])
+
+
+def get_index(annotation):
+    """
+    Gets the index for an annotation dictionary, building the index only once
+    for each dictionary.
+
+    Parameters:
+        annotation: A dictionary containing AI2D annotation.
+
+    Returns:
+        An AnnotationIndex object.
+    """
+    key = id(annotation)
+
+    # Return the cached index if it belongs to the same dictionary. The cache is
+    # also used by the thread preparing upcoming diagrams, so access is locked.
+    with index_cache_lock:
+
+        if key in index_cache and index_cache[key][0] is annotation:
+
+            index_cache.move_to_end(key)
+
+            return index_cache[key][1]
+
+    # Otherwise build the index and add it to the cache. The dictionary is kept
+    # in the cache, so that its identity is not reused by another dictionary.
+    index = AnnotationIndex(annotation)
+
+    with index_cache_lock:
+
+        # Use the index built by another thread in the meantime, if any
+        if key in index_cache and index_cache[key][0] is annotation:
+
+            return index_cache[key][1]
+
+        index_cache[key] = (annotation, index)
+
+        while len(index_cache) > index_cache_size:
+
+            index_cache.popitem(last=False)
+
+    return index
 
 
 def get_node_dict(graph, kind=None):
@@ -180,15 +299,14 @@ def get_node_dict(graph, kind=None):
         A dictionary with node names as keys and kind as values.
     """
 
-    # Generate a dictionary with nodes and their kind
-    node_types = nx.get_node_attributes(graph, 'kind')
+    # Fetch the kind index of the graph, which holds the nodes and their kind
+    index = get_kind_index(graph)
 
     # If the requested output consists of node groups, return group dict
     if kind == 'group':
 
         # Generate a dictionary of groups
-        group_dict = {k: k for k, v in node_types.items() if
-                      v == 'group'}
+        group_dict = {k: k for k in index.get_nodes('group')}
 
         # Return dictionary
         return group_dict
@@ -197,7 +315,7 @@ def get_node_dict(graph, kind=None):
     if kind == 'node':
 
         # Generate a dictionary of nodes
-        node_dict = {k: k for k, v in node_types.items() if v not in
+        node_dict = {k: k for k, v in index.get_kinds().items() if v not in
                      ['group', 'relation']}
 
         # Return dictionary
@@ -207,15 +325,14 @@ def get_node_dict(graph, kind=None):
     if kind == 'relation':
 
         # Generate a dictionary of RST relations
-        rel_dict = {k: k for k, v in node_types.items() if v ==
-                    'relation'}
+        rel_dict = {k: k for k in index.get_nodes('relation')}
 
         # Return dictionary
         return rel_dict
 
     # Otherwise return all node types
     else:
-        return node_types
+        return dict(index.get_kinds())
 
 
 def load_annotation(json_path):
@@ -385,17 +502,9 @@ def validate_input(user_input, current_graph, **kwargs):
 
         if kwargs['groups']:
 
-            # Generate a dictionary of groups present in the graph
-            group_dict = get_node_dict(current_graph, kind='group')
-
-            # Count the current groups and enumerate for convenience. This
-            # allows the user to refer to group number instead of complex
-            # identifier.
-            group_dict = {"g{}".format(i): k for i, (k, v) in
-                          enumerate(group_dict.items(), start=1)}
-
-            # Create a list of valid identifiers based on group dictionary keys
-            valid_groups = [g.lower() for g in group_dict.keys()]
+            # Fetch the aliases of groups present in the graph. This allows
+            # the user to refer to group number instead of complex identifier.
+            valid_groups = get_registry(current_graph).get_aliases('group')
 
             # Add valid groups to the set of valid elements
             valid_elems.update(valid_groups)
@@ -409,17 +518,10 @@ def validate_input(user_input, current_graph, **kwargs):
 
         if kwargs['rst']:
 
-            # Generate a dictionary of RST relations present in the graph
-            relation_ix = get_node_dict(current_graph, kind='relation')
-
-            # Loop through current RST relations and rename for convenience.
-            # This allows the user to refer to the relation identifier (e.g. r1)
+            # Fetch the aliases of RST relations present in the graph. This
+            # allows the user to refer to the relation identifier (e.g. r1)
             # instead of complex relation ID (e.g. B0-T1+B9) during annotation.
-            relation_ix = {"R{}".format(i): k for i, (k, v) in
-                           enumerate(relation_ix.items(), start=1)}
-
-            # Create a list of valid relation identifiers based on the dict keys
-            valid_rels = [r.lower() for r in relation_ix.keys()]
+            valid_rels = get_registry(current_graph).get_aliases('relation')
 
             # Add valid relations to the set of valid elements
             valid_elems.update(valid_rels)
@@ -457,15 +559,14 @@ def replace_aliases(current_graph, kind='group'):
         kind: A string indicating the type of alias used ('group' or 'relation')
 
     Returns:
-         A dictionary mapping group aliases to actual group identifiers.
+         A dictionary mapping group aliases to actual group identifiers. The
+         dictionary is kept up to date by the registry and must not be
+         modified.
     """
 
-    # Generate a dictionary of nodes present in the graph
-    gd = get_node_dict(current_graph, kind=kind)
-
-    # Count the current nodes and enumerate for convenience
-    gd = {"{}{}".format(kind[0], i):
-          k for i, (k, v) in enumerate(gd.items(), start=1)}
+    # Fetch the aliases from the registry of the graph, which keeps track of
+    # the aliases as nodes are added and removed
+    gd = get_registry(current_graph).get_aliases(kind)
 
     # Return the group dictionary
     return gd
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+
+from .diagram import Diagram
+from .draw import draw_composite, draw_layout
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Prefetcher:
+    """
+    This class prepares items in a background thread before they are needed,
+    e.g. the next diagrams while the user annotates the current one.
+    """
+    def __init__(self, function, workers=1):
+        """
+        This function initializes the Prefetcher class.
+
+        Parameters:
+            function: The function used for preparing an item.
+            workers: The number of background threads.
+
+        Returns:
+            A Prefetcher object.
+        """
+        self.function = function
+
+        # Set up a pool of threads and a dictionary mapping keys to pending
+        # results
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = OrderedDict()
+
+    def prefetch(self, key, *args, **kwargs):
+        """
+        Starts preparing an item in the background, unless already started.
+
+        Parameters:
+            key: A hashable identifying the item.
+            args: Arguments passed to the function.
+            kwargs: Keyword arguments passed to the function.
+
+        Returns:
+            None
+        """
+        if key not in self.pending:
+
+            self.pending[key] = self.executor.submit(self.function, *args,
+                                                     **kwargs)
+
+    def get(self, key, *args, **kwargs):
+        """
+        Fetches an item, waiting for the background thread if the item is
+        being prepared, or preparing the item directly if it has not been
+        prefetched.
+
+        Parameters:
+            key: A hashable identifying the item.
+            args: Arguments passed to the function.
+            kwargs: Keyword arguments passed to the function.
+
+        Returns:
+            The item returned by the function.
+        """
+        if key in self.pending:
+
+            return self.pending.pop(key).result()
+
+        return self.function(*args, **kwargs)
+
+    def close(self):
+        """
+        Cancels the items that have not been started and stops the threads.
+
+        Returns:
+            None
+        """
+        for future in self.pending.values():
+
+            future.cancel()
+
+        self.pending.clear()
+        self.executor.shutdown(wait=True)
+
+
+class RingPrefetcher:
+    """
+    This class prepares the items around the current position in a sequence
+    in background threads, keeping a bounded window of items before and after
+    the current position, e.g. for browsing diagrams back and forth.
+    """
+    def __init__(self, function, length, ahead=3, behind=2, workers=1):
+        """
+        This function initializes the RingPrefetcher class.
+
+        Parameters:
+            function: The function used for preparing an item, which takes the
+                      position of the item.
+            length: The number of items in the sequence.
+            ahead: The number of items prepared after the current position.
+            behind: The number of items kept before the current position.
+            workers: The number of background threads.
+
+        Returns:
+            A RingPrefetcher object.
+        """
+        self.function = function
+        self.length = length
+        self.ahead = ahead
+        self.behind = behind
+
+        # Set up a pool of threads and a dictionary mapping positions to
+        # pending or finished results
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.window = {}
+
+    def get(self, position):
+        """
+        Fetches the item at a position, moving the window to the position.
+
+        Parameters:
+            position: The position of the item.
+
+        Returns:
+            The item returned by the function.
+        """
+        # Get the positions in the window, starting from the current position
+        # and preparing the upcoming items before the previous ones
+        positions = [position] + \
+            [position + i for i in range(1, self.ahead + 1)] + \
+            [position - i for i in range(1, self.behind + 1)]
+
+        positions = [p for p in positions if 0 <= p < self.length]
+
+        # Drop the items outside the window, cancelling them if not started
+        for p in [p for p in self.window if p not in positions]:
+
+            self.window.pop(p).cancel()
+
+        # Start preparing the items in the window
+        for p in positions:
+
+            if p not in self.window:
+
+                self.window[p] = self.executor.submit(self.function, p)
+
+        return self.window[position].result()
+
+    def close(self):
+        """
+        Cancels the items that have not been started and stops the threads.
+
+        Returns:
+            None
+        """
+        for future in self.window.values():
+
+            future.cancel()
+
+        self.window.clear()
+        self.executor.shutdown(wait=True)
+
+
+def render_view(corpus, image_name, dpi=80):
+    """
+    Loads a diagram and draws a composite image of its annotation for viewing.
+
+    Parameters:
+        corpus: A LazyCorpus object.
+        image_name: The filename of the AI2D diagram image, e.g. 1132.png.
+        dpi: The resolution of the images as dots per inch.
+
+    Returns:
+        A tuple of the Diagram object and the composite image.
+    """
+    # Load the Diagram object with all its graphs
+    diagram = corpus.materialize(image_name)
+
+    return diagram, draw_composite(diagram, height=720, dpi=dpi)
+
+
+def prepare_diagram(annotation, diagram, image_path, review=False):
+    """
+    Prepares a diagram for annotation by creating the Diagram object, if
+    needed, and drawing the layout segmentation and the graph shown first, so
+    that the images are cached when annotation begins.
+
+    Parameters:
+        annotation: A dictionary containing AI2D annotation.
+        diagram: A Diagram object or None.
+        image_path: Path to the image file containing the diagram.
+        review: A Boolean defining whether review mode is active or not.
+
+    Returns:
+        A Diagram object.
+    """
+    # Initialise a Diagram object if needed
+    if diagram is None:
+
+        diagram = Diagram(annotation, image_path)
+
+    # Skip drawing diagrams that will not be annotated
+    if diagram.complete and not review:
+
+        return diagram
+
+    # Draw the layout segmentation, which is stored in the cache
+    draw_layout(diagram.image_filename, diagram.annotation, 480)
+
+    # Draw the graph for the first task that is incomplete. In review mode,
+    # annotation begins from grouping.
+    if review or not diagram.group_complete:
+
+        diagram.render_graph(diagram.layout_graph, mode='layout')
+
+    elif not diagram.connectivity_complete and \
+            diagram.connectivity_graph is not None:
+
+        diagram.render_graph(diagram.connectivity_graph, mode='connectivity')
+
+    elif not diagram.rst_complete and diagram.rst_graph is not None:
+
+        diagram.render_graph(diagram.rst_graph, mode='rst')
+
+    return diagram
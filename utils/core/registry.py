@@ -0,0 +1,742 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import weakref
+
+
+# Define the kinds of nodes that are referred to using aliases and the prefix
+# of their aliases
+alias_prefixes = {'group': 'g', 'relation': 'r'}
+
+# Set up dictionaries mapping graphs to their alias registries and kind
+# indices. The graphs are held using weak references, so that the registry of
+# a graph is discarded with the graph, and copies of a graph receive registries
+# of their own.
+registries = weakref.WeakKeyDictionary()
+kind_indices = weakref.WeakKeyDictionary()
+registries_lock = threading.Lock()
+
+# Set up a dictionary mapping graphs to the histories used for undoing changes,
+# which are set up using core/history.py
+histories = weakref.WeakKeyDictionary()
+
+# Define a placeholder for node attributes that do not exist
+missing = object()
+
+
+class KindIndex:
+    """
+    This class groups the nodes of a graph by their kind, e.g. 'text' or
+    'group', keeping the nodes of each kind in the order of the graph. The
+    index is updated as nodes are added and removed, so that the nodes of a
+    given kind can be fetched without scanning the graph.
+    """
+    def __init__(self, graph):
+        """
+        This function initializes the KindIndex class.
+
+        Parameters:
+            graph: A NetworkX Graph.
+
+        Returns:
+            A KindIndex object.
+        """
+        self.graph = weakref.ref(graph)
+
+        # Set up a dictionary mapping nodes to their kind and a dictionary
+        # mapping kinds to the nodes of the kind, which are stored as the keys
+        # of a dictionary for keeping their order
+        self.kinds = {}
+        self.buckets = {}
+
+        # Set up a counter for the number of nodes in the graph, which is used
+        # for detecting changes made without the index
+        self.size = None
+
+        # Add the existing nodes in the order of the graph
+        self.sync()
+
+    def add(self, node, kind):
+        """
+        Adds a node that has been added to the graph.
+
+        Parameters:
+            node: The identifier of the node.
+            kind: The kind of the node, or None if the node has no kind.
+
+        Returns:
+            None
+        """
+        # Remove the node first if its kind has changed
+        if node in self.kinds and self.kinds[node] != kind:
+
+            self.remove(node)
+
+        if kind is None or node in self.kinds:
+
+            return
+
+        self.kinds[node] = kind
+        self.buckets.setdefault(kind, {})[node] = None
+
+    def remove(self, node):
+        """
+        Removes a node that has been removed from the graph.
+
+        Parameters:
+            node: The identifier of the node.
+
+        Returns:
+            None
+        """
+        kind = self.kinds.pop(node, None)
+
+        if kind is not None:
+
+            del self.buckets[kind][node]
+
+    def sync(self):
+        """
+        Rebuilds the index from the nodes in the graph.
+
+        Returns:
+            None
+        """
+        graph = self.graph()
+
+        self.kinds = {n: k for n, k in graph.nodes(data='kind')
+                      if k is not None}
+        self.buckets = {}
+
+        for node, kind in self.kinds.items():
+
+            self.buckets.setdefault(kind, {})[node] = None
+
+        self.size = graph.number_of_nodes()
+
+    def check(self):
+        """
+        Rebuilds the index if the graph has been changed without the index,
+        which is detected from the number of nodes.
+
+        Returns:
+            None
+        """
+        if self.graph().number_of_nodes() != self.size:
+
+            self.sync()
+
+    def get_nodes(self, kind):
+        """
+        Gets the nodes of a given kind.
+
+        Parameters:
+            kind: The kind of the nodes, e.g. 'text' or 'group'.
+
+        Returns:
+            A list of nodes in the order of the graph.
+        """
+        self.check()
+
+        return list(self.buckets.get(kind, ()))
+
+    def get_kinds(self):
+        """
+        Gets the kind of each node.
+
+        Returns:
+            A dictionary mapping nodes to their kind, which must not be
+            modified.
+        """
+        self.check()
+
+        return self.kinds
+
+
+class AliasRegistry:
+    """
+    This class keeps track of the aliases used for referring to grouping nodes
+    (g1, g2, ...) and RST relations (r1, r2, ...) in a graph. Each node keeps
+    its alias until it is removed, and new nodes receive the next free
+    number, so that aliases do not change when other nodes are removed.
+    """
+    def __init__(self, graph):
+        """
+        This function initializes the AliasRegistry class.
+
+        Parameters:
+            graph: A NetworkX Graph.
+
+        Returns:
+            An AliasRegistry object.
+        """
+        self.graph = weakref.ref(graph)
+
+        # Set up dictionaries mapping aliases to nodes and nodes to aliases,
+        # and the number of aliases given for each kind of node
+        self.aliases = {kind: {} for kind in alias_prefixes}
+        self.nodes = {}
+        self.counters = {kind: 0 for kind in alias_prefixes}
+
+        # Set up a counter for the number of nodes in the graph, which is used
+        # for detecting changes made without the registry
+        self.size = None
+
+        # Number the existing nodes in the order of the graph
+        self.sync()
+
+    def add(self, node, kind, alias=None):
+        """
+        Gives an alias to a node that has been added to the graph.
+
+        Parameters:
+            node: The identifier of the node.
+            kind: The kind of the node, either 'group' or 'relation'.
+            alias: An optional alias to restore, e.g. when undoing the removal
+                   of the node. The alias is used if it is not in use.
+
+        Returns:
+            The alias of the node, e.g. 'g3'.
+        """
+        if node in self.nodes:
+
+            return self.nodes[node]
+
+        # Restore the alias if requested and available, otherwise assign the
+        # next number for the kind of node
+        if alias is None or alias in self.aliases[kind]:
+
+            self.counters[kind] += 1
+            alias = '{}{}'.format(alias_prefixes[kind], self.counters[kind])
+
+        # Make sure that the numbers of restored aliases are not given to new
+        # nodes
+        elif alias.startswith(alias_prefixes[kind]) and \
+                alias[len(alias_prefixes[kind]):].isdigit():
+
+            self.counters[kind] = max(self.counters[kind],
+                                      int(alias[len(alias_prefixes[kind]):]))
+
+        self.aliases[kind][alias] = node
+        self.nodes[node] = alias
+
+        return alias
+
+    def remove(self, node):
+        """
+        Removes the alias of a node that has been removed from the graph.
+
+        Parameters:
+            node: The identifier of the node.
+
+        Returns:
+            None
+        """
+        alias = self.nodes.pop(node, None)
+
+        if alias is not None:
+
+            for aliases in self.aliases.values():
+
+                aliases.pop(alias, None)
+
+    def sync(self):
+        """
+        Updates the aliases to match the nodes in the graph. Nodes that have
+        been removed lose their aliases and new nodes receive new aliases in
+        the order of the graph.
+
+        Returns:
+            None
+        """
+        graph = self.graph()
+
+        # Get the nodes in the graph that are referred to using aliases
+        kinds = {n: k for n, k in graph.nodes(data='kind')
+                 if k in alias_prefixes}
+
+        # Remove the aliases of nodes that no longer exist or whose kind has
+        # changed
+        for node in [n for n in self.nodes if n not in kinds or
+                     self.nodes[n] not in self.aliases[kinds[n]]]:
+
+            self.remove(node)
+
+        # Add aliases for new nodes
+        for node, kind in kinds.items():
+
+            self.add(node, kind)
+
+        self.size = graph.number_of_nodes()
+
+    def check(self):
+        """
+        Updates the aliases if the graph has been changed without the
+        registry, which is detected from the number of nodes.
+
+        Returns:
+            None
+        """
+        if self.graph().number_of_nodes() != self.size:
+
+            self.sync()
+
+    def get_aliases(self, kind):
+        """
+        Gets the aliases for a kind of node.
+
+        Parameters:
+            kind: The kind of the nodes, either 'group' or 'relation'.
+
+        Returns:
+            A dictionary mapping aliases to nodes, which must not be modified.
+        """
+        self.check()
+
+        return self.aliases[kind]
+
+    def alias(self, node):
+        """
+        Gets the alias of a node.
+
+        Parameters:
+            node: The identifier of the node.
+
+        Returns:
+            The alias of the node, e.g. 'g3', or None if the node has no alias.
+        """
+        self.check()
+
+        return self.nodes.get(node)
+
+    def resolve(self, alias):
+        """
+        Gets the node referred to by an alias.
+
+        Parameters:
+            alias: An alias, e.g. 'g3' or 'R1'.
+
+        Returns:
+            The identifier of the node, or None if the alias is not in use.
+        """
+        self.check()
+
+        for aliases in self.aliases.values():
+
+            if alias.lower() in aliases:
+
+                return aliases[alias.lower()]
+
+        return None
+
+
+def get_registry(graph):
+    """
+    Gets the alias registry of a graph, setting up the registry if needed.
+
+    Parameters:
+        graph: A NetworkX Graph.
+
+    Returns:
+        An AliasRegistry object.
+    """
+    with registries_lock:
+
+        if graph not in registries:
+
+            registries[graph] = AliasRegistry(graph)
+
+        return registries[graph]
+
+
+def get_kind_index(graph):
+    """
+    Gets the kind index of a graph, setting up the index if needed.
+
+    Parameters:
+        graph: A NetworkX Graph.
+
+    Returns:
+        A KindIndex object.
+    """
+    with registries_lock:
+
+        if graph not in kind_indices:
+
+            kind_indices[graph] = KindIndex(graph)
+
+        return kind_indices[graph]
+
+
+def apply_changes(graph, changes):
+    """
+    Applies a list of changes to a graph, updating the kind index and the
+    aliases of the graph, and records the changes in the history of the graph,
+    if any. Each change is a tuple, whose first item defines the type of the
+    change:
+
+        ('node+', node, attributes, alias): Adds a node that does not exist.
+        ('node-', node, attributes, alias): Removes a node without edges.
+        ('edge+', u, v, key, attributes): Adds an edge that does not exist.
+        ('edge-', u, v, key, attributes): Removes an edge.
+        ('attr', node, name, old, new): Sets or deletes a node attribute.
+        ('edge~', u, v, key, old, new): Replaces the attributes of an edge.
+
+    The key of an edge is None unless the graph is a multigraph. The alias is
+    filled in when the change is applied.
+
+    Parameters:
+        graph: A NetworkX Graph.
+        changes: A list of changes.
+
+    Returns:
+        None
+    """
+    registry, index = get_registry(graph), get_kind_index(graph)
+    registry.check()
+    index.check()
+
+    applied, pending = [], list(reversed(changes))
+
+    while pending:
+
+        change = pending.pop()
+
+        # Set the attributes of nodes that exist already
+        if change[0] == 'node+' and change[1] in graph:
+
+            node, attributes = change[1:3]
+            current = graph.nodes[node]
+
+            pending.extend(reversed([
+                ('attr', node, k, current.get(k, missing), v)
+                for k, v in attributes.items()
+                if current.get(k, missing) != v]))
+
+            continue
+
+        # Update the attributes of edges that exist already in graphs that
+        # are not multigraphs
+        if change[0] == 'edge+' and not graph.is_multigraph() and \
+                graph.has_edge(change[1], change[2]):
+
+            u, v, key, attributes = change[1:]
+            old = dict(graph[u][v])
+
+            pending.append(('edge~', u, v, None, old, dict(old, **attributes)))
+
+            continue
+
+        if change[0] == 'node+':
+
+            node, attributes, alias = change[1:]
+
+            graph.add_node(node, **attributes)
+
+            kind = attributes.get('kind')
+            index.add(node, kind)
+
+            if kind in alias_prefixes:
+
+                alias = registry.add(node, kind, alias=alias)
+
+            change = ('node+', node, attributes, alias)
+
+        elif change[0] == 'node-':
+
+            node = change[1]
+
+            # Store the attributes and the alias for restoring the node
+            change = ('node-', node, dict(graph.nodes[node]),
+                      registry.nodes.get(node))
+
+            graph.remove_node(node)
+            registry.remove(node)
+            index.remove(node)
+
+        elif change[0] == 'edge+':
+
+            u, v, key, attributes = change[1:]
+
+            if graph.is_multigraph():
+
+                key = graph.add_edge(u, v, key=key, **attributes)
+
+            else:
+                graph.add_edge(u, v, **attributes)
+
+            change = ('edge+', u, v, key, attributes)
+
+        elif change[0] == 'edge-':
+
+            u, v, key = change[1:4]
+
+            # Store the attributes for restoring the edge
+            if graph.is_multigraph():
+
+                change = ('edge-', u, v, key, dict(graph[u][v][key]))
+                graph.remove_edge(u, v, key=key)
+
+            else:
+                change = ('edge-', u, v, None, dict(graph[u][v]))
+                graph.remove_edge(u, v)
+
+        elif change[0] == 'attr':
+
+            node, name, old, new = change[1:]
+
+            if new is missing:
+
+                graph.nodes[node].pop(name, None)
+
+            else:
+                graph.nodes[node][name] = new
+
+            # Update the kind index and the aliases if the kind has changed
+            if name == 'kind':
+
+                kind = graph.nodes[node].get('kind')
+                index.add(node, kind)
+                registry.remove(node)
+
+                if kind in alias_prefixes:
+
+                    registry.add(node, kind)
+
+        elif change[0] == 'edge~':
+
+            u, v, key, old, new = change[1:]
+
+            data = graph[u][v][key] if graph.is_multigraph() else graph[u][v]
+            data.clear()
+            data.update(new)
+
+        applied.append(change)
+
+    # Update the number of nodes known to the registry and the index
+    registry.size = index.size = graph.number_of_nodes()
+
+    # Record the changes in the history of the graph
+    history = histories.get(graph)
+
+    if history is not None:
+
+        history.record(applied)
+
+
+def invert_change(change):
+    """
+    Gets the change that reverses a change applied to a graph.
+
+    Parameters:
+        change: A change as defined in apply_changes.
+
+    Returns:
+        The reverse change.
+    """
+    inverse = {'node+': 'node-', 'node-': 'node+',
+               'edge+': 'edge-', 'edge-': 'edge+'}
+
+    if change[0] in inverse:
+
+        return (inverse[change[0]],) + change[1:]
+
+    if change[0] == 'attr':
+
+        node, name, old, new = change[1:]
+
+        return ('attr', node, name, new, old)
+
+    u, v, key, old, new = change[1:]
+
+    return ('edge~', u, v, key, new, old)
+
+
+def add_nodes(graph, nodes, aliases=None):
+    """
+    Adds nodes to a graph and updates the kind index and the aliases of the
+    graph.
+
+    Parameters:
+        graph: A NetworkX Graph.
+        nodes: A list of (identifier, attributes) tuples.
+        aliases: An optional dictionary mapping nodes to the aliases given to
+                 them if available, e.g. their aliases in another graph.
+
+    Returns:
+        None
+    """
+    aliases = aliases or {}
+
+    apply_changes(graph, [('node+', node, dict(attributes), aliases.get(node))
+                          for node, attributes in nodes])
+
+
+def add_aliased_node(graph, node, kind, **attributes):
+    """
+    Adds a grouping node or an RST relation to a graph and gives the node an
+    alias.
+
+    Parameters:
+        graph: A NetworkX Graph.
+        node: The identifier of the node.
+        kind: The kind of the node, either 'group' or 'relation'.
+        attributes: Other attributes of the node.
+
+    Returns:
+        The alias of the node, e.g. 'g3'.
+    """
+    add_nodes(graph, [(node, dict(attributes, kind=kind))])
+
+    return get_registry(graph).alias(node)
+
+
+def remove_nodes(graph, nodes):
+    """
+    Removes nodes and their edges from a graph and updates the kind index and
+    the aliases of the graph.
+
+    Parameters:
+        graph: A NetworkX Graph.
+        nodes: A list of node identifiers.
+
+    Returns:
+        None
+    """
+    changes, removed = [], set()
+
+    for node in nodes:
+
+        if node not in graph or node in removed:
+
+            continue
+
+        removed.add(node)
+
+        # Collect the edges of the node, including their keys in multigraphs
+        if graph.is_multigraph():
+
+            edges = graph.in_edges(node, keys=True) if graph.is_directed() \
+                else []
+            edges = list(edges) + list(graph.edges(node, keys=True))
+
+        else:
+            edges = graph.in_edges(node) if graph.is_directed() else []
+            edges = [e + (None,) for e in list(edges) +
+                     list(graph.edges(node))]
+
+        # Remove each edge once, including the edges between removed nodes
+        for u, v, key in edges:
+
+            if (u, v, key) in removed or (not graph.is_directed() and
+                                          (v, u, key) in removed):
+
+                continue
+
+            removed.add((u, v, key))
+            changes.append(('edge-', u, v, key, None))
+
+        changes.append(('node-', node, None, None))
+
+    apply_changes(graph, changes)
+
+
+def add_edges(graph, edges, **attributes):
+    """
+    Adds edges to a graph, adding any missing nodes.
+
+    Parameters:
+        graph: A NetworkX Graph.
+        edges: A list of (u, v) or (u, v, attributes) tuples.
+        attributes: Attributes added to all edges.
+
+    Returns:
+        None
+    """
+    changes, added = [], set()
+
+    for edge in edges:
+
+        u, v = edge[:2]
+        data = dict(attributes, **(edge[2] if len(edge) > 2 else {}))
+
+        # Add missing nodes without attributes
+        for n in [u, v]:
+
+            if n not in graph and n not in added:
+
+                added.add(n)
+                changes.append(('node+', n, {}, None))
+
+        changes.append(('edge+', u, v, None, data))
+
+    apply_changes(graph, changes)
+
+
+def remove_edges(graph, edges):
+    """
+    Removes edges from a graph. In multigraphs, edges given without a key
+    remove the edge between the nodes that was added last.
+
+    Parameters:
+        graph: A NetworkX Graph.
+        edges: A list of (u, v) or (u, v, key) tuples.
+
+    Returns:
+        None
+    """
+    changes = []
+
+    # Track the keys removed from multigraphs
+    removed = set()
+
+    for edge in edges:
+
+        u, v = edge[:2]
+
+        if not graph.has_edge(u, v):
+
+            continue
+
+        if graph.is_multigraph():
+
+            keys = [k for k in graph[u][v] if (u, v, k) not in removed]
+            key = edge[2] if len(edge) > 2 else (keys[-1] if keys else None)
+
+            if key is None or key not in keys:
+
+                continue
+
+            removed.add((u, v, key))
+
+        else:
+
+            if (u, v, None) in removed or (not graph.is_directed() and
+                                           (v, u, None) in removed):
+
+                continue
+
+            key = None
+            removed.add((u, v, None))
+
+        changes.append(('edge-', u, v, key, None))
+
+    apply_changes(graph, changes)
+
+
+def set_node_attributes(graph, values, name):
+    """
+    Sets an attribute of nodes in a graph.
+
+    Parameters:
+        graph: A NetworkX Graph.
+        values: A dictionary mapping nodes to the values of the attribute.
+        name: The name of the attribute.
+
+    Returns:
+        None
+    """
+    changes = [('attr', n, name, graph.nodes[n].get(name, missing), v)
+               for n, v in values.items() if n in graph]
+
+    apply_changes(graph, changes)
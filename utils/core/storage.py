@@ -0,0 +1,1160 @@
+# -*- coding: utf-8 -*-
+
+from .compact import *
+from collections import OrderedDict
+from contextlib import contextmanager
+import copy
+import json
+import os
+import pandas as pd
+import pickle
+import threading
+import time
+
+
+# Define the columns stored in the shard of each diagram; the remaining columns
+# are stored in the index.
+shard_columns = ['annotation', 'diagram']
+
+# Define the graphs of a Diagram object, which are serialized separately in the
+# shards so that they can be loaded on demand. Frozen graphs are stored using
+# the compact representation defined in compact.py.
+graph_attributes = ['layout_graph', 'connectivity_graph', 'rst_graph']
+
+# Define the layers whose completion is tracked in the index
+status_flags = ['complete', 'group_complete', 'connectivity_complete',
+                'rst_complete']
+
+# Define the columns describing the status of each diagram in the index
+status_columns = ['annotated'] + status_flags + ['comments']
+
+
+class PickleStore:
+    """
+    This class stores AI2D-RST annotation in a single pandas DataFrame pickle,
+    which is rewritten completely whenever a diagram is saved. The status of
+    each diagram is mirrored into a sidecar index, which can be read without
+    unpickling the Diagram objects.
+    """
+    def __init__(self, path):
+        """
+        This function initializes the PickleStore class.
+
+        Parameters:
+            path: Path to the pickled pandas DataFrame.
+
+        Returns:
+            A PickleStore object.
+        """
+        # Set paths to the DataFrame, the index and its lock
+        self.path = path
+        self.index_path = path + '.index'
+        self.lock_path = self.index_path + '.lock'
+
+    def exists(self):
+        """
+        Checks whether the annotation has been stored already.
+
+        Returns:
+            True or False depending on whether the DataFrame exists on disk.
+        """
+        return os.path.isfile(self.path)
+
+    def load(self):
+        """
+        Loads the annotation from disk.
+
+        Returns:
+            A pandas DataFrame containing the annotation.
+        """
+        annotation_df = pd.read_pickle(self.path)
+
+        # Include any diagrams appended to a journal by an earlier run using
+        # a JournalStore. The journal is removed when the DataFrame is saved.
+        for journal_path in [self.path + '.compacting', self.path + '.journal']:
+
+            replay_journal(journal_path, annotation_df)
+
+        return annotation_df
+
+    def read_index(self):
+        """
+        Reads the index from disk.
+
+        Returns:
+            A dictionary with the original column order under the key 'columns'
+            and a pandas DataFrame with one row per diagram under 'index'.
+        """
+        with open(self.index_path, 'rb') as index_file:
+
+            return pickle.load(index_file)
+
+    def load_index(self):
+        """
+        Loads the index without reading any diagrams.
+
+        Returns:
+            A pandas DataFrame with the image name, AI2D category, completion
+            flags and number of comments of each diagram.
+        """
+        return self.read_index()['index']
+
+    def write_index(self, annotation_df):
+        """
+        Builds an index for a DataFrame and writes it to disk.
+
+        Parameters:
+            annotation_df: A pandas DataFrame containing the annotation.
+
+        Returns:
+            None
+        """
+        write_pickle({'columns': list(annotation_df.columns),
+                      'index': build_index(annotation_df)}, self.index_path)
+
+    def update_index(self, annotation_df, ix):
+        """
+        Updates the status of the diagram on row ix in the index.
+
+        Parameters:
+            annotation_df: A pandas DataFrame containing the annotation.
+            ix: The index of the row that has been updated.
+
+        Returns:
+            None
+        """
+        # Get the status of the diagram
+        status = diagram_status(annotation_df.at[ix, 'diagram'])
+
+        # Lock the index, so that several processes may update it at once
+        with file_lock(self.lock_path):
+
+            # Build the index from scratch if it does not exist yet, e.g. for
+            # annotation begun before indices were introduced.
+            if not os.path.isfile(self.index_path):
+
+                self.write_index(annotation_df)
+
+                return
+
+            # Re-read the index, which other processes may have updated
+            index = self.read_index()
+
+            # Update the status of the diagram
+            for column in status_columns:
+
+                index['index'].at[ix, column] = status[column]
+
+            # Write the index to disk
+            write_pickle(index, self.index_path)
+
+    def initialize(self, annotation_df):
+        """
+        Writes a new DataFrame and its index to disk.
+
+        Parameters:
+            annotation_df: A pandas DataFrame containing the annotation.
+
+        Returns:
+            None
+        """
+        annotation_df.to_pickle(self.path)
+
+        self.write_index(annotation_df)
+
+    def save(self, annotation_df, ix):
+        """
+        Saves the annotation after the diagram on row ix has been updated.
+
+        Parameters:
+            annotation_df: A pandas DataFrame containing the annotation.
+            ix: The index of the row that has been updated.
+
+        Returns:
+            None
+        """
+        # Write the entire DataFrame to disk
+        annotation_df.to_pickle(self.path)
+
+        # Remove any journal left by an earlier run using a JournalStore, which
+        # has been included in the DataFrame when loading. Otherwise the older
+        # records would be replayed over the DataFrame when it is next read.
+        for journal_path in [self.path + '.compacting', self.path + '.journal']:
+
+            if os.path.isfile(journal_path):
+
+                os.remove(journal_path)
+
+        # Update the index
+        self.update_index(annotation_df, ix)
+
+    def close(self):
+        """
+        Finishes any pending writes.
+
+        Returns:
+            None
+        """
+        pass
+
+
+class JournalStore(PickleStore):
+    """
+    This class stores AI2D-RST annotation as a snapshot of the pandas DataFrame
+    and an append-only journal of updated Diagram objects. The journal is
+    compacted into the snapshot in the background.
+    """
+    def __init__(self, path, compact_every=100):
+        """
+        This function initializes the JournalStore class.
+
+        Parameters:
+            path: Path to the pickled pandas DataFrame used as a snapshot.
+            compact_every: The number of journal records after which the
+                           journal is compacted into the snapshot.
+
+        Returns:
+            A JournalStore object.
+        """
+        # Initialize the parent class with the path to the snapshot
+        super().__init__(path)
+
+        # Set paths to the journal and to the segment being compacted
+        self.journal_path = path + '.journal'
+        self.segment_path = path + '.compacting'
+
+        # Set up the compaction threshold and a counter for journal records
+        self.compact_every = compact_every
+        self.records = 0
+
+        # Set up a placeholder for the thread compacting the journal
+        self.compactor = None
+
+    def load(self, repair=True):
+        """
+        Loads the snapshot and replays any journal records on top of it.
+
+        Parameters:
+            repair: A Boolean defining whether to remove a truncated record
+                    from the end of the journal, so that new records can be
+                    appended after the last complete record. Readers that do
+                    not write to the journal must not repair it.
+
+        Returns:
+            A pandas DataFrame containing the annotation.
+        """
+        # Read the snapshot
+        annotation_df = pd.read_pickle(self.path)
+
+        # Replay a segment left over from an interrupted compaction first
+        replay_journal(self.segment_path, annotation_df)
+
+        # Replay the current journal and keep track of its length
+        self.records = replay_journal(self.journal_path, annotation_df,
+                                      repair=repair)
+
+        return annotation_df
+
+    def save(self, annotation_df, ix):
+        """
+        Appends the diagram on row ix to the journal.
+
+        Parameters:
+            annotation_df: A pandas DataFrame containing the annotation.
+            ix: The index of the row that has been updated.
+
+        Returns:
+            None
+        """
+        # Open the journal for appending and write the updated diagram
+        with open(self.journal_path, 'ab') as journal:
+
+            pickle.dump((ix, annotation_df.at[ix, 'diagram']), journal,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+            # Make sure the record has reached the disk
+            journal.flush()
+            os.fsync(journal.fileno())
+
+        # Update the index
+        self.update_index(annotation_df, ix)
+
+        # Increment the record counter
+        self.records += 1
+
+        # Compact the journal if it has grown too long
+        if self.records >= self.compact_every:
+
+            self.compact()
+
+    def compact(self):
+        """
+        Starts compacting the journal into the snapshot in a background thread.
+
+        Returns:
+            None
+        """
+        # Do not start another compaction if one is already running
+        if self.compactor is not None and self.compactor.is_alive():
+
+            return
+
+        # Rotate the journal into a segment, unless a previous compaction left
+        # a segment behind, in which case that segment is compacted first.
+        if not os.path.isfile(self.segment_path):
+
+            # Check that there is something to compact
+            if not os.path.isfile(self.journal_path):
+
+                return
+
+            os.replace(self.journal_path, self.segment_path)
+
+            # Reset the record counter for the new journal
+            self.records = 0
+
+        # Compact the segment in a background thread. The thread is not a
+        # daemon, so that the interpreter waits for it to finish on exit.
+        self.compactor = threading.Thread(target=compact_journal,
+                                          args=(self.path, self.segment_path))
+        self.compactor.start()
+
+    def close(self):
+        """
+        Waits for a running compaction to finish.
+
+        Returns:
+            None
+        """
+        if self.compactor is not None:
+
+            self.compactor.join()
+
+
+class ShardStore(PickleStore):
+    """
+    This class stores AI2D-RST annotation in a directory, which contains one
+    file (shard) for each diagram and an index holding the row order, the AI2D
+    category, the completion flags and the number of comments of each diagram.
+    """
+    def __init__(self, path):
+        """
+        This function initializes the ShardStore class.
+
+        Parameters:
+            path: Path to the directory holding the shards and the index.
+
+        Returns:
+            A ShardStore object.
+        """
+        # Set paths to the directory, the shards, the index and its lock
+        self.path = path
+        self.shard_dir = os.path.join(path, 'diagrams')
+        self.index_path = os.path.join(path, 'index.pkl')
+        self.lock_path = self.index_path + '.lock'
+
+    def exists(self):
+        """
+        Checks whether the annotation has been stored already.
+
+        Returns:
+            True or False depending on whether the index exists on disk.
+        """
+        return os.path.isfile(self.index_path)
+
+    def shard_path(self, image_name):
+        """
+        Returns the path to the shard of a diagram.
+
+        Parameters:
+            image_name: The filename of the AI2D diagram image, e.g. 1132.png.
+
+        Returns:
+            A path to the shard.
+        """
+        return os.path.join(self.shard_dir, image_name + '.pkl')
+
+    def load_shard(self, image_name, lazy=False):
+        """
+        Loads the shard of a single diagram.
+
+        Parameters:
+            image_name: The filename of the AI2D diagram image, e.g. 1132.png.
+            lazy: A Boolean defining whether to leave the graphs of the Diagram
+                  object serialized.
+
+        Returns:
+            A dictionary with the annotation and the Diagram object. If lazy is
+            True, the graphs are returned separately under the key 'graphs' as
+            a dictionary of serialized graphs.
+        """
+        with open(self.shard_path(image_name), 'rb') as shard_file:
+
+            shard = pickle.load(shard_file)
+
+        # Fetch the serialized graphs
+        graphs = shard.pop('graphs', {})
+
+        # Return the graphs separately if requested
+        if lazy:
+
+            shard['graphs'] = graphs
+
+            return shard
+
+        # Otherwise deserialize the graphs and add them to the Diagram object
+        for name, graph in graphs.items():
+
+            setattr(shard['diagram'], name, load_graph(graph))
+
+        return shard
+
+    def load_diagram(self, image_name):
+        """
+        Loads the Diagram object of a single diagram.
+
+        Parameters:
+            image_name: The filename of the AI2D diagram image, e.g. 1132.png.
+
+        Returns:
+            A Diagram object or None if the diagram has not been annotated.
+        """
+        return self.load_shard(image_name)['diagram']
+
+    def load(self, image_names=None):
+        """
+        Loads the annotation from disk.
+
+        Parameters:
+            image_names: An optional list of image filenames for loading only a
+                         subset of the diagrams.
+
+        Returns:
+            A pandas DataFrame containing the annotation.
+        """
+        # Read the index
+        index = self.read_index()
+        annotation_df = index['index'].copy()
+
+        # Filter the index for the requested diagrams
+        if image_names is not None:
+
+            annotation_df = annotation_df.loc[annotation_df['image_name']
+                                              .isin(image_names)].copy()
+
+        # Read the shards for the remaining rows
+        shards = [self.load_shard(i) for i in annotation_df['image_name']]
+
+        # Add the columns stored in the shards to the DataFrame
+        for column in shard_columns:
+
+            if column in index['columns']:
+
+                annotation_df[column] = [s[column] for s in shards]
+
+        # Restore the original columns
+        return annotation_df[index['columns']]
+
+    def initialize(self, annotation_df):
+        """
+        Writes the index and a shard for each diagram to disk.
+
+        Parameters:
+            annotation_df: A pandas DataFrame containing the annotation.
+
+        Returns:
+            None
+        """
+        # Create the directory for shards
+        os.makedirs(self.shard_dir, exist_ok=True)
+
+        # Write a shard for each row
+        for ix in annotation_df.index:
+
+            self.write_shard(annotation_df, ix)
+
+        # Write the index to disk
+        self.write_index(annotation_df)
+
+    def write_shard(self, annotation_df, ix):
+        """
+        Writes the shard for the diagram on row ix to disk.
+
+        Parameters:
+            annotation_df: A pandas DataFrame containing the annotation.
+            ix: The index of the row to write.
+
+        Returns:
+            None
+        """
+        # Collect the columns stored in the shard
+        shard = {c: annotation_df.at[ix, c] for c in shard_columns
+                 if c in annotation_df.columns}
+
+        # Set up a placeholder for the serialized graphs
+        shard['graphs'] = {}
+
+        # Serialize the graphs of the Diagram object separately
+        if shard.get('diagram') is not None:
+
+            # Make a shallow copy of the Diagram object without the graphs
+            shard['diagram'] = copy.copy(shard['diagram'])
+
+            for name in graph_attributes:
+
+                shard['graphs'][name] = dump_graph(
+                    getattr(shard['diagram'], name, None))
+
+                setattr(shard['diagram'], name, None)
+
+        write_pickle(shard, self.shard_path(annotation_df.at[ix,
+                                                             'image_name']))
+
+    def save(self, annotation_df, ix):
+        """
+        Writes the shard for the diagram on row ix and updates the index.
+
+        Parameters:
+            annotation_df: A pandas DataFrame containing the annotation.
+            ix: The index of the row that has been updated.
+
+        Returns:
+            None
+        """
+        # Write the shard
+        self.write_shard(annotation_df, ix)
+
+        # Update the index
+        self.update_index(annotation_df, ix)
+
+
+def compact_journal(snapshot_path, segment_path):
+    """
+    Merges a journal segment into a snapshot and removes the segment.
+
+    Parameters:
+        snapshot_path: Path to the pickled pandas DataFrame used as a snapshot.
+        segment_path: Path to the journal segment to merge.
+
+    Returns:
+        None
+    """
+    # Read the snapshot and replay the segment on top of it
+    annotation_df = pd.read_pickle(snapshot_path)
+    replay_journal(segment_path, annotation_df)
+
+    # Write the new snapshot into a temporary file and swap it in atomically
+    temp_path = snapshot_path + '.tmp'
+    annotation_df.to_pickle(temp_path)
+    os.replace(temp_path, snapshot_path)
+
+    # Remove the segment, which is now included in the snapshot
+    os.remove(segment_path)
+
+
+def replay_journal(journal_path, annotation_df, repair=False):
+    """
+    Replays the records in a journal into a DataFrame.
+
+    Parameters:
+        journal_path: Path to the journal.
+        annotation_df: A pandas DataFrame containing the annotation.
+        repair: A Boolean defining whether to truncate the journal after the
+                last complete record, if the last record is truncated.
+
+    Returns:
+        The number of records replayed.
+    """
+    # Set up a counter for the records
+    records = 0
+
+    # Return if the journal does not exist
+    if not os.path.isfile(journal_path):
+
+        return records
+
+    # Get the size of the journal and set up a variable for the offset at
+    # which the last complete record ends
+    size = os.path.getsize(journal_path)
+    offset = 0
+
+    with open(journal_path, 'rb') as journal:
+
+        # Read records until the end of the file
+        while offset < size:
+
+            try:
+                ix, diagram = pickle.load(journal)
+
+            # A record may be truncated if the annotator was interrupted while
+            # writing to the journal. A truncated record may end at any byte,
+            # so that reading the record may raise any of these errors.
+            except (EOFError, pickle.UnpicklingError, ValueError, TypeError,
+                    AttributeError, IndexError):
+
+                print("[WARNING] Skipping a truncated record at the end of {}."
+                      .format(journal_path))
+
+                break
+
+            # Update the row with the diagram
+            annotation_df.at[ix, 'diagram'] = diagram
+
+            records += 1
+            offset = journal.tell()
+
+    # Remove the truncated record, so that records appended later follow the
+    # last complete record and can be read
+    if repair and offset < size:
+
+        with open(journal_path, 'r+b') as journal:
+
+            journal.truncate(offset)
+
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    return records
+
+
+class LazyCorpus:
+    """
+    This class iterates over AI2D-RST annotation like a pandas DataFrame, but
+    reads the status of each diagram from an index and loads the Diagram objects
+    and their graphs only when they are accessed.
+    """
+    def __init__(self, index, loader, max_resident=32):
+        """
+        This function initializes the LazyCorpus class.
+
+        Parameters:
+            index: A pandas DataFrame with one row per diagram, as returned by
+                   build_index().
+            loader: A function that takes an image filename and returns a
+                    dictionary with the annotation, the Diagram object and a
+                    dictionary of serialized graphs.
+            max_resident: The maximum number of diagrams kept in memory.
+
+        Returns:
+            A LazyCorpus object.
+        """
+        # Set up the index and the function for loading diagrams
+        self.index = index
+        self.loader = loader
+
+        # Set up a least recently used cache for loaded diagrams
+        self.max_resident = max_resident
+        self.resident = OrderedDict()
+
+    def __len__(self):
+
+        return len(self.index)
+
+    def iterrows(self):
+        """
+        Iterates over the rows of the index.
+
+        Returns:
+            Yields tuples of row index and LazyRow objects.
+        """
+        for ix, row in self.index.iterrows():
+
+            yield ix, LazyRow(self, row)
+
+    def select(self, mask):
+        """
+        Selects a subset of the diagrams.
+
+        Parameters:
+            mask: A Boolean pandas Series aligned with the index.
+
+        Returns:
+            A LazyCorpus object for the selected diagrams.
+        """
+        return LazyCorpus(self.index.loc[mask], self.loader, self.max_resident)
+
+    def load(self, image_name):
+        """
+        Loads a diagram, keeping at most max_resident diagrams in memory.
+
+        Parameters:
+            image_name: The filename of the AI2D diagram image, e.g. 1132.png.
+
+        Returns:
+            A dictionary with the annotation, the Diagram object and its graphs.
+        """
+        # Return a resident diagram and mark it as recently used
+        if image_name in self.resident:
+
+            self.resident.move_to_end(image_name)
+
+            return self.resident[image_name]
+
+        # Otherwise load the diagram
+        shard = self.loader(image_name)
+        self.resident[image_name] = shard
+
+        # Evict the least recently used diagrams
+        while len(self.resident) > self.max_resident:
+
+            self.resident.popitem(last=False)
+
+        return shard
+
+    def get_attribute(self, image_name, name):
+        """
+        Fetches an attribute of a Diagram object, deserializing graphs on demand.
+
+        Parameters:
+            image_name: The filename of the AI2D diagram image, e.g. 1132.png.
+            name: The name of the attribute.
+
+        Returns:
+            The value of the attribute.
+        """
+        # Load the diagram
+        shard = self.load(image_name)
+
+        # Check if the attribute is a graph
+        if name in shard['graphs']:
+
+            # Deserialize the graph on first access
+            if isinstance(shard['graphs'][name], bytes):
+
+                shard['graphs'][name] = load_graph(shard['graphs'][name])
+
+            return shard['graphs'][name]
+
+        return getattr(shard['diagram'], name)
+
+    def materialize(self, image_name):
+        """
+        Loads a complete Diagram object.
+
+        Parameters:
+            image_name: The filename of the AI2D diagram image, e.g. 1132.png.
+
+        Returns:
+            A Diagram object with all of its graphs.
+        """
+        # Load the diagram
+        shard = self.load(image_name)
+
+        # Unpickle all graphs
+        for name in shard['graphs']:
+
+            self.get_attribute(image_name, name)
+
+        # Make a shallow copy of the Diagram object and add the graphs
+        diagram = copy.copy(shard['diagram'])
+
+        for name, graph in shard['graphs'].items():
+
+            setattr(diagram, name, graph)
+
+        return diagram
+
+
+class LazyRow:
+    """
+    This class represents a row of a LazyCorpus.
+    """
+    def __init__(self, corpus, row):
+        """
+        This function initializes the LazyRow class.
+
+        Parameters:
+            corpus: A LazyCorpus object.
+            row: A pandas Series containing a row of the index.
+
+        Returns:
+            A LazyRow object.
+        """
+        self.corpus = corpus
+        self.row = row
+
+    def get(self, key, default=None):
+        """
+        Fetches a value from the row.
+
+        Parameters:
+            key: The name of the column.
+            default: The value to return if the column does not exist.
+
+        Returns:
+            The value of the column.
+        """
+        try:
+            return self[key]
+
+        except KeyError:
+
+            return default
+
+    def __getitem__(self, key):
+
+        # Return a proxy for the Diagram object, if the diagram has been
+        # annotated
+        if key == 'diagram':
+
+            if not self.row.get('annotated', True):
+
+                return None
+
+            return LazyDiagram(self.corpus, self.row)
+
+        # Fetch the annotation from the loaded diagram
+        if key == 'annotation':
+
+            return self.corpus.load(self.row['image_name'])['annotation']
+
+        # Otherwise return the value from the index
+        return self.row[key]
+
+
+class LazyDiagram:
+    """
+    This class stands in for a Diagram object in a LazyCorpus. Status flags are
+    read from the index, whereas other attributes are fetched from the Diagram
+    object, which is loaded on first access. The object is read-only.
+    """
+    def __init__(self, corpus, row):
+        """
+        This function initializes the LazyDiagram class.
+
+        Parameters:
+            corpus: A LazyCorpus object.
+            row: A pandas Series containing a row of the index.
+
+        Returns:
+            A LazyDiagram object.
+        """
+        self._corpus = corpus
+        self._row = row
+
+    def __getattr__(self, name):
+
+        # Private attributes are never delegated to the Diagram object
+        if name.startswith('_'):
+
+            raise AttributeError(name)
+
+        # Read status flags from the index
+        if name in status_flags:
+
+            return bool(self._row[name])
+
+        # Load other attributes from the Diagram object
+        return self._corpus.get_attribute(self._row['image_name'], name)
+
+
+def build_index(annotation_df):
+    """
+    Builds an index of AI2D-RST annotation, which holds the AI2D category and
+    the status of each diagram, but not the annotation or the Diagram object.
+
+    Parameters:
+        annotation_df: A pandas DataFrame containing the annotation.
+
+    Returns:
+        A pandas DataFrame with one row per diagram.
+    """
+    # Collect the columns that are not stored in the shards
+    columns = [c for c in annotation_df.columns if c not in shard_columns]
+
+    # Load the AI2D categories
+    categories = load_categories()
+
+    # Create the index and add the category of each diagram
+    index_df = annotation_df[columns].copy()
+    index_df['category'] = index_df['image_name'].apply(
+        lambda x: categories.get(x))
+
+    # Fetch the status of each diagram
+    diagrams = annotation_df.get('diagram', [None] * len(annotation_df))
+    statuses = [diagram_status(d) for d in diagrams]
+
+    # Add the status to the index
+    for column in status_columns:
+
+        index_df[column] = [s[column] for s in statuses]
+
+    return index_df
+
+
+def diagram_status(diagram):
+    """
+    Collects the completion flags of a Diagram object.
+
+    Parameters:
+        diagram: A Diagram object or None.
+
+    Returns:
+        A dictionary mapping the status columns to Booleans and the number of
+        comments.
+    """
+    # Get the completion flags
+    status = {flag: bool(getattr(diagram, flag, False))
+              for flag in status_flags}
+
+    # Record whether the diagram has been annotated. Diagrams imported using
+    # import_ai2d.py have a Diagram object before they are opened, so check
+    # for work done during annotation instead.
+    status['annotated'] = has_annotation(diagram)
+
+    # Count the comments
+    status['comments'] = len(getattr(diagram, 'comments', []))
+
+    return status
+
+
+def has_annotation(diagram):
+    """
+    Checks whether any annotation has been added to a Diagram object, that is,
+    whether a layer has been marked as complete, a comment has been entered,
+    connectivity or RST annotation has begun, or the layout graph contains
+    groups or macro-groups.
+
+    Parameters:
+        diagram: A Diagram object or None.
+
+    Returns:
+        True or False depending on whether the diagram has been annotated.
+    """
+    if diagram is None:
+
+        return False
+
+    # Check the completion flags and comments
+    if any(getattr(diagram, flag, False) for flag in status_flags) or \
+            getattr(diagram, 'comments', []):
+
+        return True
+
+    # Check whether connectivity or RST annotation has begun
+    if getattr(diagram, 'connectivity_graph', None) is not None or \
+            getattr(diagram, 'rst_graph', None) is not None:
+
+        return True
+
+    # Check the layout graph for groups and macro-groups
+    layout_graph = getattr(diagram, 'layout_graph', None)
+
+    if layout_graph is None:
+
+        return False
+
+    return any(d.get('kind') == 'group' or 'macro_group' in d
+               for n, d in layout_graph.nodes(data=True))
+
+
+@contextmanager
+def file_lock(lock_path, timeout=30):
+    """
+    A context manager for holding a lock file, which allows several processes
+    to update the same file.
+
+    Parameters:
+        lock_path: Path to the lock file.
+        timeout: The number of seconds to wait for the lock.
+
+    Returns:
+        None
+    """
+    # Note the time when waiting for the lock began
+    start = time.time()
+
+    # Create the lock file, which fails if another process holds the lock
+    while True:
+
+        try:
+            lock = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+
+            break
+
+        except FileExistsError:
+
+            # Raise an error if the lock has not been released in time
+            if time.time() - start > timeout:
+
+                raise TimeoutError("[ERROR] Cannot acquire {}. Remove the file "
+                                   "if no other annotator is running."
+                                   .format(lock_path))
+
+            time.sleep(0.01)
+
+    try:
+        yield
+
+    # Release the lock
+    finally:
+
+        os.close(lock)
+        os.remove(lock_path)
+
+
+def load_categories():
+    """
+    Loads the AI2D categories of the diagrams.
+
+    Returns:
+        A dictionary mapping image filenames to AI2D categories.
+    """
+    # Define the path to the categories relative to this module
+    path = os.path.join(os.path.dirname(__file__), '..', 'data',
+                        'categories.json')
+
+    with open(path) as categories:
+
+        return json.load(categories)
+
+
+def open_corpus(path, max_resident=32):
+    """
+    Opens AI2D-RST annotation for reading without loading the Diagram objects
+    up front. Loading single diagrams requires sharded annotation: a pandas
+    DataFrame is read into memory completely when the first diagram is accessed.
+    Until then, the status of each diagram is read from the index of the
+    DataFrame, if the index exists.
+
+    Parameters:
+        path: Path to the pickled pandas DataFrame or to a directory of shards.
+        max_resident: The maximum number of diagrams kept in memory.
+
+    Returns:
+        A LazyCorpus object.
+    """
+    # Read the index and load diagrams from shards on demand
+    if os.path.isdir(path):
+
+        store = ShardStore(path)
+
+        return LazyCorpus(store.load_index(),
+                          lambda x: store.load_shard(x, lazy=True),
+                          max_resident)
+
+    # If the DataFrame has an index, read the DataFrame only when a diagram is
+    # accessed for the first time.
+    store = PickleStore(path)
+
+    if os.path.isfile(store.index_path):
+
+        # Set up a placeholder for the rows of the DataFrame
+        rows = {}
+
+        def load_row(image_name):
+
+            # Read the DataFrame on first access
+            if not rows:
+
+                rows.update(map_rows(read_corpus(path)))
+
+            return rows[image_name]
+
+        # Read the index
+        index = store.load_index()
+
+        return LazyCorpus(index, load_row, max_resident=len(index))
+
+    # Otherwise read the DataFrame and serve the diagrams from memory
+    annotation_df = read_corpus(path)
+
+    # Map image filenames to rows
+    rows = map_rows(annotation_df)
+
+    return LazyCorpus(build_index(annotation_df), rows.get,
+                      max_resident=len(rows))
+
+
+def map_rows(annotation_df):
+    """
+    Maps the image filenames in a DataFrame to the annotation and the Diagram
+    object on each row, in the format used by LazyCorpus.
+
+    Parameters:
+        annotation_df: A pandas DataFrame containing the annotation.
+
+    Returns:
+        A dictionary mapping image filenames to dictionaries.
+    """
+    return {row['image_name']: {'annotation': row.get('annotation'),
+                                'diagram': row.get('diagram'),
+                                'graphs': {}}
+            for ix, row in annotation_df.iterrows()}
+
+
+def open_store(path, journal=False, sharded=False):
+    """
+    Sets up storage for AI2D-RST annotation.
+
+    Parameters:
+        path: Path to the pickled pandas DataFrame or to a directory of shards.
+        journal: A Boolean defining whether to append changes to a journal.
+        sharded: A Boolean defining whether to store one file per diagram.
+
+    Returns:
+        A PickleStore, JournalStore or ShardStore object.
+    """
+    # Use shards if requested or if the path is a directory of shards
+    if sharded or os.path.isdir(path):
+
+        return ShardStore(path)
+
+    if journal:
+
+        return JournalStore(path)
+
+    return PickleStore(path)
+
+
+def read_corpus(path, image_names=None):
+    """
+    Reads AI2D-RST annotation from disk, including any diagrams that have been
+    appended to a journal but not yet compacted into the snapshot.
+
+    Parameters:
+        path: Path to the pickled pandas DataFrame or to a directory of shards.
+        image_names: An optional list of image filenames for loading only a
+                     subset of the diagrams.
+
+    Returns:
+        A pandas DataFrame containing the annotation.
+    """
+    # Read only the requested shards from a directory of shards
+    if os.path.isdir(path):
+
+        return ShardStore(path).load(image_names)
+
+    # Otherwise read the snapshot and the journal, leaving the journal as it
+    # is, because the annotator may be writing to it
+    annotation_df = JournalStore(path).load(repair=False)
+
+    # Filter the DataFrame for the requested diagrams
+    if image_names is not None:
+
+        annotation_df = annotation_df.loc[annotation_df['image_name']
+                                          .isin(image_names)]
+
+    return annotation_df
+
+
+def write_pickle(obj, path):
+    """
+    Pickles an object into a temporary file and moves the file into place, so
+    that readers never see a partially written file.
+
+    Parameters:
+        obj: The object to pickle.
+        path: Path to the target file.
+
+    Returns:
+        None
+    """
+    # Use the process ID to keep temporary files of several processes apart
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+
+    with open(temp_path, 'wb') as temp_file:
+
+        pickle.dump(obj, temp_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    os.replace(temp_path, path)
@@ -15,6 +15,7 @@ Returns:
 """
 
 # Import packages
+from core.storage import *
 import argparse
 import pandas as pd
 
@@ -32,7 +33,7 @@ args = vars(ap.parse_args())
 ann_path = args['annotation']
 
 # Read the DataFrame
-annotation_df = pd.read_pickle(ann_path)
+annotation_df = read_corpus(ann_path)
 
 # Print out the dataframe content
 print(annotation_df)
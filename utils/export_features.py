@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+This script computes geometric features for all pairs of layout elements in
+each diagram, namely the distances between their centroids, the intersection
+over union and the containment of their bounding boxes and the direction from
+one element to another, and saves the features into a single NumPy archive.
+
+Usage:
+    python export_features.py -a annotation.pkl -o features.npz
+
+Arguments:
+    -a/--annotation: Path to the pandas DataFrame or the sharded directory
+                     containing the annotation.
+    -o/--output: Path to the NumPy archive in which the features are stored.
+    -c/--category: Optional argument for exporting only diagrams in the given
+                   AI2D category, e.g. foodChainsWebs.
+    -p/--processes: Optional argument for the number of processes to use
+                    (default: number of CPUs).
+
+Returns:
+    Saves a NumPy archive with the arrays 'keys', 'kinds', 'distance', 'iou',
+    'containment' and 'direction' for each diagram, stored under the image
+    filename, e.g. 1132.png/distance. The rows and columns of the matrices
+    follow the element identifiers in 'keys'.
+"""
+
+# Import packages
+from core.batch import *
+from core.storage import *
+from multiprocessing import Pool
+from pathlib import Path
+import argparse
+import numpy as np
+import time
+
+# Run the script only in the main process, because the worker processes may
+# import this module when they are started.
+if __name__ == '__main__':
+
+    # Set up the argument parser
+    ap = argparse.ArgumentParser()
+
+    # Define arguments
+    ap.add_argument("-a", "--annotation", required=True,
+                    help="Path to the pandas DataFrame or sharded directory "
+                         "with AI2D-RST annotation.")
+    ap.add_argument("-o", "--output", required=True,
+                    help="Path to the NumPy archive in which the features are "
+                         "stored.")
+    ap.add_argument("-c", "--category", required=False,
+                    help="Exports only diagrams in the given AI2D category.")
+    ap.add_argument("-p", "--processes", required=False, type=int,
+                    default=None,
+                    help="The number of processes used for computing the "
+                         "features.")
+
+    # Parse arguments
+    args = vars(ap.parse_args())
+
+    # Assign arguments to variables
+    ann_path = args['annotation']
+    output_path = args['output']
+
+    # Verify the input path, print error and exit if not found
+    if not Path(ann_path).exists():
+
+        exit("[ERROR] Cannot find {}. Check the input to -a!".format(ann_path))
+
+    # Select the diagrams to export, filtering by category if requested
+    image_names = None
+
+    if args['category'] is not None:
+
+        index = open_corpus(ann_path).index
+        image_names = list(index.loc[index['category'] == args['category'],
+                                     'image_name'])
+
+    # Read the annotation
+    annotation_df = read_corpus(ann_path, image_names)
+
+    jobs = list(zip(annotation_df['image_name'], annotation_df['annotation']))
+
+    # Print status message
+    print("[INFO] Computing features for {} diagrams.".format(len(jobs)))
+
+    # Start timing
+    start = time.perf_counter()
+
+    # Set up a dictionary for the arrays saved into the archive
+    arrays, exported = {}, 0
+
+    # Compute the features using a pool of processes
+    with Pool(processes=args['processes']) as pool:
+
+        for image_name, features in pool.imap(diagram_features, jobs,
+                                              chunksize=16):
+
+            # Print an error message for diagrams that failed
+            if isinstance(features, str):
+
+                print("[ERROR] Could not compute features for {}: {}".format(
+                    image_name, features))
+
+                continue
+
+            for name, array in features.items():
+
+                arrays['{}/{}'.format(image_name, name)] = array
+
+            exported += 1
+
+    # Save the features into a compressed archive
+    np.savez_compressed(output_path, **arrays)
+
+    # Print status message
+    print("[INFO] Saved features for {} diagrams into {} in {:.1f} seconds."
+          .format(exported, output_path, time.perf_counter() - start))
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""
+This script imports the original AI2D annotation from a directory of JSON files
+into a pandas DataFrame or a sharded directory, which can be given to
+annotate.py. The JSON files are parsed in parallel and a Diagram object holding
+the layout graph is created for each diagram, so that the graphs do not need to
+be built during annotation.
+
+Usage:
+    python import_ai2d.py -a ai2d/annotations/ -i ai2d/images/ -o annotation.pkl
+
+Arguments:
+    -a/--annotation: Path to the AI2D directory with the JSON annotation.
+    -i/--images: Path to the directory with the AI2D diagram images.
+    -o/--output: Path to the output file or, if -s/--sharded is given, to the
+                 output directory.
+    -s/--sharded: Optional argument for storing the annotation in a directory
+                  with one file per diagram and an index.
+    -p/--processes: Optional argument for the number of processes to use
+                    (default: number of CPUs).
+
+Returns:
+    Writes the annotation to disk and prints the throughput of the import.
+"""
+
+# Import packages
+from core.ingest import *
+from core.storage import *
+from pathlib import Path
+import argparse
+import time
+
+# Run the script only in the main process, because the worker processes may
+# import this module when they are started.
+if __name__ == '__main__':
+
+    # Set up the argument parser
+    ap = argparse.ArgumentParser()
+
+    # Define arguments
+    ap.add_argument("-a", "--annotation", required=True,
+                    help="Path to the directory with AI2D JSON annotation.")
+    ap.add_argument("-i", "--images", required=True,
+                    help="Path to the directory with AI2D images.")
+    ap.add_argument("-o", "--output", required=True,
+                    help="Path to the file or directory in which the annotation "
+                         "is stored.")
+    ap.add_argument("-s", "--sharded", required=False, action='store_true',
+                    help="Stores the annotation in a directory with one file "
+                         "per diagram.")
+    ap.add_argument("-p", "--processes", required=False, type=int,
+                    default=None,
+                    help="The number of processes used for the import.")
+
+    # Parse arguments
+    args = vars(ap.parse_args())
+
+    # Assign arguments to variables
+    ann_path = args['annotation']
+    images_path = args['images']
+    output_path = args['output']
+
+    # Verify the input paths, print error and exit if not found
+    if not Path(ann_path).is_dir():
+
+        exit("[ERROR] Cannot find {}. Check the input to -a!".format(ann_path))
+
+    if not Path(images_path).is_dir():
+
+        exit("[ERROR] Cannot find {}. Check the input to -i!".format(
+            images_path))
+
+    # Verify that the output does not exist yet
+    if Path(output_path).exists():
+
+        exit("[ERROR] {} exists already. Check the input to -o!".format(
+            output_path))
+
+    # Parse the JSON files and build the layout graphs
+    annotation_df, parse_time = import_corpus(ann_path, images_path,
+                                              processes=args['processes'])
+
+    # Exit if no annotation was found
+    if len(annotation_df) == 0:
+
+        exit("[ERROR] No JSON files found in {}. Check the input to -a!".format(
+            ann_path))
+
+    # Print status message
+    print("[INFO] Parsed {} diagrams in {:.2f} seconds ({:.1f} diagrams per "
+          "second).".format(len(annotation_df), parse_time,
+                            len(annotation_df) / parse_time))
+
+    # Set up storage for the output and write the annotation in one pass
+    store = open_store(output_path, sharded=args['sharded'])
+
+    start = time.perf_counter()
+
+    store.initialize(annotation_df)
+
+    write_time = time.perf_counter() - start
+
+    # Print status message
+    print("[INFO] Wrote {} diagrams to {} in {:.2f} seconds.".format(
+        len(annotation_df), output_path, write_time))
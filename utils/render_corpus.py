@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+"""
+This script renders a composite image of the layout segmentation and the
+grouping, connectivity and RST graphs for each diagram in AI2D-RST annotation,
+without a display. The diagrams are rendered in parallel and diagrams with an
+existing output file are skipped, so an interrupted run can be resumed by
+running the script again.
+
+Usage:
+    python render_corpus.py -a annotation.pkl -o renders/
+
+Arguments:
+    -a/--annotation: Path to the pandas DataFrame or the sharded directory
+                     containing the annotation.
+    -o/--output: Path to the directory in which the images are stored.
+    -i/--images: Optional argument for the directory containing the original
+                 AI2D images, if the images have moved since annotation.
+    -c/--category: Optional argument for rendering only diagrams in the given
+                   AI2D category, e.g. foodChainsWebs.
+    -f/--format: Optional argument for the image format, either png (default)
+                 or webp.
+    -d/--dpi: Optional argument for the resolution of the images (default 100).
+    -p/--processes: Optional argument for the number of processes to use
+                    (default: number of CPUs).
+
+Returns:
+    Writes an image for each annotated diagram into the output directory and
+    prints the number of diagrams rendered per second.
+"""
+
+# Use a backend that does not require a display
+import matplotlib
+matplotlib.use('Agg')
+
+# Import packages
+from core.batch import *
+from core.storage import *
+from multiprocessing import Pool
+from pathlib import Path
+import argparse
+import os
+import time
+
+# Run the script only in the main process, because the worker processes may
+# import this module when they are started.
+if __name__ == '__main__':
+
+    # Set up the argument parser
+    ap = argparse.ArgumentParser()
+
+    # Define arguments
+    ap.add_argument("-a", "--annotation", required=True,
+                    help="Path to the pandas DataFrame or sharded directory "
+                         "with AI2D-RST annotation.")
+    ap.add_argument("-o", "--output", required=True,
+                    help="Path to the directory in which the images are "
+                         "stored.")
+    ap.add_argument("-i", "--images", required=False,
+                    help="Path to the directory with AI2D images.")
+    ap.add_argument("-c", "--category", required=False,
+                    help="Renders only diagrams in the given AI2D category.")
+    ap.add_argument("-f", "--format", required=False, default='png',
+                    choices=['png', 'webp'],
+                    help="The format of the images.")
+    ap.add_argument("-d", "--dpi", required=False, type=int, default=100,
+                    help="The resolution of the images.")
+    ap.add_argument("-p", "--processes", required=False, type=int,
+                    default=None,
+                    help="The number of processes used for rendering.")
+
+    # Parse arguments
+    args = vars(ap.parse_args())
+
+    # Assign arguments to variables
+    ann_path = args['annotation']
+    output_path = args['output']
+    images_path = args['images']
+    fmt = args['format']
+
+    # Verify the input paths, print error and exit if not found
+    if not Path(ann_path).exists():
+
+        exit("[ERROR] Cannot find {}. Check the input to -a!".format(ann_path))
+
+    if images_path is not None and not Path(images_path).is_dir():
+
+        exit("[ERROR] Cannot find {}. Check the input to -i!".format(
+            images_path))
+
+    # Create the output directory if needed
+    os.makedirs(output_path, exist_ok=True)
+
+    # Read the index of the annotation
+    index = open_corpus(ann_path).index
+
+    # Select the diagrams that have been annotated
+    index = index.loc[index['annotated']]
+
+    # Filter the diagrams by category if requested
+    if args['category'] is not None:
+
+        index = index.loc[index['category'] == args['category']]
+
+    # Skip diagrams that have been rendered already
+    image_names = [x for x in index['image_name']
+                   if not os.path.exists(output_file(output_path, x, fmt))]
+
+    # Print status message
+    print("[INFO] Rendering {} diagrams ({} rendered already).".format(
+        len(image_names), len(index) - len(image_names)))
+
+    # Start timing
+    start = time.perf_counter()
+    rendered, failed = 0, 0
+
+    # Let each worker load the diagrams it renders from sharded annotation.
+    # A pandas DataFrame is read only once, here, and each worker receives
+    # the Diagram objects it renders, so that the workers do not each hold a
+    # copy of the entire DataFrame.
+    if os.path.isdir(ann_path):
+
+        worker_path = ann_path
+        jobs = [(x, None) for x in image_names]
+
+    else:
+        worker_path = None
+        annotation_df = read_corpus(ann_path, image_names)
+        jobs = zip(annotation_df['image_name'], annotation_df['diagram'])
+
+    # Render the diagrams using a pool of processes
+    with Pool(processes=args['processes'], initializer=init_worker,
+              initargs=(worker_path, images_path, output_path, fmt,
+                        args['dpi'])) as pool:
+
+        for image_name, error in pool.imap_unordered(render_diagram, jobs,
+                                                     chunksize=4):
+
+            # Print an error message for diagrams that failed
+            if error is not None:
+
+                print("[ERROR] Could not render {}: {}".format(image_name,
+                                                               error))
+
+                failed += 1
+
+                continue
+
+            rendered += 1
+
+            # Print progress regularly
+            if rendered % 100 == 0:
+
+                print("[INFO] Rendered {}/{} diagrams ({:.1f} per second)."
+                      .format(rendered, len(image_names),
+                              rendered / (time.perf_counter() - start)))
+
+    # Print status message
+    elapsed = time.perf_counter() - start
+
+    print("[INFO] Rendered {} diagrams in {:.1f} seconds ({:.1f} per second); "
+          "{} failed.".format(rendered, elapsed,
+                              rendered / elapsed if elapsed > 0 else 0,
+                              failed))
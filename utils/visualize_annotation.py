@@ -10,15 +10,21 @@ Arguments:
     -a/--annotation: Path to the pandas DataFrame containing annotation.
     -i/--images: Path to the directory containing the original AI2D images.
     -s/--similar_to: An AI2D diagram ID (integer).
+    -b/--buffer: Optional argument for the number of diagrams drawn in advance
+                 before and after the current diagram (default 3).
 
 Returns:
     Visualises the annotation for all layers and prints rhetorical relations,
-    macro-groups and comments to standard output.
+    macro-groups and comments to standard output. Use 'p' to move to the
+    previous diagram, 'j' to jump to a diagram, 'q' to exit and any other key
+    to move to the next diagram.
 """
 
 # Import packages
 from core.draw import *
 from core.parse import *
+from core.prefetch import *
+from core.storage import *
 from pathlib import Path
 import argparse
 import cv2
@@ -42,6 +48,9 @@ ap.add_argument("-s", "--similar_to", required=False, type=int,
                 help="An AI2D diagram identifier as an integer (e.g. 1132). "
                      "Limits the visualisation to examples similar to this "
                      "diagram.")
+ap.add_argument("-b", "--buffer", required=False, type=int, default=3,
+                help="The number of diagrams drawn in advance in each "
+                     "direction.")
 
 # Parse arguments
 args = vars(ap.parse_args())
@@ -66,8 +75,8 @@ if not Path(images_path).exists():
 
     exit("[ERROR] Cannot find {}. Check the input to -i!".format(images_path))
 
-# Open the input file
-df = pd.read_pickle(ann_path)
+# Open the input file, loading each Diagram object only when needed
+df = open_corpus(ann_path)
 
 # Check if the user has requested limiting the results
 if args['similar_to']:
@@ -94,11 +103,9 @@ if args['similar_to']:
                 exit("[ERROR] {} is not a valid identifier.".format(
                     requested_id))
 
-            # Fetch the categories for diagrams in the DataFrame
-            df['category'] = df['image_name'].apply(lambda x: categories[x])
-
-            # Filter the DataFrame for requested diagram types
-            df = df.loc[df['category'] == requested_cat]
+            # Filter the diagrams for requested diagram types using the
+            # categories stored in the index
+            df = df.select(df.index['category'] == requested_cat)
 
             # If there are no results to display, exit with an error message
             if len(df) == 0:
@@ -106,58 +113,46 @@ if args['similar_to']:
                 exit("[ERROR] No examples of category '{}' found.".format(
                     requested_cat))
 
-# Begin looping over the rows of the input DataFrame. Enumerate the result to
-# show annotation progress to the user.
-for i, (ix, row) in enumerate(df.iterrows(), start=1):
-
-    # Fetch the filename of current diagram image
-    image_fname = row['image_name']
-
-    # Join with path to image directory with current filename
-    image_path = os.path.join(images_path, row['image_name'])
-
-    # Print status message
-    print("[INFO] Now processing row {}/{} ({}) ...".format(i,
-                                                            len(df),
-                                                            image_fname))
-
-    # Assign diagram to variable
-    diagram = row['diagram']
+# Collect the diagrams that have been annotated
+image_names = [row['image_name'] for ix, row in df.iterrows()
+               if row.get('annotated', True)]
 
-    # Check if a Diagram object exists
-    if diagram is not None:
+# Exit if there are no diagrams to display
+if len(image_names) == 0:
 
-        # Visualize the layout segmentation
-        segmentation = draw_layout(diagram.image_filename,
-                                   diagram.annotation,
-                                   height=720,
-                                   dpi=80)
+    exit("[ERROR] No annotated diagrams found in {}.".format(ann_path))
 
-        # Visualize grouping annotation
-        grouping = draw_graph(diagram.layout_graph, dpi=80, mode='layout')
+# Set up a prefetcher, which draws the diagrams before and after the current
+# diagram in the background
+viewer = RingPrefetcher(lambda x: render_view(df, image_names[x]),
+                        len(image_names), ahead=args['buffer'],
+                        behind=args['buffer'])
 
-        # Visualize connectivity annotation
-        connectivity = draw_graph(diagram.connectivity_graph, dpi=80,
-                                  mode='connectivity')
+# Set up a variable for the position of the current diagram
+i = 0
 
-        # Visualize RST annotation
-        rst = draw_graph(diagram.rst_graph, dpi=80, mode='rst')
+# Begin looping over the diagrams
+while True:
 
-        # Stack segmentation and grouping annotation side by side
-        seg_group = np.hstack([segmentation, grouping])
+    # Fetch the filename of current diagram image
+    image_fname = image_names[i]
 
-        # Stack connectivity and RST annotation side by side
-        rst_group = np.hstack([connectivity, rst])
+    # Print status message
+    print("[INFO] Now showing diagram {}/{} ({}) ...".format(i + 1,
+                                                             len(image_names),
+                                                             image_fname))
 
-        # Stack the visualizations on top of each other
-        whole_viz = np.vstack([seg_group, rst_group])
+    # Fetch the Diagram object and the visualization, which are drawn in the
+    # background
+    diagram, whole_viz = viewer.get(i)
 
-        # Generate a dictionary of RST relations present in the graph
-        relation_ix = get_node_dict(diagram.rst_graph, kind='relation')
+    # Check if RST annotation exists
+    if diagram.rst_graph is not None:
 
-        # Loop through current RST relations and rename for convenience.
-        relation_ix = {"R{}".format(i): k for i, (k, v) in
-                       enumerate(relation_ix.items(), start=1)}
+        # Fetch the aliases of RST relations present in the graph, which are
+        # also shown in the visualization
+        relation_ix = {a.upper(): k for a, k in
+                       replace_aliases(diagram.rst_graph, 'relation').items()}
 
         # If more than one RST relation has been defined, print relations
         if len(relation_ix) > 0:
@@ -174,51 +169,90 @@ for i, (ix, row) in enumerate(df.iterrows(), start=1):
             # Print closing line
             print("---")
 
-        # Get current macro-groups from the layout graph
-        macro_groups = dict(nx.get_node_attributes(diagram.layout_graph,
-                                                   'macro_group'))
+    # Get current macro-groups from the layout graph
+    macro_groups = dict(nx.get_node_attributes(diagram.layout_graph,
+                                               'macro_group'))
 
-        # If more than one macro-group has been defined, print groups
-        if len(macro_groups) > 0:
+    # If more than one macro-group has been defined, print groups
+    if len(macro_groups) > 0:
 
-            # Print header for current macro-groups
-            print("\nCurrent macro-groups \n---")
+        # Print header for current macro-groups
+        print("\nCurrent macro-groups \n---")
 
-            # Print the currently defined macro-groups
-            for k, v in macro_groups.items():
-                print("{}: {}".format(k, v))
+        # Print the currently defined macro-groups
+        for k, v in macro_groups.items():
+            print("{}: {}".format(k, v))
 
-            # Print closing line
-            print("---\n")
+        # Print closing line
+        print("---\n")
+
+    # If comments have been provided, print them out
+    if len(diagram.comments) > 0:
+
+        # Print header for comments
+        print("\nCurrent comments \n---")
+
+        # Print each comment and a linebreak
+        [print('#' + str(ic), comment) for ic, comment in enumerate(
+            diagram.comments, start=1)]
+
+        # Print final linebreak
+        print("---\n")
+
+    # Print instructions
+    print("Press 'p' for the previous diagram, 'j' to jump to a diagram, 'q' "
+          "to exit or any other key to continue.\n")
+
+    # Show the visualization in the same window for all diagrams
+    cv2.imshow("AI2D-RST", whole_viz)
+    cv2.setWindowTitle("AI2D-RST", "{} / {}".format(ann_path, image_fname))
+
+    # Wait for a key press
+    key = cv2.waitKey(0) & 0xFF
+
+    # Quit if q is pressed
+    if key == ord('q'):
+
+        break
+
+    # Move to the previous diagram if p is pressed
+    if key == ord('p'):
+
+        i = max(i - 1, 0)
+
+        continue
+
+    # Jump to a diagram if j is pressed
+    if key == ord('j'):
+
+        # Prompt the user for a position or an AI2D diagram identifier
+        target = input("Enter a position (e.g. 10) or a diagram identifier "
+                       "(e.g. 1132.png): ").strip()
 
-        # If comments have been provided, print them out
-        if len(diagram.comments) > 0:
+        # Look up the diagram identifier
+        if target in image_names:
 
-            # Print header for comments
-            print("\nCurrent comments \n---")
+            i = image_names.index(target)
 
-            # Print each comment and a linebreak
-            [print('#' + str(ic), comment) for ic, comment in enumerate(
-                diagram.comments, start=1)]
+        # Otherwise use the position
+        elif target.isdigit() and 1 <= int(target) <= len(image_names):
 
-            # Print final linebreak
-            print("---\n")
+            i = int(target) - 1
 
-        # Print instructions
-        print("Print any key to continue or 'q' to exit.\n")
+        else:
+            print("[ERROR] Cannot find {}.".format(target))
 
-        # Show the visualization and print RST relations
-        cv2.imshow("{} / {}".format(ann_path, image_fname), whole_viz)
+        continue
 
-        # Wait, quit if q is pressed
-        if cv2.waitKey(0) == ord('q'):
+    # Otherwise move to the next diagram, stopping after the last diagram
+    if i == len(image_names) - 1:
 
-            exit()
+        break
 
-        # Destroy window
-        cv2.destroyAllWindows()
+    i += 1
 
-        # Close any open plots
-        plt.close()
+# Stop drawing in the background and destroy the window
+viewer.close()
+cv2.destroyAllWindows()
 
 print("[INFO] Done!")